@@ -1,23 +1,45 @@
-from typing import Any, List, Optional
-
-from fastapi import APIRouter, Depends, Query
+import asyncio
+from datetime import datetime, timedelta
+from typing import Any, List, Optional, Tuple, Union
+
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, Query, Response, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from sqlmodel import Session
 from starlette import status
 
+from backup import backup_manager
+from changelog import current_cursor
 from database import engine
-from exceptions import NotAuthenticated
-from model import Comment, Post, User
+from exceptions import AdminAuthorizationFailedException, NotAuthenticated
+from feed import FEED_SIZE, FeedItem
+from loader import AuthorLoader, author_loader
+from loopmonitor import loop_monitor
+from model import ActivityRollup, Comment, Granularity, Post, Role, User, UserStats
+from querylog import query_log
 from service import (
+    MAX_TREE_DEPTH,
+    AuthorActivity,
+    AuthorRead,
     CommentCreate,
     CommentRead,
+    CommentTreeRead,
     CommentUpdate,
+    PostBatchRead,
     PostCreate,
     PostRead,
     PostUpdate,
+    TrendingPost,
+    UserBatchRead,
     UserCreate,
     UserRead,
     UserUpdate,
+    attach_authors,
+    count_comments,
+    count_posts,
+    count_users,
     create_comment,
     create_post,
     create_user,
@@ -27,27 +49,97 @@ from service import (
     get_current_user,
     login,
     logout,
+    parse_fields,
+    parse_ids,
+    read_activity,
+    read_comment_changes,
+    read_comment_subtree,
+    read_comment_tree,
     read_post,
+    read_post_changes,
     read_post_comments,
     read_posts,
+    read_posts_batch,
+    read_recent_feed,
+    read_top_authors,
+    read_trending_posts,
     read_user,
     read_user_comments,
     read_user_posts,
+    read_user_stats,
     read_users,
+    read_users_batch,
+    repair_user_stats,
+    search_users,
     update_comment,
     update_post,
     update_user,
 )
+from startup import startup_report
+from stream import comment_hub
+from trending import TRENDING_SIZE
 
 router = APIRouter()
 security = HTTPBasic()
 
 
 def get_session():
-    with Session(engine) as session:
+    # 커밋 후에도 값을 만료시키지 않아, 응답을 만들 때 다시 SELECT하지 않는다.
+    with Session(engine, expire_on_commit=False) as session:
         yield session
 
 
+async def get_author_loader(
+    with_author: bool = False, session: Session = Depends(get_session)
+) -> Optional[AuthorLoader]:
+    if not with_author:
+        return None
+    loader = AuthorLoader(session)
+    author_loader.set(loader)
+    return loader
+
+
+def projected(rows: Any) -> JSONResponse:
+    return JSONResponse(jsonable_encoder(rows))
+
+
+def paginated(
+    items: Any,
+    response: Response,
+    raw: bool = False,
+    total: Optional[Tuple[int, bool]] = None,
+    cursor: Optional[int] = None,
+) -> Any:
+    result = projected(items) if raw else items
+    target = result if isinstance(result, Response) else response
+    if total is not None:
+        count, approximate = total
+        target.headers["X-Total-Count"] = str(count)
+        target.headers["X-Total-Approximate"] = "true" if approximate else "false"
+    if cursor is not None:
+        # 이 커서를 since로 넘기면 목록을 읽은 뒤의 변경만 받을 수 있다.
+        target.headers["X-Sync-Cursor"] = str(cursor)
+    return result
+
+
+def get_if_match(if_match: Optional[str] = Header(default=None)) -> Optional[int]:
+    """
+    If-Match 헤더의 ETag("<version>")를 버전으로 바꾼다. 헤더가 없거나 *이면 버전을 확인하지 않는다.
+    해석할 수 없는 값은 어떤 버전과도 맞지 않도록 0으로 둔다.
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    try:
+        return int(if_match.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        return 0
+
+
+def tagged(response: Response, item: Any) -> Any:
+    response.headers["ETag"] = f'"{item.version}"'
+    return item
+
+
 def get_current_session(
     credentials: HTTPBasicCredentials = Depends(security), session: Session = Depends(get_session)
 ) -> Optional[Any]:
@@ -59,6 +151,15 @@ def get_current_session(
     return user_session
 
 
+def get_current_admin(
+    credentials: HTTPBasicCredentials = Depends(security), session: Session = Depends(get_session)
+) -> User:
+    user, _ = get_current_user(credentials.username, session)
+    if user.role != Role.ADMIN:
+        raise AdminAuthorizationFailedException
+    return user
+
+
 @router.post("/users/login")
 async def login_route(
     credentials: HTTPBasicCredentials = Depends(security), session: Session = Depends(get_session)
@@ -80,14 +181,38 @@ async def create_user_route(user: UserCreate, session: Session = Depends(get_ses
 
 @router.get("/users/", status_code=status.HTTP_200_OK)
 async def read_users_route(
-    offset: int = 0, limit: int = Query(default=10), session: Session = Depends(get_session)
+    response: Response,
+    offset: int = 0,
+    limit: int = Query(default=10),
+    with_total: bool = False,
+    session: Session = Depends(get_session),
 ) -> List[User]:
-    return await read_users(offset, limit, session)
+    users = await read_users(offset, limit, session)
+    total = await count_users(session) if with_total else None
+    return paginated(users, response, total=total)
+
+
+@router.get("/users/batch", status_code=status.HTTP_200_OK)
+async def read_users_batch_route(
+    ids: str = Query(example="user123,user456"), session: Session = Depends(get_session)
+) -> UserBatchRead:
+    return await read_users_batch(parse_ids(ids, str), session)
+
+
+@router.get("/users/search", status_code=status.HTTP_200_OK)
+async def search_users_route(
+    prefix: str = Query(min_length=1, max_length=20),
+    limit: int = Query(default=10, ge=1, le=50),
+    session: Session = Depends(get_session),
+) -> List[AuthorRead]:
+    return await search_users(prefix, limit, session)
 
 
 @router.get("/users/{user_id}", status_code=status.HTTP_200_OK, response_model=UserRead)
-async def read_user_route(user_id: str, session: Session = Depends(get_session)) -> User:
-    return await read_user(user_id, session)
+async def read_user_route(
+    user_id: str, response: Response, session: Session = Depends(get_session)
+) -> User:
+    return tagged(response, await read_user(user_id, session))
 
 
 @router.get(
@@ -95,12 +220,21 @@ async def read_user_route(user_id: str, session: Session = Depends(get_session))
 )
 async def read_user_posts_route(
     user_id: str,
+    response: Response,
     page: int = 0,
     limit: int = Query(default=5),
+    fields: Optional[str] = None,
+    with_total: bool = False,
     session: Session = Depends(get_session),
-) -> List[Post]:
+    authors: Optional[AuthorLoader] = Depends(get_author_loader),
+) -> Union[List[Post], JSONResponse]:
     offset = page * limit
-    return await read_user_posts(user_id, offset, limit, session)
+    columns = parse_fields(fields, Post, required=["author_id"] if authors else [])
+    posts = await read_user_posts(user_id, offset, limit, session, columns)
+    if authors:
+        posts = await attach_authors(posts, session)
+    total = await count_posts(session, user_id=user_id) if with_total else None
+    return paginated(posts, response, bool(columns) or authors is not None, total)
 
 
 @router.get(
@@ -108,26 +242,49 @@ async def read_user_posts_route(
 )
 async def read_user_comments_route(
     user_id: str,
+    response: Response,
     page: int = 0,
     limit: int = Query(default=5),
+    fields: Optional[str] = None,
+    with_total: bool = False,
     session: Session = Depends(get_session),
-) -> list[Comment]:
+    authors: Optional[AuthorLoader] = Depends(get_author_loader),
+) -> Union[List[Comment], JSONResponse]:
     offset = page * limit
-    return await read_user_comments(user_id, offset, limit, session)
+    columns = parse_fields(fields, Comment, required=["author_id"] if authors else [])
+    comments = await read_user_comments(user_id, offset, limit, session, columns)
+    if authors:
+        comments = await attach_authors(comments, session)
+    total = await count_comments(session, user_id=user_id) if with_total else None
+    return paginated(comments, response, bool(columns) or authors is not None, total)
+
+
+@router.get("/users/{user_id}/stats", status_code=status.HTTP_200_OK)
+async def read_user_stats_route(
+    user_id: str, session: Session = Depends(get_session)
+) -> UserStats:
+    return await read_user_stats(user_id, session)
 
 
 @router.put("/users/{user_id}", status_code=status.HTTP_200_OK)
 async def update_user_route(
-    user_id: str, user: UserUpdate, session: Session = Depends(get_session)
+    user_id: str,
+    user: UserUpdate,
+    response: Response,
+    version: Optional[int] = Depends(get_if_match),
+    session: Session = Depends(get_session),
 ) -> User:
-    return await update_user(user_id, user, session)
+    return tagged(response, await update_user(user_id, user, session, version))
 
 
 @router.delete("/users/{user_id}", status_code=status.HTTP_200_OK)
 async def delete_user_route(
-    user_id: str, password: str, session: Session = Depends(get_session)
+    user_id: str,
+    password: str,
+    version: Optional[int] = Depends(get_if_match),
+    session: Session = Depends(get_session),
 ) -> dict[str, bool]:
-    return await delete_user(user_id, password, session)
+    return await delete_user(user_id, password, session, version)
 
 
 @router.post("/posts/", status_code=status.HTTP_201_CREATED)
@@ -135,30 +292,70 @@ async def create_post_route(post: PostCreate, session: Session = Depends(get_ses
     return await create_post(post, session)
 
 
-@router.get("/posts/", status_code=status.HTTP_200_OK)
+@router.get("/posts/", status_code=status.HTTP_200_OK, response_model=List[Post])
 async def read_posts_route(
-    offset: int = 0, limit: int = Query(default=100), session: Session = Depends(get_session)
-) -> List[Post]:
-    return await read_posts(offset, limit, session)
+    response: Response,
+    offset: int = 0,
+    limit: int = Query(default=100),
+    fields: Optional[str] = None,
+    with_total: bool = False,
+    since: Optional[int] = Query(default=None, ge=0),
+    session: Session = Depends(get_session),
+    authors: Optional[AuthorLoader] = Depends(get_author_loader),
+) -> Union[List[Post], JSONResponse]:
+    if since is not None:
+        changes = await read_post_changes(since, limit, session)
+        return JSONResponse(jsonable_encoder(changes))
+    # 목록보다 먼저 읽어야 목록을 읽는 사이의 변경도 다음 동기화에 포함된다.
+    cursor = current_cursor(session)
+    columns = parse_fields(fields, Post, required=["author_id"] if authors else [])
+    posts = await read_posts(offset, limit, session, columns)
+    if authors:
+        posts = await attach_authors(posts, session)
+    total = await count_posts(session) if with_total else None
+    return paginated(posts, response, bool(columns) or authors is not None, total, cursor)
+
+
+@router.get("/posts/trending", status_code=status.HTTP_200_OK)
+async def read_trending_posts_route(
+    limit: int = Query(default=20, ge=1, le=TRENDING_SIZE)
+) -> List[TrendingPost]:
+    return await read_trending_posts(limit)
+
+
+@router.get("/posts/batch", status_code=status.HTTP_200_OK)
+async def read_posts_batch_route(
+    ids: str = Query(example="1,2,3"), session: Session = Depends(get_session)
+) -> PostBatchRead:
+    return await read_posts_batch(parse_ids(ids, int), session)
 
 
 @router.get("/posts/{post_id}", status_code=status.HTTP_200_OK)
-async def read_post_route(post_id: int, session: Session = Depends(get_session)) -> Post:
-    return await read_post(post_id, session)
+async def read_post_route(
+    post_id: int, response: Response, session: Session = Depends(get_session)
+) -> Post:
+    return tagged(response, await read_post(post_id, session))
 
 
 @router.put("/posts/{post_id}", status_code=status.HTTP_200_OK)
 async def update_post_route(
-    post_id: int, post: PostUpdate, session: Session = Depends(get_session)
+    post_id: int,
+    post: PostUpdate,
+    response: Response,
+    version: Optional[int] = Depends(get_if_match),
+    session: Session = Depends(get_session),
 ) -> Post:
-    return await update_post(post_id, post, session)
+    return tagged(response, await update_post(post_id, post, session, version))
 
 
 @router.delete("/posts/{post_id}", status_code=status.HTTP_200_OK)
 async def delete_post_route(
-    post_id: int, author: str, session: Session = Depends(get_session)
+    post_id: int,
+    author: str,
+    version: Optional[int] = Depends(get_if_match),
+    session: Session = Depends(get_session),
 ) -> dict[str, bool]:
-    return await delete_post(post_id, author, session)
+    return await delete_post(post_id, author, session, version)
 
 
 @router.post("/posts/{post_id}/comments/", status_code=status.HTTP_201_CREATED)
@@ -173,23 +370,202 @@ async def create_comment_route(
 )
 async def read_post_comments_route(
     post_id: int,
+    response: Response,
     page: int = 0,
     limit: int = Query(default=5),
+    fields: Optional[str] = None,
+    with_total: bool = False,
+    since: Optional[int] = Query(default=None, ge=0),
     session: Session = Depends(get_session),
-) -> List[Comment]:
+    authors: Optional[AuthorLoader] = Depends(get_author_loader),
+) -> Union[List[Comment], JSONResponse]:
+    if since is not None:
+        changes = await read_comment_changes(post_id, since, limit, session)
+        return JSONResponse(jsonable_encoder(changes))
+    cursor = current_cursor(session)
     offset = page * limit
-    return await read_post_comments(post_id, offset, limit, session)
+    columns = parse_fields(fields, Comment, required=["author_id"] if authors else [])
+    comments = await read_post_comments(post_id, offset, limit, session, columns)
+    if authors:
+        comments = await attach_authors(comments, session)
+    total = await count_comments(session, post_id=post_id) if with_total else None
+    return paginated(comments, response, bool(columns) or authors is not None, total, cursor)
+
+
+@router.get("/posts/{post_id}/comments/tree", status_code=status.HTTP_200_OK)
+async def read_comment_tree_route(
+    post_id: int,
+    after: Optional[int] = None,
+    limit: int = Query(default=20, ge=1, le=100),
+    max_depth: int = Query(default=3, ge=1, le=MAX_TREE_DEPTH),
+    session: Session = Depends(get_session),
+) -> CommentTreeRead:
+    return await read_comment_tree(post_id, after, limit, max_depth, session)
+
+
+@router.get("/comments/{comment_id}/subtree", status_code=status.HTTP_200_OK)
+async def read_comment_subtree_route(
+    comment_id: int,
+    after: Optional[int] = None,
+    limit: int = Query(default=20, ge=1, le=100),
+    max_depth: int = Query(default=3, ge=1, le=MAX_TREE_DEPTH),
+    session: Session = Depends(get_session),
+) -> CommentTreeRead:
+    return await read_comment_subtree(comment_id, after, limit, max_depth, session)
+
+
+@router.get("/posts/{post_id}/comments/stream", status_code=status.HTTP_200_OK)
+async def stream_post_comments_route(
+    post_id: int, last_event_id: Optional[int] = Header(default=None)
+) -> StreamingResponse:
+    subscriber = comment_hub.subscribe(post_id, last_event_id)
+
+    async def event_stream():
+        async for event in comment_hub.events(subscriber):
+            yield event.sse() if event else ": keepalive\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/posts/{post_id}/comments/ws")
+async def stream_post_comments_websocket(
+    websocket: WebSocket, post_id: int, last_event_id: Optional[int] = None
+):
+    await websocket.accept()
+    subscriber = comment_hub.subscribe(post_id, last_event_id)
+
+    async def forward_events():
+        async for event in comment_hub.events(subscriber):
+            await websocket.send_text(event.json() if event else '{"event": "keepalive"}')
+
+    async def wait_disconnect():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = {asyncio.create_task(forward_events()), asyncio.create_task(wait_disconnect())}
+    _, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    comment_hub.unsubscribe(subscriber)
+    if subscriber.evicted:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
 
 
 @router.put("/posts/{post_id}/comments/{comment_id}", status_code=status.HTTP_200_OK)
 async def update_comment_route(
-    post_id: int, comment_id: int, comment: CommentUpdate, session: Session = Depends(get_session)
+    post_id: int,
+    comment_id: int,
+    comment: CommentUpdate,
+    response: Response,
+    version: Optional[int] = Depends(get_if_match),
+    session: Session = Depends(get_session),
 ) -> Comment:
-    return await update_comment(post_id, comment_id, comment, session)
+    return tagged(response, await update_comment(post_id, comment_id, comment, session, version))
 
 
 @router.delete("/posts/{post_id}/comments/{comment_id}", status_code=status.HTTP_200_OK)
 async def delete_comment_route(
-    comment_id: int, author: str, session: Session = Depends(get_session)
+    comment_id: int,
+    author: str,
+    version: Optional[int] = Depends(get_if_match),
+    session: Session = Depends(get_session),
 ) -> dict[str, bool]:
-    return await delete_comment(comment_id, author, session)
+    return await delete_comment(comment_id, author, session, version)
+
+
+@router.get("/feed/recent", status_code=status.HTTP_200_OK)
+async def read_recent_feed_route(
+    limit: int = Query(default=20, ge=1, le=FEED_SIZE)
+) -> List[FeedItem]:
+    return await read_recent_feed(limit)
+
+
+@router.get("/health/ready", status_code=status.HTTP_200_OK)
+async def readiness_route(response: Response) -> dict[str, object]:
+    if not startup_report.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return startup_report.as_dict()
+
+
+@router.get("/admin/queries", status_code=status.HTTP_200_OK)
+async def read_query_report_route(
+    limit: int = Query(default=20, ge=1, le=100), admin: User = Depends(get_current_admin)
+) -> dict[str, object]:
+    return {
+        "threshold_ms": query_log.threshold * 1000,
+        "top": query_log.report(limit),
+        "slow": list(query_log.recent_slow),
+    }
+
+
+@router.get("/admin/event-loop", status_code=status.HTTP_200_OK)
+async def read_event_loop_report_route(admin: User = Depends(get_current_admin)) -> dict[str, Any]:
+    return loop_monitor.report()
+
+
+def default_range(
+    start: Optional[datetime], end: Optional[datetime], length: timedelta
+) -> Tuple[datetime, datetime]:
+    end = end or datetime.utcnow()
+    return start or end - length, end
+
+
+@router.get(
+    "/admin/analytics/activity",
+    status_code=status.HTTP_200_OK,
+    response_model=List[ActivityRollup],
+)
+async def read_activity_route(
+    granularity: Granularity = Granularity.DAY,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    admin: User = Depends(get_current_admin),
+    session: Session = Depends(get_session),
+):
+    # 기본 기간: 일 단위는 최근 30일, 시간 단위는 최근 48시간
+    length = timedelta(days=30) if granularity == Granularity.DAY else timedelta(hours=48)
+    start, end = default_range(start, end, length)
+    return await read_activity(granularity, start, end, session)
+
+
+@router.get(
+    "/admin/analytics/top-authors",
+    status_code=status.HTTP_200_OK,
+    response_model=List[AuthorActivity],
+)
+async def read_top_authors_route(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(default=10, ge=1, le=100),
+    admin: User = Depends(get_current_admin),
+    session: Session = Depends(get_session),
+):
+    start, end = default_range(start, end, timedelta(days=30))
+    return await read_top_authors(start, end, limit, session)
+
+
+@router.post("/admin/user-stats/repair", status_code=status.HTTP_200_OK)
+async def repair_user_stats_route(
+    admin: User = Depends(get_current_admin), session: Session = Depends(get_session)
+) -> dict[str, int]:
+    return {"users": await run_in_threadpool(repair_user_stats, session)}
+
+
+@router.get("/admin/backups", status_code=status.HTTP_200_OK)
+async def read_backup_status_route(admin: User = Depends(get_current_admin)) -> dict[str, Any]:
+    return backup_manager.status()
+
+
+@router.post("/admin/backups", status_code=status.HTTP_202_ACCEPTED)
+async def create_backup_route(
+    background_tasks: BackgroundTasks,
+    admin: User = Depends(get_current_admin),
+    session: Session = Depends(get_session),
+) -> dict[str, Any]:
+    backup_manager.begin()
+    background_tasks.add_task(backup_manager.run, session.get_bind().engine)
+    return backup_manager.status()
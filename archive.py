@@ -0,0 +1,86 @@
+import os
+import zlib
+from datetime import datetime, timedelta
+from itertools import takewhile
+from typing import List, Optional, Tuple
+
+from sqlalchemy import delete
+from sqlmodel import Session, select
+
+from counters import total_counter
+from model import Comment, CommentArchive
+
+# 작성된 지 이 기간이 지난 댓글을 보관 티어로 옮긴다.
+ARCHIVE_AFTER = timedelta(days=int(os.getenv("COMMENT_ARCHIVE_AFTER_DAYS", "90")))
+ARCHIVE_INTERVAL = 60 * 60
+ARCHIVE_BATCH_SIZE = 500
+COMPRESSION_LEVEL = 6
+
+
+def compress_content(content: Optional[str]) -> Optional[bytes]:
+    if content is None:
+        return None
+    return zlib.compress(content.encode(), COMPRESSION_LEVEL)
+
+
+def decompress_content(data: Optional[bytes]) -> Optional[str]:
+    if data is None:
+        return None
+    return zlib.decompress(data).decode()
+
+
+def archived_key(kind: str, value) -> tuple:
+    return ("comment", "archived", kind, value)
+
+
+def to_archive(comment: Comment, archived_at: datetime) -> CommentArchive:
+    return CommentArchive(
+        **comment.dict(exclude={"content"}),
+        content=compress_content(comment.content),
+        archived_at=archived_at,
+    )
+
+
+def from_archive(archived: CommentArchive) -> Comment:
+    """세션에 올리지 않은 Comment로 되돌린다. 응답 직렬화와 훅에서 활성 티어 댓글과 똑같이 다룬다."""
+    return Comment(
+        **archived.dict(exclude={"content", "archived_at"}),
+        content=decompress_content(archived.content),
+    )
+
+
+def archived(owners: List[Tuple[int, str]], delta: int) -> None:
+    """보관 티어 댓글 수 캐시를 (게시글 아이디, 작성자 아이디) 목록만큼 증감한다."""
+    for post_id, author_id in owners:
+        total_counter.add(archived_key("post", post_id), delta)
+        total_counter.add(archived_key("author", author_id), delta)
+
+
+def archive_comments(
+    before: datetime, session: Session, batch_size: int = ARCHIVE_BATCH_SIZE
+) -> int:
+    """
+    아이디가 작은 댓글부터 batch_size개씩 보관 티어로 옮기고, before 이후에 작성된 댓글을 만나면 멈춘다.
+    그래서 보관 티어의 아이디는 모두 활성 티어의 아이디보다 작고, get_tiered_comments가 두 티어를 아이디 순으로
+    이어 붙일 수 있다. 과거 시각으로 가져온(importer.py) 댓글은 앞선 아이디가 모두 옮겨진 뒤에 옮겨진다.
+    배치마다 커밋해 쓰기 잠금을 오래 잡지 않는다.
+    """
+    moved = 0
+    while True:
+        query = select(Comment).order_by(Comment.id).limit(batch_size)  # type: ignore
+        batch = session.exec(query).all()
+        comments = list(takewhile(lambda comment: comment.created_at < before, batch))
+        if not comments:
+            return moved
+
+        archived_at = datetime.utcnow()
+        owners = [(comment.post_id, comment.author_id) for comment in comments]
+        ids = [comment.id for comment in comments]
+        session.add_all([to_archive(comment, archived_at) for comment in comments])
+        session.execute(delete(Comment).where(Comment.id.in_(ids)))  # type: ignore
+        session.commit()
+        session.expunge_all()
+        archived(owners, 1)
+        moved += len(ids)
+        if len(comments) < len(batch):
+            return moved
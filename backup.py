@@ -0,0 +1,164 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.engine import Engine
+
+from database import engine
+from exceptions import BackupInProgressException
+
+BACKUP_DIR = Path(os.getenv("BACKUP_DIR", "backups"))
+BACKUP_INTERVAL = float(os.getenv("BACKUP_INTERVAL_HOURS", "24")) * 60 * 60
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))
+# 한 단계에 복사할 페이지 수와 단계 사이에 쉬는 시간.
+# 단계가 끝나면 원본의 읽기 잠금이 풀리므로 쉬는 동안 쓰기 요청이 먼저 처리된다.
+BACKUP_PAGES = 64
+BACKUP_PAUSE = 0.005
+# 복사 중에 다른 연결이 원본을 고치면 SQLite는 백업을 처음부터 다시 한다.
+# 다시 시작할 때마다 단계 사이에 쉬는 시간을 BACKUP_MAX_PAUSE까지 두 배로 늘리고,
+# 그래도 이 횟수를 넘기면 쓰기를 막지 않도록 이번 백업은 실패로 끝내고 다음 주기에 다시 한다.
+BACKUP_MAX_RESTARTS = 10
+BACKUP_MAX_PAUSE = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+class TooManyRestarts(Exception):
+    pass
+
+
+class BackupManager:
+    """
+    SQLite 온라인 백업 API로 실행 중인 DB를 작은 페이지 단위로 복사한다.
+    진행 상황은 status()로 볼 수 있고, 복사가 끝나면 integrity_check를 통과한 파일만 남긴다.
+    """
+
+    def __init__(
+        self,
+        directory: Path = BACKUP_DIR,
+        pages: int = BACKUP_PAGES,
+        pause: float = BACKUP_PAUSE,
+        keep: int = BACKUP_KEEP,
+    ):
+        self.directory = directory
+        self.pages = pages
+        self.pause = pause
+        self.keep = keep
+        self.running = False
+        self.progress: Dict[str, Any] = {}
+        self.last: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def begin(self) -> None:
+        """백업 자리를 잡는다. 이미 진행 중이면 BackupInProgressException을 던진다."""
+        with self._lock:
+            if self.running:
+                raise BackupInProgressException
+            self.running = True
+            self.progress = {
+                "started_at": datetime.utcnow(),
+                "total_pages": None,
+                "copied_pages": 0,
+            }
+
+    def backup(self, bind: Engine = engine) -> Dict[str, Any]:
+        self.begin()
+        return self.run(bind)
+
+    def run(self, bind: Engine = engine) -> Dict[str, Any]:
+        """begin() 이후에 호출한다. 스레드에서 실행하는 것을 전제로 한다."""
+        started = time.perf_counter()
+        target = self.directory / f"posts-{datetime.utcnow():%Y%m%d-%H%M%S-%f}.db"
+        partial = target.with_suffix(".db.partial")
+        report: Dict[str, Any] = {"path": str(target), "started_at": self.progress["started_at"]}
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            report["restarts"] = self.copy(bind, partial)
+            report["integrity"] = integrity_check(partial)
+            if report["integrity"] != ["ok"]:
+                raise RuntimeError(f"integrity_check failed: {report['integrity']}")
+            partial.rename(target)
+            report["size"] = target.stat().st_size
+            report["ok"] = True
+            self.prune()
+        except Exception as e:
+            logger.exception("database backup failed")
+            partial.unlink(missing_ok=True)
+            report["ok"] = False
+            report["error"] = str(e)
+        finally:
+            report["seconds"] = round(time.perf_counter() - started, 3)
+            report["pages"] = self.progress.get("total_pages")
+            with self._lock:
+                self.last = report
+                self.running = False
+        if report["ok"]:
+            logger.info("database backup finished", extra={"backup": report})
+        return report
+
+    def copy(self, bind: Engine, path: Path) -> int:
+        restarts = 0
+        pause = self.pause
+        remaining_before: Optional[int] = None
+
+        def progress(status: int, remaining: int, total: int) -> None:
+            nonlocal restarts, pause, remaining_before
+            # 단계마다 남은 페이지가 줄어야 한다. 줄지 않았으면 처음부터 다시 복사한 것이다.
+            if remaining_before is not None and remaining >= remaining_before:
+                restarts += 1
+                if restarts > BACKUP_MAX_RESTARTS:
+                    raise TooManyRestarts(f"원본이 계속 바뀌어 백업을 {restarts - 1}번 다시 시작했습니다.")
+                pause = min(pause * 2, BACKUP_MAX_PAUSE)
+            remaining_before = remaining
+            self.progress.update(total_pages=total, copied_pages=total - remaining)
+            time.sleep(pause)
+
+        source = bind.raw_connection()
+        try:
+            # sqlalchemy2-stubs의 풀 연결 타입에는 driver_connection이 빠져 있다.
+            driver: sqlite3.Connection = source.driver_connection  # type: ignore[attr-defined]
+            destination = sqlite3.connect(path)
+            try:
+                driver.backup(destination, pages=self.pages, progress=progress)
+            finally:
+                destination.close()
+        finally:
+            source.close()
+        return restarts
+
+    def prune(self) -> None:
+        for old in self.files()[self.keep :]:
+            Path(old["path"]).unlink(missing_ok=True)
+
+    def files(self) -> List[Dict[str, Any]]:
+        """완성된 백업 파일을 최신순으로 돌려준다."""
+        if not self.directory.exists():
+            return []
+        return [
+            {"path": str(path), "size": path.stat().st_size}
+            for path in sorted(self.directory.glob("posts-*.db"), reverse=True)
+        ]
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "progress": self.progress if self.running else None,
+            "last": self.last,
+            "backups": self.files(),
+        }
+
+
+def integrity_check(path: Path) -> List[str]:
+    connection = sqlite3.connect(path)
+    try:
+        return [row[0] for row in connection.execute("PRAGMA integrity_check")]
+    finally:
+        connection.close()
+
+
+backup_manager = BackupManager()
@@ -0,0 +1,84 @@
+import json
+import random
+import time
+from functools import partial
+from typing import Callable, List, Tuple
+
+from compression import BrotliCompressor, Compressor, GzipCompressor, brotli
+
+ROUNDS = 200
+CHUNK_SIZE = 4096
+WORDS = "learn how to build apis with fastapi and python sqlmodel async session query".split()
+
+
+def text(rng: random.Random, size: int) -> str:
+    words: List[str] = []
+    while sum(len(word) + 1 for word in words) < size:
+        words.append(rng.choice(WORDS) + str(rng.randint(0, 999)))
+    return " ".join(words)[:size]
+
+
+def posts_payload(limit: int, content_size: int) -> bytes:
+    posts = [
+        {
+            "id": post_id,
+            "title": f"FastAPI Tutorial {post_id}",
+            "content": text(random.Random(post_id), content_size),
+            "author_id": f"user{post_id % 17}",
+        }
+        for post_id in range(1, limit + 1)
+    ]
+    return json.dumps(posts).encode()
+
+
+def one_shot(factory: Callable[[], Compressor]) -> Callable[[bytes], bytes]:
+    def run(body: bytes) -> bytes:
+        return factory().finish(body)
+
+    return run
+
+
+def streamed(factory: Callable[[], Compressor]) -> Callable[[bytes], bytes]:
+    def run(body: bytes) -> bytes:
+        compressor = factory()
+        chunks = [body[i : i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)]
+        out = [compressor.compress(chunk) for chunk in chunks[:-1]]
+        out.append(compressor.finish(chunks[-1]))
+        return b"".join(out)
+
+    return run
+
+
+def candidates() -> List[Tuple[str, Callable[[bytes], bytes]]]:
+    result: List[Tuple[str, Callable[[bytes], bytes]]] = []
+    factories: List[Tuple[str, Callable[[], Compressor]]] = [
+        (f"gzip-{level}", partial(GzipCompressor, level)) for level in (1, 6, 9)
+    ]
+    if brotli is not None:
+        factories.extend(
+            (f"br-{quality}", partial(BrotliCompressor, quality)) for quality in (1, 4, 11)
+        )
+    for name, factory in factories:
+        result.append((name, one_shot(factory)))
+        result.append((f"{name} stream", streamed(factory)))
+    return result
+
+
+def main():
+    print(f"{'payload':>16} {'encoding':>16} {'bytes':>10} {'ratio':>7} {'us/op':>10}")
+    for limit, content_size in ((1, 100), (10, 500), (100, 2000)):
+        body = posts_payload(limit, content_size)
+        label = f"{limit}x{content_size}"
+        print(f"{label:>16} {'identity':>16} {len(body):>10} {1.0:>7.2f} {0.0:>10.1f}")
+        for name, run in candidates():
+            compressed = run(body)
+            started = time.perf_counter()
+            for _ in range(ROUNDS):
+                run(body)
+            elapsed = (time.perf_counter() - started) / ROUNDS * 1_000_000
+            ratio = len(compressed) / len(body)
+            print(f"{label:>16} {name:>16} {len(compressed):>10} {ratio:>7.2f} {elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
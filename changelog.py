@@ -0,0 +1,63 @@
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple, cast
+
+from sqlalchemy import delete
+from sqlalchemy import select as select_columns
+from sqlalchemy.engine import CursorResult
+from sqlmodel import Session, col, func
+
+from model import ChangeEntity, ChangeLog
+
+# 기록은 model.CHANGE_TRIGGERS의 트리거가 쓰기와 같은 문장 안에서 남긴다. 여기서는 읽고 지우기만 한다.
+# 이 기간보다 오래된 변경 기록은 지운다. 그보다 오래된 커서로 요청하면 처음부터 다시 받아야 한다.
+CHANGE_LOG_RETENTION = timedelta(days=int(os.getenv("CHANGE_LOG_RETENTION_DAYS", "30")))
+MAX_CHANGES = 1_000
+
+
+def oldest_seq(session: Session) -> Optional[int]:
+    return session.execute(select_columns(func.min(ChangeLog.seq))).scalar()
+
+
+def is_expired(since: int, session: Session) -> bool:
+    """since 이후의 기록 일부가 이미 지워졌으면 True."""
+    oldest = oldest_seq(session)
+    return oldest is not None and since < oldest - 1
+
+
+def read_changes(
+    entity: ChangeEntity, since: int, limit: int, session: Session, post_id: Optional[int] = None
+) -> Tuple[Dict[int, bool], int, bool]:
+    """
+    since 이후의 변경을 seq 순으로 limit개까지 읽어 아이디별 마지막 상태(삭제 여부)로 합친다.
+    (아이디 → 삭제 여부, 다음 커서, 남은 변경이 더 있는지)를 돌려준다.
+    """
+    query = select_columns(ChangeLog.seq, ChangeLog.entity_id, ChangeLog.deleted).where(
+        ChangeLog.entity == entity, col(ChangeLog.seq) > since
+    )
+    if post_id is not None:
+        query = query.where(ChangeLog.post_id == post_id)
+    rows = session.execute(query.order_by(ChangeLog.seq).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    latest: Dict[int, bool] = {}
+    for _, entity_id, deleted in rows:
+        # 마지막 변경 순서를 유지하도록 지웠다가 다시 넣는다.
+        latest.pop(entity_id, None)
+        latest[entity_id] = deleted
+    cursor = rows[-1][0] if rows else since
+    return latest, cursor, has_more
+
+
+def current_cursor(session: Session) -> int:
+    return session.execute(select_columns(func.max(ChangeLog.seq))).scalar() or 0
+
+
+def prune_change_log(before: datetime, session: Session) -> int:
+    """before 이전의 기록을 지운다. 커서 만료를 판단할 수 있도록 가장 최근 기록 하나는 남긴다."""
+    newest = current_cursor(session)
+    statement = delete(ChangeLog).where(ChangeLog.changed_at < before, col(ChangeLog.seq) < newest)
+    result = cast(CursorResult, session.execute(statement))
+    session.commit()
+    return result.rowcount
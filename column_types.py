@@ -0,0 +1,108 @@
+import logging
+import os
+import zlib
+from typing import Any, Optional, Union
+
+from sqlalchemy import Column, Table, Text
+from sqlalchemy.engine import Connection
+from sqlalchemy.types import TypeDecorator
+
+try:
+    import zstandard  # type: ignore
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# 이 크기(UTF-8 바이트) 이상인 본문만 압축한다. 짧은 본문은 압축 이득보다 비용이 크다.
+COMPRESS_MIN_SIZE = int(os.getenv("CONTENT_COMPRESS_MIN_BYTES", "512"))
+ZLIB_LEVEL = 6
+MIGRATION_BATCH_SIZE = 1_000
+# 압축한 값은 BLOB으로, 압축하지 않은 값은 TEXT로 저장한다. BLOB의 첫 바이트는 코덱을 나타낸다.
+# 새 값은 항상 zlib으로 쓴다. zstd 헤더는 예전에 zstandard가 있던 호스트가 쓴 행을 읽기 위해서만 남겨 둔다.
+ZLIB_HEADER = b"\x01"
+ZSTD_HEADER = b"\x02"
+
+logger = logging.getLogger(__name__)
+
+
+def compress_text(
+    value: Optional[str], min_size: int = COMPRESS_MIN_SIZE
+) -> Union[str, bytes, None]:
+    if value is None:
+        return None
+    raw = value.encode()
+    if len(raw) < min_size:
+        return value
+    compressed = ZLIB_HEADER + zlib.compress(raw, ZLIB_LEVEL)
+    # 잘 줄지 않는 본문(이미 압축된 데이터 등)은 그대로 둔다.
+    return compressed if len(compressed) < len(raw) else value
+
+
+def decompress_text(value: Union[str, bytes, None]) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    header, data = value[:1], value[1:]
+    if header == ZLIB_HEADER:
+        return zlib.decompress(data).decode()
+    if header == ZSTD_HEADER:
+        if zstandard is None:
+            raise RuntimeError("zstd로 압축된 본문을 읽으려면 zstandard 패키지가 필요합니다.")
+        return zstandard.ZstdDecompressor().decompress(data).decode()
+    raise ValueError(f"알 수 없는 압축 형식입니다: {header!r}")
+
+
+class CompressedText(TypeDecorator):
+    """
+    min_size 이상인 문자열은 zlib으로 압축해 BLOB으로, 나머지는 TEXT로 저장한다.
+    압축은 process_result_value에서 행을 읽을 때 바로 푼다. (지연 로딩이 아니다)
+    이 컬럼을 조회 결과에 포함했을 때만 불리므로, content를 고르지 않는 projection 쿼리는 비용이 없다.
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def __init__(self, min_size: int = COMPRESS_MIN_SIZE):
+        super().__init__()
+        self.min_size = min_size
+
+    def process_bind_param(self, value: Optional[str], dialect) -> Any:
+        return compress_text(value, self.min_size)
+
+    def process_result_value(self, value: Any, dialect) -> Optional[str]:
+        return decompress_text(value)
+
+
+def compress_existing_rows(
+    connection: Connection, table: Table, column: Column, batch_size: int = MIGRATION_BATCH_SIZE
+) -> int:
+    """
+    CompressedText로 바꾸기 전에 TEXT로 저장된 큰 본문을 아이디 순으로 batch_size개씩 압축한다.
+    배치마다 커밋하며, 이미 압축된 행(BLOB)은 건너뛰므로 여러 번 실행해도 된다.
+    """
+    min_size = column.type.min_size
+    select_sql = (
+        f'SELECT id, "{column.name}" FROM "{table.name}" '
+        f"WHERE id > :last_id AND typeof(\"{column.name}\") = 'text' "
+        f'AND length(CAST("{column.name}" AS BLOB)) >= :min_size ORDER BY id LIMIT :batch_size'
+    )
+    update_sql = f'UPDATE "{table.name}" SET "{column.name}" = :value WHERE id = :id'
+    compressed = 0
+    last_id = 0
+    while True:
+        with connection.begin():
+            rows = connection.exec_driver_sql(
+                select_sql, {"last_id": last_id, "min_size": min_size, "batch_size": batch_size}
+            ).all()
+            if not rows:
+                break
+            updates = [
+                {"value": value, "id": id}
+                for id, text in rows
+                if not isinstance(value := compress_text(text, min_size), str)
+            ]
+            if updates:
+                connection.exec_driver_sql(update_sql, updates)
+        compressed += len(updates)
+        last_id = rows[-1][0]
+    if compressed:
+        logger.info("compressed %d rows of %s.%s", compressed, table.name, column.name)
+    return compressed
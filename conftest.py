@@ -2,7 +2,14 @@ import pytest
 from sqlmodel import Session, SQLModel, create_engine
 
 import api
+from counters import total_counter
+from feed import recent_feed
+from idempotency import idempotency_store
 from main import app
+from nicknames import nickname_index
+from response_cache import response_cache
+from stream import comment_hub
+from trending import trending_index
 
 DATABASE_URL = "sqlite:///test_posts.db"
 connect_args = {"check_same_thread": False}
@@ -11,13 +18,20 @@ SQLModel.metadata.drop_all(engine)
 
 
 def test_db_session():
-    with Session(engine) as session:
+    with Session(engine, expire_on_commit=False) as session:
         yield session
 
 
 @pytest.fixture(scope="function", autouse=True)
 def override_dependencies():
     SQLModel.metadata.create_all(engine)
+    total_counter.clear()
+    recent_feed.clear()
+    comment_hub.clear()
+    trending_index.clear()
+    idempotency_store.clear()
+    response_cache.clear()
+    nickname_index.clear()
 
     original_dependency = app.dependency_overrides.get(api.get_session)
     app.dependency_overrides[api.get_session] = test_db_session
@@ -0,0 +1,61 @@
+import time
+from typing import Callable, Dict, Hashable, Tuple
+
+TOTAL_TTL = 30.0
+APPROXIMATE_THRESHOLD = 100_000
+APPROXIMATE_TTL = 600.0
+
+
+class CountEntry:
+    __slots__ = ("value", "counted_at")
+
+    def __init__(self, value: int, counted_at: float):
+        self.value = value
+        self.counted_at = counted_at
+
+
+class TotalCounter:
+    """
+    COUNT(*) 결과를 키별로 보관하고, 생성/삭제 시 증감해 최신 상태로 유지한다.
+    - TTL 안에서는 정확한 값으로 응답한다. (다른 프로세스의 쓰기는 TTL이 지나면 반영)
+    - APPROXIMATE_THRESHOLD 이상인 큰 집합은 APPROXIMATE_TTL 동안 다시 세지 않고 근사값으로 응답한다.
+    """
+
+    def __init__(
+        self,
+        ttl: float = TOTAL_TTL,
+        approximate_threshold: int = APPROXIMATE_THRESHOLD,
+        approximate_ttl: float = APPROXIMATE_TTL,
+    ):
+        self.ttl = ttl
+        self.approximate_threshold = approximate_threshold
+        self.approximate_ttl = approximate_ttl
+        self._entries: Dict[Hashable, CountEntry] = {}
+
+    def get(self, key: Hashable, count: Callable[[], int]) -> Tuple[int, bool]:
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = now - entry.counted_at
+            if age < self.ttl:
+                return entry.value, False
+            if entry.value >= self.approximate_threshold and age < self.approximate_ttl:
+                return entry.value, True
+
+        value = count()
+        self._entries[key] = CountEntry(value, now)
+        return value, False
+
+    def add(self, key: Hashable, delta: int) -> None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.value = max(entry.value + delta, 0)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+total_counter = TotalCounter()
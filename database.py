@@ -1,10 +1,258 @@
+import hashlib
+import logging
+import os
+import sqlite3
+from datetime import datetime
+from enum import Enum
+from typing import Any, List, Set
+
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql.base import PGCompiler
+from sqlalchemy.dialects.sqlite.base import SQLiteCompiler
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import Column, CreateColumn, CreateIndex, CreateTable, Table
 from sqlmodel import SQLModel, create_engine
 
+from querylog import query_log
+
 DATABASE_URL = "sqlite:///posts.db"
+POOL_SIZE = 5
+# 모든 SQL을 로그로 남긴다. 느린 쿼리만 보려면 querylog의 SLOW_QUERY_THRESHOLD_MS를 조정한다.
+SQL_ECHO = os.getenv("SQL_ECHO", "").lower() in ("1", "true")
+SCHEMA_VERSION_TABLE = "schema_version"
+# 컬럼을 추가한 뒤 기존 행을 채우는 SQL. 추가하기 전의 댓글은 모두 최상위 댓글이다.
+BACKFILLS = {("comment", "path"): "UPDATE comment SET path = printf('%010d/', id) WHERE path = ''"}
+# AUTOINCREMENT 테이블의 다음 아이디가 이 SQL의 결과보다 커지게 한다. 보관 티어로 옮긴 댓글의 아이디를 다시 쓰지 않는다.
+ID_FLOORS = {"comment": "SELECT max(id) FROM comment_archive"}
+
+
+# SQLite는 3.35부터 RETURNING을 지원하지만 SQLAlchemy 1.4의 SQLite 컴파일러는 이를 막아 두었다. (2.0부터 지원)
+# UPDATE/DELETE ... RETURNING으로 쓰기를 한 번에 끝내기 위해 PostgreSQL 컴파일러의 구현을 그대로 빌려 쓴다.
+# 컴파일러 내부 동작에 기대므로 pyproject.toml에서 SQLAlchemy 버전을 고정하고,
+# test_sqlite_compiler_renders_returning이 버전을 올렸을 때 바로 깨지게 한다.
+# 그보다 오래된 SQLite에서는 service.write_returning이 쓰기 전후에 따로 조회한다.
+SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35)
+if SUPPORTS_RETURNING:
+    SQLiteCompiler.returning_clause = PGCompiler.returning_clause  # type: ignore
 
 connect_args = {"check_same_thread": False}
-engine = create_engine(DATABASE_URL, echo=True, connect_args=connect_args)
+engine = create_engine(
+    DATABASE_URL,
+    connect_args=connect_args,
+    poolclass=QueuePool,
+    pool_size=POOL_SIZE,
+    max_overflow=10,
+)
+query_log.install(engine)
+# echo=True는 stdout 핸들러를 따로 달기 때문에, 로거 레벨만 올려 공통 로그 파이프라인으로 보낸다.
+if SQL_ECHO:
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+
+
+def schema_fingerprint(bind=engine) -> str:
+    ddl = []
+    for table in SQLModel.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(bind)).strip())
+        for index in sorted(table.indexes, key=lambda index: index.name or ""):
+            ddl.append(str(CreateIndex(index).compile(bind)).strip())
+        ddl.extend(sorted(table.info.get("triggers", {}).values()))
+    return hashlib.sha256("\n".join(ddl).encode()).hexdigest()
+
+
+def stored_schema_fingerprint(bind=engine):
+    try:
+        with bind.connect() as connection:
+            return connection.exec_driver_sql(
+                f"SELECT fingerprint FROM {SCHEMA_VERSION_TABLE}"
+            ).scalar()
+    except OperationalError:
+        return None
+
+
+def live_columns(connection: Connection, table: Table) -> Set[str]:
+    rows = connection.exec_driver_sql(f'PRAGMA table_info("{table.name}")').all()
+    return {row[1] for row in rows}
+
+
+def literal(value: Any) -> str:
+    if isinstance(value, Enum):
+        value = value.name
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, datetime):
+        value = value.isoformat(" ")
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def column_definition(connection: Connection, column: Column) -> str:
+    """
+    ALTER TABLE ADD COLUMN에 쓸 컬럼 정의. SQLite는 NOT NULL 컬럼을 추가할 때 상수 기본값을 요구하므로
+    모델의 기본값(함수면 지금 호출한 값)을 DEFAULT로 붙인다.
+    """
+    definition = str(CreateColumn(column).compile(connection)).strip()
+    default = column.default
+    if default is None or column.server_default is not None:
+        if not column.nullable and column.server_default is None:
+            raise RuntimeError(f"기본값이 없는 NOT NULL 컬럼은 추가할 수 없습니다: {column}")
+        return definition
+    value = default.arg(None) if default.is_callable else default.arg
+    return f"{definition} DEFAULT {literal(value)}"
+
+
+def missing_schema(connection: Connection) -> List[str]:
+    """
+    모델에는 있지만 실제 DB에는 없는 컬럼을 "테이블.컬럼" 목록으로 돌려준다.
+    없는 테이블은 "테이블", 없는 트리거는 "trigger 이름"으로 넣는다.
+    """
+    triggers = {
+        row[0]
+        for row in connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger'"
+        )
+    }
+    missing = []
+    for table in SQLModel.metadata.sorted_tables:
+        columns = live_columns(connection, table)
+        if not columns:
+            missing.append(table.name)
+            continue
+        missing.extend(
+            f"{table.name}.{column.name}" for column in table.columns if column.name not in columns
+        )
+        missing.extend(
+            f"trigger {name}" for name in table.info.get("triggers", {}) if name not in triggers
+        )
+    return missing
+
+
+def add_missing_columns(connection: Connection) -> List[str]:
+    """
+    이미 있는 테이블에 모델에서 새로 생긴 컬럼과 인덱스를 추가한다. (create_all은 없는 테이블만 만든다.)
+    추가한 컬럼을 "테이블.컬럼" 목록으로 돌려준다.
+    """
+    added = []
+    for table in SQLModel.metadata.sorted_tables:
+        columns = live_columns(connection, table)
+        if not columns:
+            continue
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            connection.exec_driver_sql(
+                f'ALTER TABLE "{table.name}" ADD COLUMN {column_definition(connection, column)}'
+            )
+            if (table.name, column.name) in BACKFILLS:
+                connection.exec_driver_sql(BACKFILLS[(table.name, column.name)])
+            added.append(f"{table.name}.{column.name}")
+        for index in table.indexes:
+            connection.execute(CreateIndex(index, if_not_exists=True))
+    if added:
+        logging.getLogger(__name__).info("added columns: %s", ", ".join(added))
+    return added
+
+
+def add_autoincrement(connection: Connection) -> List[str]:
+    """
+    sqlite_autoincrement로 선언했지만 AUTOINCREMENT 없이 만들어진 테이블을 새로 만들어 옮긴다.
+    SQLite는 ALTER TABLE로 이를 바꿀 수 없어 새 테이블 생성 → 복사 → 기존 테이블 삭제 → 이름 변경 순서로 한다.
+    """
+    rebuilt = []
+    for table in SQLModel.metadata.sorted_tables:
+        if not table.dialect_options["sqlite"]["autoincrement"]:
+            continue
+        sql = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name",
+            {"name": table.name},
+        ).scalar()
+        if sql is None or "AUTOINCREMENT" in sql.upper():
+            continue
+        temporary = f"_{table.name}_rebuild"
+        ddl = str(CreateTable(table).compile(connection)).strip()
+        connection.exec_driver_sql(
+            ddl.replace(f"CREATE TABLE {table.name} ", f'CREATE TABLE "{temporary}" ', 1)
+        )
+        columns = ", ".join(f'"{column.name}"' for column in table.columns)
+        connection.exec_driver_sql(
+            f'INSERT INTO "{temporary}" ({columns}) SELECT {columns} FROM "{table.name}"'
+        )
+        connection.exec_driver_sql(f'DROP TABLE "{table.name}"')
+        connection.exec_driver_sql(f'ALTER TABLE "{temporary}" RENAME TO "{table.name}"')
+        for index in table.indexes:
+            connection.execute(CreateIndex(index))
+        rebuilt.append(table.name)
+    if rebuilt:
+        logging.getLogger(__name__).info("rebuilt with AUTOINCREMENT: %s", ", ".join(rebuilt))
+    return rebuilt
+
+
+def raise_id_floors(connection: Connection) -> None:
+    for table, floor_sql in ID_FLOORS.items():
+        floor = connection.exec_driver_sql(floor_sql).scalar()
+        if floor is None:
+            continue
+        current = connection.exec_driver_sql(
+            "SELECT seq FROM sqlite_sequence WHERE name = :name", {"name": table}
+        ).scalar()
+        if current is None:
+            connection.exec_driver_sql(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)",
+                {"name": table, "seq": floor},
+            )
+        elif current < floor:
+            connection.exec_driver_sql(
+                "UPDATE sqlite_sequence SET seq = :seq WHERE name = :name",
+                {"name": table, "seq": floor},
+            )
+
+
+@event.listens_for(SQLModel.metadata, "after_create")
+def create_triggers(target, connection: Connection, **kw) -> None:
+    """
+    create_all이 끝날 때마다 모델의 info["triggers"]에 정의한 트리거를 다시 만든다.
+    정의가 바뀌었을 수 있으므로 IF NOT EXISTS 대신 지우고 만든다.
+    """
+    for table in target.sorted_tables:
+        for name, sql in table.info.get("triggers", {}).items():
+            connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS "{name}"')
+            connection.exec_driver_sql(sql)
+
+
+def create_db_and_tables(bind=engine) -> bool:
+    """
+    저장된 스키마 지문이 현재 모델과 같으면 DDL을 건너뛴다.
+    테이블이 추가되거나 바뀐 경우에만 create_all과 컬럼 추가, AUTOINCREMENT 전환을 실행하고,
+    실제 테이블이 모델과 맞는지 확인한 뒤에 지문을 갱신한다. 맞지 않으면 지문을 남기지 않고 실패한다.
+    """
+    fingerprint = schema_fingerprint(bind)
+    if stored_schema_fingerprint(bind) == fingerprint:
+        return False
+
+    with bind.begin() as connection:
+        add_missing_columns(connection)
+        add_autoincrement(connection)
+        SQLModel.metadata.create_all(connection)
+        raise_id_floors(connection)
+        if missing := missing_schema(connection):
+            raise RuntimeError(f"스키마를 모델에 맞추지 못했습니다: {', '.join(missing)}")
+        connection.exec_driver_sql(
+            f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (fingerprint TEXT NOT NULL)"
+        )
+        connection.exec_driver_sql(f"DELETE FROM {SCHEMA_VERSION_TABLE}")
+        connection.exec_driver_sql(
+            f"INSERT INTO {SCHEMA_VERSION_TABLE} (fingerprint) VALUES (?)", (fingerprint,)
+        )
+    return True
 
 
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
+def warm_pool(bind=engine, size: int = POOL_SIZE) -> None:
+    connections = [bind.connect() for _ in range(size)]
+    try:
+        for connection in connections:
+            connection.exec_driver_sql("SELECT 1")
+    finally:
+        for connection in connections:
+            connection.close()
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 
 from fastapi import HTTPException, status
 
@@ -26,6 +26,11 @@ class UserAuthorizationFailedException(HTTPException):
         super().__init__(status_code=status.HTTP_403_FORBIDDEN, detail=f"비밀번호가 틀렸습니다.")
 
 
+class AdminAuthorizationFailedException(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=status.HTTP_403_FORBIDDEN, detail="관리자 권한이 필요합니다.")
+
+
 class PostCreationFailedException(HTTPException):
     def __init__(self, title: str):
         super().__init__(
@@ -70,6 +75,52 @@ class CommentAuthorizationFailedException(HTTPException):
         )
 
 
+class InvalidFieldsException(HTTPException):
+    def __init__(self, fields: List[str]):
+        super().__init__(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"조회할 수 없는 필드입니다: {', '.join(fields)}",
+        )
+
+
+class InvalidIdsException(HTTPException):
+    def __init__(self, max_size: int):
+        super().__init__(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"아이디는 쉼표로 구분해 1개 이상 {max_size}개 이하로 입력해야 합니다.",
+        )
+
+
+class CursorExpiredException(HTTPException):
+    def __init__(self, cursor: int):
+        super().__init__(
+            status_code=status.HTTP_410_GONE,
+            detail=f"커서 {cursor} 이후의 변경 기록이 만료되었습니다. 목록을 처음부터 다시 받아야 합니다.",
+        )
+
+
+class InvalidRangeException(HTTPException):
+    def __init__(self, max_buckets: int):
+        super().__init__(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"조회 기간은 시작보다 끝이 늦어야 하며, 구간 {max_buckets}개 이하여야 합니다.",
+        )
+
+
+class PreconditionFailedException(HTTPException):
+    def __init__(self, version: int):
+        super().__init__(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail=f"다른 요청이 먼저 수정했습니다. (현재 버전: {version})",
+            headers={"ETag": f'"{version}"'},
+        )
+
+
+class BackupInProgressException(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=status.HTTP_409_CONFLICT, detail="이미 백업이 진행 중입니다.")
+
+
 class NotAuthenticated(HTTPException):
     def __init__(self):
         super().__init__(
@@ -0,0 +1,89 @@
+from collections import deque
+from datetime import datetime
+from itertools import islice
+from typing import Deque, Iterable, List, Optional
+
+from sqlmodel import SQLModel
+
+from model import Comment, Post
+
+FEED_SIZE = 200
+FEED_CONTENT_LENGTH = 200
+
+
+class FeedItem(SQLModel):
+    type: str
+    id: int
+    post_id: int
+    author_id: str
+    title: Optional[str]
+    content: Optional[str]
+    created_at: datetime
+
+
+def post_item(post: Post) -> FeedItem:
+    return FeedItem(
+        type="post",
+        id=post.id,  # type: ignore
+        post_id=post.id,  # type: ignore
+        author_id=post.author_id,
+        title=post.title,
+        content=post.content[:FEED_CONTENT_LENGTH] if post.content else post.content,
+        created_at=post.created_at,
+    )
+
+
+def comment_item(comment: Comment) -> FeedItem:
+    return FeedItem(
+        type="comment",
+        id=comment.id,  # type: ignore
+        post_id=comment.post_id,
+        author_id=comment.author_id,
+        title=None,
+        content=comment.content[:FEED_CONTENT_LENGTH] if comment.content else comment.content,
+        created_at=comment.created_at,
+    )
+
+
+class RecentFeed:
+    """
+    사이트 전체의 최근 게시글/댓글을 최신순으로 보관하는 고정 크기 링 버퍼.
+    가장 많이 조회되는 홈 화면이 DB를 거치지 않도록 쓰기 시점에 갱신한다.
+    """
+
+    def __init__(self, maxlen: int = FEED_SIZE):
+        self.maxlen = maxlen
+        self._items: Deque[FeedItem] = deque(maxlen=maxlen)
+
+    def append(self, item: FeedItem) -> None:
+        self._items.appendleft(item)
+
+    def replace(self, item: FeedItem) -> None:
+        for index, current in enumerate(self._items):
+            if current.type == item.type and current.id == item.id:
+                self._items[index] = item
+                return
+
+    def remove(self, type: str, id: int) -> None:
+        self._filter(lambda item: item.type == type and item.id == id)
+
+    def remove_post(self, post_id: int) -> None:
+        self._filter(lambda item: item.post_id == post_id)
+
+    def recent(self, limit: int) -> List[FeedItem]:
+        return list(islice(self._items, limit))
+
+    def warm(self, items: Iterable[FeedItem]) -> None:
+        newest = sorted(items, key=lambda item: item.created_at, reverse=True)
+        self._items = deque(newest[: self.maxlen], maxlen=self.maxlen)
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def _filter(self, removed) -> None:
+        self._items = deque(
+            (item for item in self._items if not removed(item)), maxlen=self.maxlen
+        )
+
+
+recent_feed = RecentFeed()
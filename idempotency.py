@@ -0,0 +1,187 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from starlette import status
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+IDEMPOTENCY_TTL = 24 * 60 * 60
+MAX_ENTRIES = 10_000
+IDEMPOTENT_PATHS = re.compile(r"^/(users|posts|posts/\d+/comments)/$")
+
+
+class StoredResponse:
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+
+class IdempotencyEntry:
+    __slots__ = ("fingerprint", "expires_at", "future")
+
+    def __init__(self, fingerprint: str, expires_at: float):
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        # 처리가 실패하면 None으로 끝나며, 기다리던 요청은 키를 다시 잡아 처음부터 처리한다.
+        self.future: "asyncio.Future[Optional[StoredResponse]]" = (
+            asyncio.get_running_loop().create_future()
+        )
+
+
+class IdempotencyStore:
+    """
+    Idempotency-Key별 응답을 TTL 동안 보관한다.
+    - 완료된 키는 저장된 응답을 그대로 돌려준다.
+    - 처리 중인 키로 들어온 중복 요청은 먼저 들어온 요청의 결과를 기다린다.
+    - 처리가 실패하면(예외, 5xx) 키를 풀어 다음 요청이 다시 처리하게 한다.
+    - 항목 수가 max_entries를 넘으면 완료된 항목 중 가장 오래된 것부터 지운다. 처리 중인 항목은 지우지 않는다.
+    """
+
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, max_entries: int = MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], IdempotencyEntry]" = OrderedDict()
+
+    def get(self, key: Tuple[str, str]) -> Optional[IdempotencyEntry]:
+        self._evict(time.monotonic())
+        return self._entries.get(key)
+
+    def begin(self, key: Tuple[str, str], fingerprint: str) -> IdempotencyEntry:
+        entry = IdempotencyEntry(fingerprint, time.monotonic() + self.ttl)
+        self._entries[key] = entry
+        self._evict(time.monotonic())
+        return entry
+
+    def complete(
+        self, key: Tuple[str, str], entry: IdempotencyEntry, response: StoredResponse
+    ) -> None:
+        # 서버 오류는 저장하지 않아 다음 재시도가 다시 처리되도록 한다.
+        if response.status >= 500:
+            self.release(key, entry)
+        elif not entry.future.done():
+            entry.future.set_result(response)
+
+    def release(self, key: Tuple[str, str], entry: IdempotencyEntry) -> None:
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+        if not entry.future.done():
+            entry.future.set_result(None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def _evict(self, now: float) -> None:
+        for key, entry in list(self._entries.items()):
+            if entry.expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            if entry.future.done():
+                del self._entries[key]
+
+
+idempotency_store = IdempotencyStore()
+
+
+def replay_headers(response: StoredResponse) -> List[Tuple[bytes, bytes]]:
+    return response.headers + [(b"idempotent-replayed", b"true")]
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app: ASGIApp, store: IdempotencyStore = idempotency_store):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not IDEMPOTENT_PATHS.match(scope["path"])
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        idempotency_key = Headers(scope=scope).get("idempotency-key")
+        if not idempotency_key:
+            await self.app(scope, receive, send)
+            return
+
+        body = await read_body(receive)
+        key = (scope["path"], idempotency_key)
+        fingerprint = hashlib.sha256(body).hexdigest()
+
+        while (entry := self.store.get(key)) is not None:
+            if entry.fingerprint != fingerprint:
+                await send_conflict(send)
+                return
+            response = await asyncio.shield(entry.future)
+            if response is not None:
+                await send_stored(send, response, replay_headers(response))
+                return
+            # 먼저 들어온 요청이 실패해 키가 풀렸다. 다음 반복에서 키를 잡거나 새 처리를 기다린다.
+
+        entry = self.store.begin(key, fingerprint)
+        try:
+            response = await self.run(scope, body, receive, send)
+        except BaseException:
+            self.store.release(key, entry)
+            raise
+        self.store.complete(key, entry, response)
+
+    async def run(self, scope: Scope, body: bytes, receive: Receive, send: Send) -> StoredResponse:
+        start: Message = {}
+        chunks = []
+        body_sent = False
+
+        async def replay_receive() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def capture_send(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, replay_receive, capture_send)
+        return StoredResponse(start["status"], list(start.get("headers", [])), b"".join(chunks))
+
+
+async def read_body(receive: Receive) -> bytes:
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        more_body = message.get("more_body", False)
+    return b"".join(chunks)
+
+
+async def send_stored(
+    send: Send, response: StoredResponse, headers: List[Tuple[bytes, bytes]]
+) -> None:
+    await send({"type": "http.response.start", "status": response.status, "headers": headers})
+    await send({"type": "http.response.body", "body": response.body})
+
+
+async def send_conflict(send: Send) -> None:
+    body = json.dumps(
+        {"detail": "같은 Idempotency-Key로 다른 요청 본문이 전달되었습니다."}, ensure_ascii=False
+    ).encode()
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    response = StoredResponse(status.HTTP_422_UNPROCESSABLE_ENTITY, headers, body)
+    await send_stored(send, response, headers)
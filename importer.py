@@ -0,0 +1,430 @@
+"""
+사용자/게시글/댓글을 JSONL 또는 CSV 파일에서 대량으로 가져온다.
+
+    python importer.py users users.jsonl
+    python importer.py posts posts.csv --chunk-size 50000
+    python importer.py comments comments.jsonl
+
+- 각 행은 UserCreate/PostCreate/CommentCreate로 검증하고, 통과하지 못한 행은 경고 로그를 남기고 건너뛴다.
+- chunk_size개씩 한 트랜잭션으로 executemany 하며, 같은 트랜잭션에서 처리한 위치를 import_checkpoint에 기록한다.
+  중간에 실패해도 같은 명령을 다시 실행하면 마지막으로 커밋된 위치부터 이어서 가져온다.
+- 가져오는 동안 대상 테이블의 보조 인덱스를 지웠다가 끝난 뒤(실패해도) 다시 만든다.
+- 쓰기 경로를 거치지 않으므로 끝나면 user_stats와 활동 롤업을 다시 계산한다.
+- 외래 키(작성자, 게시글, 부모 댓글)는 청크마다 IN 쿼리로 한 번에 확인한다.
+- 변경 기록(change_log)은 트리거가 남기므로 청크와 같은 트랜잭션에 함께 커밋된다.
+- 드라이버에 바로 넘기므로 CompressedText 컬럼(content)은 직접 압축해 넣는다.
+"""
+import argparse
+import csv
+import json
+import logging
+import sys
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Type
+
+from pydantic import BaseModel, validate_model
+from sqlalchemy import Table
+from sqlalchemy.engine import Row
+from sqlalchemy.future import Connection, Engine
+from sqlalchemy.schema import CreateIndex
+from sqlmodel import Session
+
+from column_types import compress_text
+from database import create_db_and_tables, engine
+from model import Comment, CommentArchive, Post, Role, User, check_password
+from rollup import rebuild_activity_rollups
+from service import CommentCreate, PostCreate, UserCreate, repair_user_stats
+
+try:
+    import orjson
+
+    loads = orjson.loads
+except ImportError:  # pragma: no cover
+    loads = json.loads
+
+CHUNK_SIZE = 50_000
+# SQLite 바인딩 변수 개수 제한보다 충분히 작게 나눠 IN 쿼리를 만든다.
+LOOKUP_BATCH_SIZE = 5_000
+CHECKPOINT_TABLE = "import_checkpoint"
+# SQLAlchemy의 SQLite DateTime 저장 형식과 같게 맞춘다.
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+logger = logging.getLogger(__name__)
+
+
+class UserImport(UserCreate):
+    created_at: Optional[datetime] = None
+
+
+class PostImport(PostCreate):
+    created_at: Optional[datetime] = None
+
+
+class CommentImport(CommentCreate):
+    post_id: int
+    created_at: Optional[datetime] = None
+
+
+class ImportReport:
+    def __init__(self, kind: str, source: str):
+        self.kind = kind
+        self.source = source
+        self.imported = 0
+        self.rejected = 0
+        self.resumed_from = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return (self.imported + self.rejected) / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "source": self.source,
+            "imported": self.imported,
+            "rejected": self.rejected,
+            "resumed_from": self.resumed_from,
+            "seconds": round(self.elapsed, 3),
+            "rows_per_second": round(self.rows_per_second),
+        }
+
+
+def read_records(path: Path) -> Iterator[Dict[str, Any]]:
+    with path.open(newline="", encoding="utf-8") as file:
+        if path.suffix.lower() == ".csv":
+            for record in csv.DictReader(file):
+                # CSV의 빈 칸은 값이 없는 것으로 본다.
+                yield {key: value if value != "" else None for key, value in record.items()}
+        else:
+            for line in file:
+                if line.strip():
+                    yield loads(line)
+
+
+def chunked(records: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    iterator = iter(records)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def format_datetime(value: Optional[datetime], default: str) -> str:
+    return value.strftime(DATETIME_FORMAT) if value else default
+
+
+def utcnow_text() -> str:
+    return datetime.utcnow().strftime(DATETIME_FORMAT)
+
+
+def plain_fields(schema: Type[BaseModel]) -> Dict[str, Tuple[Optional[type], bool, Any]]:
+    """
+    필드별로 (그대로 받아도 되는 타입, 필수 여부, 기본값)을 돌려준다.
+    제약 없는 str/int 필드만 타입이 정확히 같을 때 그대로 받고, 나머지 필드는 None일 때만 그대로 받는다.
+    """
+    fields = {}
+    for name, field in schema.__fields__.items():
+        info = field.field_info
+        constrained = any(
+            getattr(info, attr, None) is not None
+            for attr in ("max_length", "min_length", "regex", "gt", "ge", "lt", "le")
+        )
+        plain = field.type_ if field.type_ in (str, int) and not constrained else None
+        fields[name] = (plain, bool(field.required), field.default)
+    return fields
+
+
+def lookup(connection: Connection, query: str, ids: Iterable[Any]) -> List[Row]:
+    """query의 {ids} 자리에 IN 목록을 넣어 LOOKUP_BATCH_SIZE개씩 조회한다."""
+    ids = list(ids)
+    rows: List[Row] = []
+    for start in range(0, len(ids), LOOKUP_BATCH_SIZE):
+        batch = ids[start : start + LOOKUP_BATCH_SIZE]
+        parameters = {f"id{offset}": id for offset, id in enumerate(batch)}
+        placeholders = ", ".join(f":{name}" for name in parameters)
+        rows.extend(connection.exec_driver_sql(query.format(ids=placeholders), parameters))
+    return rows
+
+
+def existing_ids(connection: Connection, table: str, ids: Set[Any]) -> Set[Any]:
+    if not ids:
+        return set()
+    return {
+        row[0]
+        for row in lookup(connection, f'SELECT id FROM "{table}" WHERE id IN ({{ids}})', ids)
+    }
+
+
+class Importer(ABC):
+    kind = ""
+    schema: Type[BaseModel]
+    table: Table
+
+    def __init__(self, source: Path, bind: Engine = engine, chunk_size: int = CHUNK_SIZE):
+        self.source = source
+        self.bind = bind
+        self.chunk_size = chunk_size
+        self.fields = plain_fields(self.schema)
+        self.checkpoint_key = f"{self.kind}:{source.resolve()}"
+        columns = [column.name for column in self.table.columns]
+        self.insert_sql = (
+            f'INSERT INTO "{self.table.name}" ({", ".join(columns)}) '
+            f'VALUES ({", ".join(f":{column}" for column in columns)})'
+        )
+
+    def run(self) -> ImportReport:
+        report = ImportReport(self.kind, str(self.source))
+        create_db_and_tables(self.bind)
+        with self.bind.connect() as connection:
+            self.create_checkpoint_table(connection)
+            position = report.resumed_from = self.load_checkpoint(connection)
+            self.drop_indexes(connection)
+            try:
+                records = islice(read_records(self.source), position, None)
+                for chunk in chunked(records, self.chunk_size):
+                    with connection.begin():
+                        rows = self.prepare(chunk, position, connection)
+                        if rows:
+                            connection.exec_driver_sql(self.insert_sql, rows)
+                        position += len(chunk)
+                        self.save_checkpoint(connection, position)
+                    report.imported += len(rows)
+                    report.rejected += len(chunk) - len(rows)
+                    logger.info(
+                        "imported %d %s (%d rejected)", position, self.kind, report.rejected
+                    )
+            finally:
+                self.create_indexes(connection)
+            with connection.begin():
+                connection.exec_driver_sql(
+                    f"DELETE FROM {CHECKPOINT_TABLE} WHERE source = :source",
+                    {"source": self.checkpoint_key},
+                )
+        with Session(self.bind) as session:
+            repair_user_stats(session)
+            rebuild_activity_rollups(session)
+        report.elapsed = time.perf_counter() - report.started
+        return report
+
+    def validate(self, chunk: List[Dict[str, Any]], position: int) -> List[Tuple[int, Dict]]:
+        valid = []
+        for offset, record in enumerate(chunk):
+            values = self.accept_plain(record)
+            if values is None:
+                values, _, error = validate_model(self.schema, record)
+                if error:
+                    self.reject(position + offset, str(error).replace("\n", " "))
+                    continue
+            valid.append((position + offset, values))
+        return valid
+
+    def accept_plain(self, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        모든 값이 이미 스키마 타입 그대로라 pydantic이 바꿀 것이 없으면 검증 결과와 같은 dict를 바로 만든다.
+        변환이 필요하거나 오류가 있을 수 있는 행은 None을 돌려 validate_model로 넘긴다.
+        """
+        values = {}
+        for name, (plain, required, default) in self.fields.items():
+            value = record.get(name)
+            if value is None:
+                if required or name in record and default is not None:
+                    return None
+                value = default
+            elif type(value) is not plain:
+                # CSV의 정수 칸은 문자열이므로, pydantic과 같은 결과가 나오는 ASCII 숫자만 바로 바꾼다.
+                if plain is not int or type(value) is not str:
+                    return None
+                if not (value.isascii() and value.isdigit()):
+                    return None
+                value = int(value)
+            values[name] = value
+        return values
+
+    @abstractmethod
+    def prepare(
+        self, chunk: List[Dict[str, Any]], position: int, connection: Connection
+    ) -> List[Dict[str, Any]]:
+        """청크를 검증하고 외래 키를 확인해 insert_sql에 넘길 행 dict 목록을 만든다."""
+
+    def reject(self, index: int, reason: str) -> None:
+        logger.warning("rejected %s #%d: %s", self.kind, index + 1, reason)
+
+    def create_checkpoint_table(self, connection: Connection) -> None:
+        with connection.begin():
+            connection.exec_driver_sql(
+                f"CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} "
+                "(source TEXT PRIMARY KEY, position INTEGER NOT NULL)"
+            )
+
+    def load_checkpoint(self, connection: Connection) -> int:
+        position = connection.exec_driver_sql(
+            f"SELECT position FROM {CHECKPOINT_TABLE} WHERE source = :source",
+            {"source": self.checkpoint_key},
+        ).scalar()
+        connection.rollback()
+        return position or 0
+
+    def save_checkpoint(self, connection: Connection, position: int) -> None:
+        connection.exec_driver_sql(
+            f"INSERT INTO {CHECKPOINT_TABLE} (source, position) VALUES (:source, :position) "
+            "ON CONFLICT(source) DO UPDATE SET position = excluded.position",
+            {"source": self.checkpoint_key, "position": position},
+        )
+
+    def drop_indexes(self, connection: Connection) -> None:
+        with connection.begin():
+            for index in self.table.indexes:
+                connection.exec_driver_sql(f'DROP INDEX IF EXISTS "{index.name}"')
+
+    def create_indexes(self, connection: Connection) -> None:
+        with connection.begin():
+            for index in self.table.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
+
+
+class UserImporter(Importer):
+    kind = "users"
+    schema = UserImport
+    table = User.__table__  # type: ignore
+
+    def prepare(
+        self, chunk: List[Dict[str, Any]], position: int, connection: Connection
+    ) -> List[Dict[str, Any]]:
+        valid = self.validate(chunk, position)
+        taken = existing_ids(connection, "user", {values["id"] for _, values in valid})
+        now = utcnow_text()
+        rows = []
+        for index, values in valid:
+            if values["id"] in taken:
+                self.reject(index, f"이미 있는 사용자입니다: {values['id']}")
+                continue
+            try:
+                check_password(values["password"])
+            except ValueError as e:
+                self.reject(index, str(e))
+                continue
+            taken.add(values["id"])
+            values["role"] = (values["role"] or Role.MEMBER).name
+            values["created_at"] = format_datetime(values["created_at"], now)
+            values["version"] = 1
+            rows.append(values)
+        return rows
+
+
+class PostImporter(Importer):
+    kind = "posts"
+    schema = PostImport
+    table = Post.__table__  # type: ignore
+
+    def prepare(
+        self, chunk: List[Dict[str, Any]], position: int, connection: Connection
+    ) -> List[Dict[str, Any]]:
+        valid = self.validate(chunk, position)
+        authors = existing_ids(connection, "user", {values["author_id"] for _, values in valid})
+        now = utcnow_text()
+        rows = []
+        for index, values in valid:
+            if values["author_id"] not in authors:
+                self.reject(index, f"작성자가 없습니다: {values['author_id']}")
+                continue
+            values["id"] = None
+            values["content"] = compress_text(values["content"])
+            values["created_at"] = format_datetime(values["created_at"], now)
+            values["version"] = 1
+            rows.append(values)
+        return rows
+
+
+class CommentImporter(Importer):
+    """
+    path를 미리 계산하기 위해 아이디를 직접 매긴다. (활성/보관 티어와 AUTOINCREMENT 시퀀스의 최대 아이디 다음부터)
+    부모 댓글은 앞선 청크나 DB(활성/보관 티어)에 있으면 IN 쿼리로, 같은 청크에 있으면 메모리에서 찾는다.
+    """
+
+    kind = "comments"
+    schema = CommentImport
+    table = Comment.__table__  # type: ignore
+
+    def prepare(
+        self, chunk: List[Dict[str, Any]], position: int, connection: Connection
+    ) -> List[Dict[str, Any]]:
+        valid = self.validate(chunk, position)
+        authors = existing_ids(connection, "user", {values["author_id"] for _, values in valid})
+        posts = existing_ids(connection, "post", {values["post_id"] for _, values in valid})
+        parent_ids = {values["parent_id"] for _, values in valid if values["parent_id"]}
+        parents = {
+            id: (post_id, path, depth)
+            for table in (Comment.__tablename__, CommentArchive.__tablename__)
+            for id, post_id, path, depth in lookup(
+                connection,
+                f"SELECT id, post_id, path, depth FROM {table} WHERE id IN ({{ids}})",
+                parent_ids,
+            )
+        }
+        next_id = self.max_id(connection) + 1
+        now = utcnow_text()
+        rows = []
+        for index, values in valid:
+            if values["author_id"] not in authors:
+                self.reject(index, f"작성자가 없습니다: {values['author_id']}")
+                continue
+            if values["post_id"] not in posts:
+                self.reject(index, f"게시글이 없습니다: {values['post_id']}")
+                continue
+            parent = parents.get(values["parent_id"]) if values["parent_id"] else None
+            if values["parent_id"] and (not parent or parent[0] != values["post_id"]):
+                self.reject(index, f"부모 댓글이 없습니다: {values['parent_id']}")
+                continue
+
+            values["id"] = next_id
+            values["path"] = (parent[1] if parent else "") + Comment.path_segment(next_id)
+            values["depth"] = parent[2] + 1 if parent else 0
+            values["content"] = compress_text(values["content"])
+            values["created_at"] = format_datetime(values["created_at"], now)
+            values["version"] = 1
+            parents[next_id] = (values["post_id"], values["path"], values["depth"])
+            rows.append(values)
+            next_id += 1
+        return rows
+
+    def max_id(self, connection: Connection) -> int:
+        # 지워진 댓글의 아이디도 다시 쓰지 않도록 AUTOINCREMENT 시퀀스까지 본다.
+        sequence = connection.exec_driver_sql(
+            "SELECT seq FROM sqlite_sequence WHERE name = :name", {"name": Comment.__tablename__}
+        ).scalar()
+        return max(
+            sequence or 0,
+            *(
+                connection.exec_driver_sql(f"SELECT max(id) FROM {table}").scalar() or 0
+                for table in (Comment.__tablename__, CommentArchive.__tablename__)
+            ),
+        )
+
+
+IMPORTERS: Dict[str, Type[Importer]] = {
+    UserImporter.kind: UserImporter,
+    PostImporter.kind: PostImporter,
+    CommentImporter.kind: CommentImporter,
+}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="JSONL/CSV 파일에서 데이터를 대량으로 가져옵니다.")
+    parser.add_argument("kind", choices=sorted(IMPORTERS))
+    parser.add_argument("source", type=Path, help="*.jsonl 또는 *.csv 파일")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    importer = IMPORTERS[args.kind](args.source, chunk_size=args.chunk_size)
+    report = importer.run()
+    print(json.dumps(report.as_dict(), ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.orm.util import identity_key
+from sqlmodel import Session, select
+
+from model import User
+
+
+class AuthorLoader:
+    """
+    요청 단위 작성자 로더.
+    같은 이벤트 루프 틱 안에서 요청된 author_id를 모아 IN 쿼리 한 번으로 조회하고,
+    조회한 User는 세션 identity map에 올라가 Post.user/Comment.user 접근 시 추가 쿼리가 없다.
+    """
+
+    def __init__(self, session: Session):
+        self.session = session
+        self._pending: Dict[str, List["asyncio.Future[Optional[User]]"]] = {}
+        self._scheduled = False
+
+    def load(self, author_id: str) -> "asyncio.Future[Optional[User]]":
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[Optional[User]]" = loop.create_future()
+        cached = self.session.identity_map.get(identity_key(User, author_id))
+        if cached is not None:
+            future.set_result(cached)
+            return future
+
+        self._pending.setdefault(author_id, []).append(future)
+        if not self._scheduled:
+            self._scheduled = True
+            loop.call_soon(self._dispatch)
+        return future
+
+    async def load_many(self, author_ids: Iterable[str]) -> List[Optional[User]]:
+        return list(await asyncio.gather(*(self.load(author_id) for author_id in author_ids)))
+
+    def _dispatch(self) -> None:
+        pending, self._pending, self._scheduled = self._pending, {}, False
+        try:
+            query = select(User).where(User.id.in_(list(pending)))  # type: ignore
+            found = {user.id: user for user in self.session.exec(query)}
+        except Exception as e:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        for author_id, futures in pending.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(found.get(author_id))
+
+
+author_loader: ContextVar[Optional[AuthorLoader]] = ContextVar("author_loader", default=None)
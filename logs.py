@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+REQUEST_ID_HEADER = "x-request-id"
+MAX_REQUEST_ID_LENGTH = 128
+# 같은 위치에서 나는 오류 로그는 ERROR_LOG_INTERVAL초에 ERROR_LOG_BURST개까지만 남긴다.
+ERROR_LOG_INTERVAL = 60.0
+ERROR_LOG_BURST = 5
+# LogRecord 기본 속성. 이 밖의 속성은 extra로 넘어온 값으로 보고 JSON에 함께 쓴다.
+RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message",
+    "asctime",
+    "request_id",
+}
+
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+
+class RequestIdFilter(logging.Filter):
+    """로그를 남긴 시점(요청을 처리하는 스레드/태스크)의 request_id를 레코드에 붙인다."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+class ErrorRateLimitFilter(logging.Filter):
+    """
+    ERROR 이상 로그를 (로거, 파일, 줄) 단위로 interval 동안 burst개까지만 통과시킨다.
+    버려진 개수는 다음에 통과하는 로그의 suppressed 필드로 알린다.
+    """
+
+    def __init__(self, interval: float = ERROR_LOG_INTERVAL, burst: int = ERROR_LOG_BURST):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._windows: Dict[Tuple[str, str, int], Tuple[float, int, int]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.ERROR:
+            return True
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            started, passed, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - started >= self.interval:
+                started, passed = now, 0
+            if passed >= self.burst:
+                self._windows[key] = (started, passed, suppressed + 1)
+                return False
+            self._windows[key] = (started, passed + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class JsonQueueHandler(QueueHandler):
+    """
+    호출한 스레드에서는 JSON 문자열을 만들어 큐에 넣기만 하고,
+    실제 출력은 QueueListener 스레드가 맡아 이벤트 루프가 I/O에 막히지 않게 한다.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        message = self.format(record)
+        return logging.makeLogRecord(
+            {
+                "name": record.name,
+                "levelno": record.levelno,
+                "levelname": record.levelname,
+                "msg": message,
+                "args": None,
+                "exc_info": None,
+            }
+        )
+
+
+log_listener: Optional[QueueListener] = None
+log_handler: Optional[QueueHandler] = None
+
+
+def setup_logging(level: str = LOG_LEVEL, stream=sys.stdout) -> QueueListener:
+    """루트 로거에 큐 핸들러를 달고 출력 스레드를 시작한다. 여러 번 불러도 한 번만 설정한다."""
+    global log_listener, log_handler
+    if log_listener is not None:
+        return log_listener
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    log_handler = JsonQueueHandler(log_queue)
+    log_handler.setFormatter(JsonFormatter())
+    log_handler.addFilter(RequestIdFilter())
+    log_handler.addFilter(ErrorRateLimitFilter())
+
+    root = logging.getLogger()
+    root.addHandler(log_handler)
+    root.setLevel(level)
+
+    log_listener = QueueListener(log_queue, logging.StreamHandler(stream))
+    log_listener.start()
+    return log_listener
+
+
+def shutdown_logging() -> None:
+    """큐에 남은 로그를 모두 쓴 뒤 출력 스레드를 멈춘다."""
+    global log_listener, log_handler
+    if log_handler is not None:
+        logging.getLogger().removeHandler(log_handler)
+        log_handler = None
+    if log_listener is not None:
+        log_listener.stop()
+        log_listener = None
+
+
+class RequestIdMiddleware:
+    """X-Request-ID 헤더를 받거나 새로 만들어 로그 컨텍스트에 두고, 응답 헤더로 돌려준다."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        current_id = Headers(scope=scope).get(REQUEST_ID_HEADER, "")
+        if (
+            not current_id
+            or len(current_id) > MAX_REQUEST_ID_LENGTH
+            or not current_id.isprintable()
+        ):
+            current_id = uuid.uuid4().hex
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(raw=message.setdefault("headers", []))["X-Request-ID"] = current_id
+            await send(message)
+
+        token = request_id.set(current_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id.reset(token)
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from types import FrameType
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from logs import request_id
+from profiler import collapse
+
+LAG_INTERVAL = 0.05
+BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100")) / 1000
+# 최근 LAG_WINDOW개(기본 간격으로 약 1분) 측정값으로 백분위수를 낸다.
+LAG_WINDOW = 1_200
+RECENT_BLOCKS = 50
+ORIGIN_MODULES = ("api.py", "service.py")
+
+# 요청을 처리하는 미들웨어 프레임별 (scope, request_id)
+RequestInfo = Tuple[Scope, Optional[str]]
+
+logger = logging.getLogger(__name__)
+
+
+def find_origins(frame, modules: Tuple[str, ...]) -> Dict[str, str]:
+    """모듈별로 스택의 가장 안쪽 프레임을 찾는다. (예: service.py에서 막고 있는 함수)"""
+    origins: Dict[str, str] = {}
+    while frame is not None:
+        filename = Path(frame.f_code.co_filename).name
+        if filename in modules and filename not in origins:
+            origins[filename] = f"{frame.f_code.co_name} ({filename}:{frame.f_lineno})"
+        frame = frame.f_back
+    return origins
+
+
+def route_name(scope: Optional[Scope]) -> Optional[str]:
+    if scope is None:
+        return None
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope.get("path")
+    return f"{scope.get('method', 'WS')} {path}"
+
+
+class LoopMonitor:
+    """
+    이벤트 루프에서 interval마다 깨어나 예정보다 늦게 깨어난 만큼을 지연(lag)으로 잰다.
+    루프가 막혀 있으면 이 측정도 멈추므로, 별도 watchdog 스레드가 마지막 측정 시각을 보고 threshold를 넘기면
+    그 순간의 루프 스레드 스택과 실행 중인 요청(라우트, request_id)을 기록한다.
+    실행 중인 요청은 스택을 거슬러 올라가며 LoopMonitorMiddleware가 남긴 프레임을 찾아 알아낸다.
+    실행 중인 코루틴은 await으로 이어진 바깥 코루틴 프레임까지 스택에 올라 있으므로, 동시에 여러 요청이 대기 중이어도
+    루프를 막고 있는 요청 하나만 찾을 수 있다.
+    """
+
+    def __init__(
+        self,
+        interval: float = LAG_INTERVAL,
+        threshold: float = BLOCK_THRESHOLD,
+        window: int = LAG_WINDOW,
+        modules: Tuple[str, ...] = ORIGIN_MODULES,
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self.modules = modules
+        self.lags: Deque[float] = deque(maxlen=window)
+        self.max_lag = 0.0
+        self.block_count = 0
+        self.recent_blocks: Deque[Dict[str, Any]] = deque(maxlen=RECENT_BLOCKS)
+        self._requests: Dict[FrameType, RequestInfo] = {}
+        self._loop_thread_id: Optional[int] = None
+        self._beat: Optional[float] = None
+        self._pending: Optional[Tuple[float, Dict[str, Any]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._measure())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+        self._beat = None
+
+    def track(self, frame: FrameType, scope: Scope, current_id: Optional[str]) -> None:
+        self._requests[frame] = (scope, current_id)
+
+    def untrack(self, frame: FrameType) -> None:
+        self._requests.pop(frame, None)
+
+    def find_request(self, frame: Optional[FrameType]) -> Tuple[Optional[Scope], Optional[str]]:
+        while frame is not None:
+            info = self._requests.get(frame)
+            if info is not None:
+                return info
+            frame = frame.f_back
+        return None, None
+
+    async def _measure(self) -> None:
+        while True:
+            started = self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.record(max(0.0, time.monotonic() - started - self.interval), started)
+
+    def record(self, lag: float, started: float) -> None:
+        with self._lock:
+            self.lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            # watchdog이 잡아 둔 막힘이면, 루프가 풀린 지금에야 알 수 있는 전체 시간을 채운다.
+            if self._pending is not None and self._pending[0] == started:
+                self._pending[1]["blocked_ms"] = round(lag * 1000, 3)
+                self._pending = None
+
+    def _watch(self) -> None:
+        captured = None
+        while not self._stopped.wait(min(self.interval, self.threshold / 2)):
+            beat = self._beat
+            if beat is None or beat == captured:
+                continue
+            blocked = time.monotonic() - beat - self.interval
+            if blocked >= self.threshold:
+                captured = beat
+                self.capture(beat, blocked)
+
+    def capture(self, beat: float, blocked: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)  # type: ignore
+        scope, current_id = self.find_request(frame)
+        block = {
+            "at": datetime.utcnow().isoformat(),
+            "blocked_ms": round(blocked * 1000, 3),
+            "route": route_name(scope),
+            "request_id": current_id,
+            "origin": find_origins(frame, self.modules),
+            "stack": collapse(frame),
+        }
+        with self._lock:
+            self.block_count += 1
+            self.recent_blocks.append(block)
+            self._pending = (beat, block)
+        logger.warning(
+            "event loop blocked for %.0fms in %s", blocked * 1000, block["route"], extra=block
+        )
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            lags = sorted(self.lags)
+            blocks = list(self.recent_blocks)
+
+        def percentile(p: float) -> Optional[float]:
+            if not lags:
+                return None
+            return round(lags[min(len(lags) - 1, int(len(lags) * p))] * 1000, 3)
+
+        return {
+            "running": self._task is not None,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "lag_ms": {
+                "current": round(self.lags[-1] * 1000, 3) if self.lags else None,
+                "p50": percentile(0.5),
+                "p99": percentile(0.99),
+                "max": round(self.max_lag * 1000, 3),
+            },
+            "blocks": self.block_count,
+            "recent_blocks": blocks,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self.lags.clear()
+            self.max_lag = 0.0
+            self.block_count = 0
+            self.recent_blocks.clear()
+            self._pending = None
+
+
+loop_monitor = LoopMonitor()
+
+
+class LoopMonitorMiddleware:
+    """이 미들웨어의 프레임과 scope를 연결해, 루프가 막혔을 때 어느 요청 때문인지 알 수 있게 한다."""
+
+    def __init__(self, app: ASGIApp, monitor: LoopMonitor = loop_monitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        frame = sys._getframe()
+        self.monitor.track(frame, scope, request_id.get())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.monitor.untrack(frame)
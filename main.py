@@ -1,14 +1,162 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import List
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import Session
 
 from api import router as post_router
-from database import create_db_and_tables
+from archive import ARCHIVE_AFTER, ARCHIVE_INTERVAL, archive_comments
+from backup import BACKUP_INTERVAL, backup_manager
+from changelog import CHANGE_LOG_RETENTION, prune_change_log
+from column_types import compress_existing_rows
+from compression import CompressionMiddleware
+from database import create_db_and_tables, engine, warm_pool
+from idempotency import IdempotencyMiddleware
+from logs import RequestIdMiddleware, setup_logging, shutdown_logging
+from loopmonitor import LoopMonitorMiddleware, loop_monitor
+from model import Comment, Post
+from nicknames import REFRESH_INTERVAL as NICKNAME_REFRESH_INTERVAL
+from profiler import ProfilerMiddleware
+from response_cache import ResponseCacheMiddleware
+from rollup import rebuild_activity_rollups
+from service import (
+    repair_user_stats,
+    save_trending_snapshot,
+    warm_nickname_index,
+    warm_recent_feed,
+    warm_trending,
+)
+from startup import startup_report
+from trending import SNAPSHOT_INTERVAL, trending_index
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
+background_tasks: List[asyncio.Task] = []
+
+
+def snapshot_trending() -> None:
+    taken_at, scores = trending_index.snapshot()
+    with Session(engine) as session:
+        save_trending_snapshot(taken_at, scores, session)
+
+
+async def snapshot_trending_periodically() -> None:
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            await run_in_threadpool(snapshot_trending)
+        except Exception:
+            logger.exception("trending snapshot failed")
+
+
+def archive_old_comments() -> None:
+    with Session(engine) as session:
+        moved = archive_comments(datetime.utcnow() - ARCHIVE_AFTER, session)
+    if moved:
+        logger.info("archived %d comments", moved)
+    with Session(engine) as session:
+        pruned = prune_change_log(datetime.utcnow() - CHANGE_LOG_RETENTION, session)
+    if pruned:
+        logger.info("pruned %d change log entries", pruned)
+
+
+async def archive_comments_periodically() -> None:
+    while True:
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+        try:
+            await run_in_threadpool(archive_old_comments)
+        except Exception:
+            logger.exception("comment archiving failed")
+
+
+async def backup_periodically() -> None:
+    while True:
+        await asyncio.sleep(BACKUP_INTERVAL)
+        try:
+            await run_in_threadpool(backup_manager.backup)
+        except Exception:
+            logger.exception("scheduled backup failed")
+
+
+def refresh_nickname_index() -> None:
+    with Session(engine) as session:
+        warm_nickname_index(session)
+
+
+async def refresh_nickname_index_periodically() -> None:
+    while True:
+        await asyncio.sleep(NICKNAME_REFRESH_INTERVAL)
+        try:
+            await run_in_threadpool(refresh_nickname_index)
+        except Exception:
+            logger.exception("nickname index refresh failed")
+
+
+def compress_large_contents() -> None:
+    with engine.connect() as connection:
+        for model in (Post, Comment):
+            table = model.__table__  # type: ignore
+            compress_existing_rows(connection, table, table.c.content)
+
+
+@app.on_event("startup")
+def start_logging():
+    setup_logging()
 
 
 @app.on_event("startup")
 def on_startup():
-    create_db_and_tables()
+    with startup_report.step("create_db_and_tables"):
+        schema_changed = create_db_and_tables()
+    if schema_changed:
+        # 스키마가 바뀌었으면(user_stats, 롤업 테이블이 새로 생긴 경우 포함) 집계를 처음부터 다시 맞춘다.
+        with startup_report.step("repair_user_stats"), Session(engine) as session:
+            repair_user_stats(session)
+        with startup_report.step("rebuild_activity_rollups"), Session(engine) as session:
+            rebuild_activity_rollups(session)
+        # content가 CompressedText로 바뀌기 전에 저장된 큰 본문을 압축한다.
+        with startup_report.step("compress_large_contents"):
+            compress_large_contents()
+    with startup_report.step("warm_pool"):
+        warm_pool()
+    with startup_report.step("warm_recent_feed"), Session(engine) as session:
+        warm_recent_feed(session)
+    with startup_report.step("warm_trending"), Session(engine) as session:
+        warm_trending(session)
+    with startup_report.step("warm_nickname_index"), Session(engine) as session:
+        warm_nickname_index(session)
+    with startup_report.step("openapi"):
+        app.openapi()
+    startup_report.finish()
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    await loop_monitor.start()
+    background_tasks.append(asyncio.create_task(snapshot_trending_periodically()))
+    background_tasks.append(asyncio.create_task(archive_comments_periodically()))
+    background_tasks.append(asyncio.create_task(backup_periodically()))
+    background_tasks.append(asyncio.create_task(refresh_nickname_index_periodically()))
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    await loop_monitor.stop()
+    snapshot_trending()
+    shutdown_logging()
 
 
 app.include_router(post_router)
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ResponseCacheMiddleware)
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(LoopMonitorMiddleware)
+app.add_middleware(RequestIdMiddleware)
@@ -1,17 +1,40 @@
 import re
 from datetime import datetime
 from enum import Enum
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 from pydantic import validator
+from sqlalchemy import Column, Index, LargeBinary
 from sqlmodel import Field, Relationship, SQLModel
 
+from column_types import CompressedText
+
+
+def check_password(password: str) -> str:
+    if len(password) < 8:
+        raise ValueError("비밀번호는 최소 8자 이상이어야 합니다.")
+
+    if not re.search(r"[A-Z]", password):
+        raise ValueError("비밀번호에는 최소 1개의 대문자가 포함되어야 합니다.")
+
+    return password
+
 
 class Role(str, Enum):
     MEMBER = "member"
     ADMIN = "admin"
 
 
+class Granularity(str, Enum):
+    HOUR = "hour"
+    DAY = "day"
+
+
+class ChangeEntity(str, Enum):
+    POST = "post"
+    COMMENT = "comment"
+
+
 class User(SQLModel, table=True):  # type: ignore
     id: str = Field(primary_key=True)
     posts: List["Post"] = Relationship(back_populates="user")
@@ -19,33 +42,193 @@ class User(SQLModel, table=True):  # type: ignore
     password: str = Field()
     nickname: Optional[str] = Field(max_length=20, index=True)
     role: Role = Field(default=Role.MEMBER, max_length=20)
-    created_at: datetime = Field(default=datetime.utcnow())
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    # 수정할 때마다 1씩 올린다. ETag/If-Match 낙관적 동시성 제어에 쓴다.
+    version: int = Field(default=1)
 
     @validator("password")
     def validate_password(cls, password: str):
-        if len(password) < 8:
-            raise ValueError("비밀번호는 최소 8자 이상이어야 합니다.")
-
-        if not re.search(r"[A-Z]", password):
-            raise ValueError("비밀번호에는 최소 1개의 대문자가 포함되어야 합니다.")
-
-        return password
+        return check_password(password)
 
 
 class Post(SQLModel, table=True):  # type: ignore
     id: Optional[int] = Field(default=None, primary_key=True)
     title: str
-    content: Optional[str]
+    content: Optional[str] = Field(default=None, sa_column=Column(CompressedText()))
     author_id: str = Field(foreign_key="user.id")
     user: Optional[User] = Relationship(back_populates="posts")
     comments: List["Comment"] = Relationship(back_populates="post")
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = Field(default=1)
 
 
 class Comment(SQLModel, table=True):  # type: ignore
+    __table_args__ = (
+        Index("ix_comment_post_id_path", "post_id", "path"),
+        # 보관 티어로 옮긴 댓글의 아이디를 다시 쓰지 않도록 한다.
+        {"sqlite_autoincrement": True},
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     author_id: str = Field(foreign_key="user.id")
     user: User = Relationship(back_populates="comments")
     post_id: int = Field(foreign_key="post.id")
     post: Post = Relationship(back_populates="comments")
-    content: Optional[str]
-    created_at: datetime = Field(default=datetime.utcnow())
+    content: Optional[str] = Field(default=None, sa_column=Column(CompressedText()))
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    parent_id: Optional[int] = Field(default=None, foreign_key="comment.id")
+    # 루트부터 자신까지의 아이디를 0으로 채운 10자리로 이은 경로. (예: "0000000001/0000000005/")
+    path: str = Field(default="")
+    depth: int = Field(default=0)
+    version: int = Field(default=1)
+
+    @staticmethod
+    def path_segment(comment_id: int) -> str:
+        return f"{comment_id:010d}/"
+
+    @staticmethod
+    def subtree_end(path: str) -> str:
+        """path와 그 하위 댓글의 경로보다 큰 가장 작은 경로. ("/" 다음 문자는 "0")"""
+        return path[:-1] + chr(ord("/") + 1)
+
+
+class TrendingScore(SQLModel, table=True):  # type: ignore
+    __tablename__ = "trending_score"
+
+    post_id: int = Field(primary_key=True)
+    score: float
+    snapshot_at: datetime
+
+
+class CommentArchive(SQLModel, table=True):  # type: ignore
+    """오래된 댓글의 보관 티어. 아이디를 그대로 유지하고 content는 zlib으로 압축해 저장한다."""
+
+    __tablename__ = "comment_archive"
+    __table_args__ = (
+        Index("ix_comment_archive_post_id_id", "post_id", "id"),
+        Index("ix_comment_archive_author_id_id", "author_id", "id"),
+        Index("ix_comment_archive_post_id_path", "post_id", "path"),
+    )
+
+    id: int = Field(primary_key=True)
+    author_id: str
+    post_id: int
+    content: Optional[bytes] = Field(default=None, sa_column=Column(LargeBinary))
+    created_at: datetime
+    parent_id: Optional[int] = None
+    path: str = Field(default="")
+    depth: int = Field(default=0)
+    version: int = Field(default=1)
+    archived_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class UserStats(SQLModel, table=True):  # type: ignore
+    """사용자별 게시글/댓글 수와 마지막 작성 시각. 생성·삭제와 같은 트랜잭션에서 증감한다."""
+
+    __tablename__ = "user_stats"
+
+    user_id: str = Field(primary_key=True)
+    post_count: int = Field(default=0)
+    comment_count: int = Field(default=0)
+    last_activity_at: Optional[datetime] = None
+
+
+class ActivityRollup(SQLModel, table=True):  # type: ignore
+    """
+    시간/일 단위 게시글·댓글 수. 작성·삭제와 같은 트랜잭션에서 작성 시각이 속한 구간을 증감한다.
+    bucket은 구간의 시작 시각이다.
+    """
+
+    __tablename__ = "activity_rollup"
+
+    granularity: Granularity = Field(primary_key=True, max_length=10)
+    bucket: datetime = Field(primary_key=True)
+    post_count: int = Field(default=0)
+    comment_count: int = Field(default=0)
+
+
+class AuthorActivityRollup(SQLModel, table=True):  # type: ignore
+    """
+    작성자별 일 단위 게시글·댓글 수. 기간별 활동이 많은 작성자를 구할 때 쓴다.
+    post_total/comment_total은 그 작성자의 그날까지의 누적 합이라, 기간 합계는 두 날의 누적 합의 차이다.
+    """
+
+    __tablename__ = "author_activity_rollup"
+    __table_args__ = (Index("ix_author_activity_rollup_author_id_day", "author_id", "day"),)
+
+    day: datetime = Field(primary_key=True)
+    author_id: str = Field(primary_key=True)
+    post_count: int = Field(default=0)
+    comment_count: int = Field(default=0)
+    post_total: int = Field(default=0)
+    comment_total: int = Field(default=0)
+
+
+class ChangeLog(SQLModel, table=True):  # type: ignore
+    """
+    게시글/댓글의 생성·수정·삭제 기록. 아래 트리거가 쓰기 문장 안에서 남기며, seq가 동기화 커서가 된다.
+    AUTOINCREMENT로 지운 seq를 다시 쓰지 않게 한다.
+    """
+
+    __tablename__ = "change_log"
+    __table_args__ = (
+        Index("ix_change_log_entity_seq", "entity", "seq"),
+        Index("ix_change_log_post_id_entity_seq", "post_id", "entity", "seq"),
+        {"sqlite_autoincrement": True},
+    )
+
+    seq: Optional[int] = Field(default=None, primary_key=True)
+    entity: ChangeEntity = Field(max_length=10)
+    entity_id: int
+    # 댓글이면 속한 게시글, 게시글이면 자기 자신의 아이디
+    post_id: int
+    deleted: bool = Field(default=False)
+    changed_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+def change_trigger(
+    table: str, event: str, entity: ChangeEntity, post_id: str, when: str = ""
+) -> Tuple[str, str]:
+    """(트리거 이름, CREATE TRIGGER 문)을 돌려준다."""
+    name = f"{table}_{event.lower()}_change"
+    row = "OLD" if event == "DELETE" else "NEW"
+    deleted = int(event == "DELETE")
+    # SQLAlchemy의 SQLite DateTime 저장 형식(마이크로초 6자리)에 맞춘다.
+    changed_at = "strftime('%Y-%m-%d %H:%M:%f', 'now') || '000'"
+    return name, (
+        f"CREATE TRIGGER {name} AFTER {event} ON {table} {when} "
+        "BEGIN INSERT INTO change_log (entity, entity_id, post_id, deleted, changed_at) "
+        f"VALUES ('{entity.value}', {row}.id, {row}.{post_id}, {deleted}, {changed_at}); END"
+    )
+
+
+# 쓰기 경로(API, importer.py)와 상관없이 같은 문장 안에서 변경 기록을 남긴다.
+# - 수정은 version이 바뀐 경우만 남긴다. (본문 압축, path 채우기 같은 내부 갱신 제외)
+# - 보관 티어로 옮기면서 지우는 댓글은 삭제로 남기지 않는다. 보관 티어에서 지울 때 남긴다.
+CHANGE_TRIGGERS = {
+    "post": [
+        change_trigger("post", "INSERT", ChangeEntity.POST, "id"),
+        change_trigger(
+            "post", "UPDATE", ChangeEntity.POST, "id", "WHEN NEW.version != OLD.version"
+        ),
+        change_trigger("post", "DELETE", ChangeEntity.POST, "id"),
+    ],
+    "comment": [
+        change_trigger("comment", "INSERT", ChangeEntity.COMMENT, "post_id"),
+        change_trigger(
+            "comment", "UPDATE", ChangeEntity.COMMENT, "post_id", "WHEN NEW.version != OLD.version"
+        ),
+        change_trigger(
+            "comment",
+            "DELETE",
+            ChangeEntity.COMMENT,
+            "post_id",
+            "WHEN NOT EXISTS (SELECT 1 FROM comment_archive WHERE id = OLD.id)",
+        ),
+    ],
+    "comment_archive": [
+        change_trigger("comment_archive", "DELETE", ChangeEntity.COMMENT, "post_id")
+    ],
+}
+for table_name, triggers in CHANGE_TRIGGERS.items():
+    SQLModel.metadata.tables[table_name].info["triggers"] = dict(triggers)
@@ -0,0 +1,71 @@
+import os
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 접두사 범위의 끝. 유니코드에서 가장 큰 문자이므로 접두사로 시작하는 모든 문자열보다 크다.
+PREFIX_END = "\U0010ffff"
+# 다른 프로세스(워커, importer.py)에서 바뀐 닉네임을 반영하려고 이 주기마다 DB에서 다시 만든다.
+REFRESH_INTERVAL = float(os.getenv("NICKNAME_INDEX_REFRESH_SECONDS", "300"))
+
+
+class NicknameIndex:
+    """
+    (닉네임, 사용자 아이디) 정렬 배열로 닉네임 접두사 검색을 한다.
+    접두사로 시작하는 항목은 배열에서 연속되므로 이진 탐색 한 번과 limit개 순회로 끝난다.
+    SQLite의 기본(BINARY) 정렬과 같은 코드 포인트 순서이며 대소문자를 구분한다.
+
+    - 프로세스마다 따로 두는 인덱스다. 이 프로세스의 쓰기 훅으로만 바로 갱신되고, 다른 워커나 importer.py가 바꾼
+      닉네임은 REFRESH_INTERVAL마다 다시 만들 때 반영된다.
+    - put은 insort로 배열 중간에 끼워 넣어 O(n)이지만, 100만 명이어도 포인터 이동 수 ms 수준이고
+      닉네임 변경은 검색보다 훨씬 드물어 받아들인다.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._entries: List[Tuple[str, str]] = []
+        self._nicknames: Dict[str, str] = {}
+
+    def build(self, users: Iterable[Tuple[str, Optional[str]]]) -> None:
+        nicknames = {user_id: nickname for user_id, nickname in users if nickname}
+        entries = sorted((nickname, user_id) for user_id, nickname in nicknames.items())
+        self._nicknames, self._entries = nicknames, entries
+        self.ready = True
+
+    def put(self, user_id: str, nickname: Optional[str]) -> None:
+        if not self.ready:
+            return
+        self.remove(user_id)
+        if nickname:
+            self._nicknames[user_id] = nickname
+            insort(self._entries, (nickname, user_id))
+
+    def remove(self, user_id: str) -> None:
+        nickname = self._nicknames.pop(user_id, None)
+        if nickname is None:
+            return
+        index = bisect_left(self._entries, (nickname, user_id))
+        if index < len(self._entries) and self._entries[index] == (nickname, user_id):
+            del self._entries[index]
+
+    def search(self, prefix: str, limit: int) -> List[Tuple[str, str]]:
+        """접두사로 시작하는 (사용자 아이디, 닉네임)을 닉네임 순으로 limit개까지 돌려준다."""
+        results: List[Tuple[str, str]] = []
+        index = bisect_left(self._entries, (prefix, ""))
+        while index < len(self._entries) and len(results) < limit:
+            nickname, user_id = self._entries[index]
+            if not nickname.startswith(prefix):
+                break
+            results.append((user_id, nickname))
+            index += 1
+        return results
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        self.ready = False
+        self._entries = []
+        self._nicknames = {}
+
+
+nickname_index = NicknameIndex()
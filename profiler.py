@@ -0,0 +1,124 @@
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from pathlib import Path
+from types import FrameType
+from typing import Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PROFILE_HEADER = "x-profile"
+# 헤더 값이 이 토큰과 같을 때만 프로파일링한다. 비어 있으면 헤더로는 켤 수 없다.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+# N개 요청 중 1개를 무작위로 프로파일링한다. 0이면 끈다.
+PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+SAMPLE_INTERVAL = 0.001
+
+
+def collapse(frame: Optional[FrameType]) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """
+    별도 스레드에서 대상 스레드의 스택을 interval 마다 수집해 collapsed stack 형식으로 센다.
+    요청은 이벤트 루프 스레드에서 실행되므로, 같은 시각에 처리 중인 다른 요청의 스택도 함께 잡힐 수 있다.
+    """
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.counts[collapse(frame)] += 1
+
+
+class ProfilerMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        token: str = PROFILE_TOKEN,
+        sample_rate: int = PROFILE_SAMPLE_RATE,
+        directory: str = PROFILE_DIR,
+        interval: float = SAMPLE_INTERVAL,
+    ):
+        self.app = app
+        self.token = token
+        self.sample_rate = sample_rate
+        self.directory = Path(directory)
+        self.interval = interval
+        self.enabled = bool(token) or sample_rate > 0
+        self.routes: Dict[str, Counter] = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self.enabled or scope["type"] != "http" or not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+
+        async def send_with_profile_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(raw=message.setdefault("headers", []))["X-Profile-Id"] = profile_id
+            await send(message)
+
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            # 샘플러 스레드가 끝나기를 이벤트 루프에서 기다리지 않는다.
+            await run_in_threadpool(sampler.stop)
+            endpoint = scope.get("endpoint")
+            route = endpoint.__name__ if endpoint else "unmatched"
+            await run_in_threadpool(self.save, route, profile_id, sampler.counts)
+
+    def should_profile(self, scope: Scope) -> bool:
+        if self.sample_rate and random.randrange(self.sample_rate) == 0:
+            return True
+        if not self.token:
+            return False
+        header = Headers(scope=scope).get(PROFILE_HEADER)
+        # ASCII가 아닌 헤더 값도 비교할 수 있게 바이트로 비교한다.
+        return header is not None and hmac.compare_digest(header.encode(), self.token.encode())
+
+    def save(self, route: str, profile_id: str, counts: Counter) -> None:
+        """요청별 파일과 라우트별 누적 파일을 speedscope에서 열 수 있는 collapsed stack 형식으로 쓴다."""
+        route_directory = self.directory / route
+        route_directory.mkdir(parents=True, exist_ok=True)
+        write_collapsed(route_directory / f"{profile_id}.folded", counts)
+        with self._lock:
+            self.routes[route].update(counts)
+            write_collapsed(self.directory / f"{route}.folded", self.routes[route])
+
+
+def write_collapsed(path: Path, counts: Counter) -> None:
+    lines = (f"{stack} {count}\n" for stack, count in counts.most_common())
+    path.write_text("".join(lines))
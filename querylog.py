@@ -0,0 +1,168 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Mapping, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SLOW_QUERY_THRESHOLD = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100")) / 1000
+REPORT_WINDOW = 5 * 60
+RECENT_SLOW_QUERIES = 50
+MAX_STATEMENTS = 1000
+ORIGIN_MODULES = ("service.py",)
+# 문자열/바이트 파라미터(비밀번호, 본문 등)는 이 값으로 바꿔 남긴다.
+REDACTED = "***"
+
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    __slots__ = ("statement", "count", "total", "max")
+
+    def __init__(self, statement: str):
+        self.statement = statement
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed: float) -> None:
+        self.count += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+
+
+def find_origin() -> Optional[str]:
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = Path(frame.f_code.co_filename).name
+        if filename in ORIGIN_MODULES:
+            return f"{frame.f_code.co_name} ({filename}:{frame.f_lineno})"
+        frame = frame.f_back  # type: ignore
+    return None
+
+
+def redact(parameters: Any) -> Any:
+    """숫자와 None만 그대로 두고 나머지 바인딩 값은 가린다."""
+
+    def mask(value: Any) -> Any:
+        return value if value is None or isinstance(value, (int, float)) else REDACTED
+
+    if isinstance(parameters, Mapping):
+        return {name: mask(value) for name, value in parameters.items()}
+    return tuple(mask(value) for value in parameters)
+
+
+def explain(cursor, statement: str, parameters: Any) -> Optional[List[str]]:
+    if statement.lstrip().upper().startswith(("EXPLAIN", "PRAGMA", "BEGIN", "COMMIT")):
+        return None
+    try:
+        rows = cursor.connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[-1] for row in rows.fetchall()]
+    except Exception:
+        return None
+
+
+class QueryLog:
+    """
+    SQL 실행 시간을 재고, threshold 를 넘는 쿼리는 바인딩 파라미터, 호출한 service.py 함수,
+    EXPLAIN QUERY PLAN 결과와 함께 로그로 남긴다. 파라미터는 비밀번호가 남지 않도록 가린다.
+    통계는 REPORT_WINDOW 단위의 두 구간(현재/직전)에 모아, 최근 구간의 총 소요 시간 상위 N개를 보여준다.
+    """
+
+    def __init__(self, threshold: float = SLOW_QUERY_THRESHOLD, window: float = REPORT_WINDOW):
+        self.threshold = threshold
+        self.window = window
+        self.recent_slow: Deque[Dict[str, Any]] = deque(maxlen=RECENT_SLOW_QUERIES)
+        self._current: Dict[str, QueryStats] = {}
+        self._previous: Dict[str, QueryStats] = {}
+        self._window_started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def install(self, engine: Engine) -> None:
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+        event.listen(engine, "handle_error", self.handle_error)
+
+    def uninstall(self, engine: Engine) -> None:
+        event.remove(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.remove(engine, "after_cursor_execute", self.after_cursor_execute)
+        event.remove(engine, "handle_error", self.handle_error)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    def handle_error(self, context) -> None:
+        # 실행이 실패하면 after_cursor_execute가 불리지 않으므로 시작 시각을 여기서 버린다.
+        connection = context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        elapsed = time.perf_counter() - started
+        self.record(statement, elapsed)
+        if elapsed < self.threshold:
+            return
+
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        slow_query = {
+            "statement": statement,
+            "parameters": redact(parameters),
+            "elapsed_ms": round(elapsed * 1000, 3),
+            "origin": find_origin(),
+            "plan": explain(cursor, statement, parameters)
+            if conn.dialect.name == "sqlite"
+            else None,
+        }
+        self.recent_slow.append(slow_query)
+        logger.warning("slow query %.3fms: %s", elapsed * 1000, statement, extra=slow_query)
+
+    def record(self, statement: str, elapsed: float) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_started >= self.window:
+                expired = now - self._window_started >= 2 * self.window
+                self._previous = {} if expired else self._current
+                self._current = {}
+                self._window_started = now
+            stats = self._current.get(statement)
+            if stats is None:
+                if len(self._current) >= MAX_STATEMENTS:
+                    return
+                stats = self._current[statement] = QueryStats(statement)
+            stats.add(elapsed)
+
+    def report(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            merged: Dict[str, QueryStats] = {}
+            for bucket in (self._previous, self._current):
+                for statement, stats in bucket.items():
+                    total = merged.setdefault(statement, QueryStats(statement))
+                    total.count += stats.count
+                    total.total += stats.total
+                    total.max = max(total.max, stats.max)
+        ranked = sorted(merged.values(), key=lambda stats: stats.total, reverse=True)[:limit]
+        return [
+            {
+                "statement": stats.statement,
+                "count": stats.count,
+                "total_ms": round(stats.total * 1000, 3),
+                "mean_ms": round(stats.total / stats.count * 1000, 3),
+                "max_ms": round(stats.max * 1000, 3),
+            }
+            for stats in ranked
+        ]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._current, self._previous = {}, {}
+            self.recent_slow.clear()
+
+
+query_log = QueryLog()
@@ -0,0 +1,280 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from compression import available_encodings, negotiate_encoding
+
+CACHE_TTL = 5.0
+# TTL이 지난 뒤 이 시간 동안은 저장된 응답을 먼저 보내고, 응답을 보낸 뒤 다시 만들어 둔다.
+STALE_WHILE_REVALIDATE = 30.0
+MAX_ENTRIES = 1_000
+MAX_BODY_SIZE = 512 * 1024
+POSTS_PATH = re.compile(r"^/posts/$")
+POST_COMMENTS_PATH = re.compile(r"^/posts/(\d+)/comments/$")
+
+# 프록시에는 저장하지 않고, 브라우저는 매번 ETag로 다시 확인하게 한다.
+CACHE_CONTROL = "private, no-cache"
+
+POSTS_TAG = "posts"
+AUTHORS_TAG = "authors"
+
+CacheKey = Tuple[str, str, Optional[str]]
+
+
+def post_comments_tag(post_id: int) -> str:
+    return f"post:{post_id}:comments"
+
+
+def body_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(
+        candidate.removeprefix("W/") == etag for candidate in candidates
+    )
+
+
+class CachedResponse:
+    __slots__ = ("status", "headers", "body", "etag", "tags", "stored_at", "revalidating")
+
+    def __init__(
+        self,
+        status: int,
+        headers: List[Tuple[bytes, bytes]],
+        body: bytes,
+        tags: FrozenSet[str],
+        stored_at: float,
+    ):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.etag = body_etag(body)
+        self.tags = tags
+        self.stored_at = stored_at
+        self.revalidating = False
+
+
+class ResponseCache:
+    """
+    익명 목록 응답을 (경로, 정렬한 쿼리, 인코딩)별로 직렬화·압축이 끝난 바이트로 보관한다.
+    - ttl 안에서는 그대로, ttl + stale 안에서는 먼저 보낸 뒤 다시 만든다.
+    - 쓰기가 일어나면 태그로 관련 항목을 바로 지운다. 태그별 세대 번호로, 지우는 동안 만들던 응답이
+      다시 저장되는 것을 막는다.
+    """
+
+    def __init__(
+        self,
+        ttl: float = CACHE_TTL,
+        stale: float = STALE_WHILE_REVALIDATE,
+        max_entries: int = MAX_ENTRIES,
+    ):
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, CachedResponse]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+
+    def get(self, key: CacheKey) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.stored_at >= self.ttl + self.stale:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def is_fresh(self, entry: CachedResponse) -> bool:
+        return time.monotonic() - entry.stored_at < self.ttl
+
+    def generations(self, tags: FrozenSet[str]) -> Tuple[int, ...]:
+        return tuple(self._generations.get(tag, 0) for tag in sorted(tags))
+
+    def put(self, key: CacheKey, entry: CachedResponse, generations: Tuple[int, ...]) -> None:
+        if self.generations(entry.tags) != generations:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, *tags: str) -> None:
+        for tag in tags:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+        invalidated = set(tags)
+        for key in [key for key, entry in self._entries.items() if entry.tags & invalidated]:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._generations.clear()
+
+
+response_cache = ResponseCache()
+
+
+def cache_tags(path: str, query: List[Tuple[str, str]]) -> Optional[FrozenSet[str]]:
+    """캐시할 경로면 응답이 의존하는 태그를, 아니면 None을 돌려준다."""
+    if POSTS_PATH.match(path):
+        tags = {POSTS_TAG}
+    else:
+        match = POST_COMMENTS_PATH.match(path)
+        if not match:
+            return None
+        tags = {post_comments_tag(int(match.group(1)))}
+    # 증분 동기화 응답은 요청마다 달라 캐시해도 다시 쓰이지 않는다.
+    if any(name == "since" for name, _ in query):
+        return None
+    if any(name == "with_author" and value.lower() in ("1", "true") for name, value in query):
+        tags.add(AUTHORS_TAG)
+    return frozenset(tags)
+
+
+class ResponseCacheMiddleware:
+    """
+    CompressionMiddleware 바깥에 두어 압축까지 끝난 바이트를 저장한다.
+    Authorization이나 Cookie가 있는 요청은 캐시하지 않는다.
+    200 응답은 본문을 모은 뒤 ETag를 붙여 보내고, If-None-Match가 맞으면 304로 답한다.
+    """
+
+    def __init__(self, app: ASGIApp, cache: ResponseCache = response_cache):
+        self.app = app
+        self.cache = cache
+        self.encodings = available_encodings()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        query = sorted(parse_qsl(scope["query_string"].decode(), keep_blank_values=True))
+        tags = cache_tags(scope["path"], query)
+        if tags is None or "authorization" in headers or "cookie" in headers:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(headers.get("accept-encoding", ""), self.encodings)
+        key = (scope["path"], urlencode(query), encoding)
+        if_none_match = headers.get("if-none-match")
+        entry = self.cache.get(key)
+        if entry is not None and self.cache.is_fresh(entry):
+            await self.send_cached(send, entry, "HIT", if_none_match)
+            return
+        if entry is not None:
+            await self.send_cached(send, entry, "STALE", if_none_match)
+            if not entry.revalidating:
+                entry.revalidating = True
+                try:
+                    await self.fetch(scope, key, tags, None, receive_nothing, discard)
+                finally:
+                    entry.revalidating = False
+            return
+
+        await self.fetch(scope, key, tags, if_none_match, receive, send)
+
+    async def fetch(
+        self,
+        scope: Scope,
+        key: CacheKey,
+        tags: FrozenSet[str],
+        if_none_match: Optional[str],
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        generations = self.cache.generations(tags)
+        start: Optional[Message] = None
+        chunks: List[bytes] = []
+        size = 0
+        entry: Optional[CachedResponse] = None
+
+        async def capture_send(message: Message) -> None:
+            nonlocal start, size, entry
+            if message["type"] == "http.response.start":
+                if message["status"] != 200:
+                    await send(message)
+                    return
+                response_headers = MutableHeaders(raw=message.setdefault("headers", []))
+                response_headers["Cache-Control"] = CACHE_CONTROL
+                if "accept-encoding" not in response_headers.get("vary", "").lower():
+                    response_headers.add_vary_header("Accept-Encoding")
+                # ETag를 붙이려면 본문이 끝날 때까지 시작 메시지를 붙잡아 둔다.
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            more_body = message.get("more_body", False)
+            if more_body and size <= MAX_BODY_SIZE:
+                return
+            if more_body:
+                # 너무 큰 응답은 ETag 없이 흘려보내고 저장하지 않는다.
+                await send({**start, "headers": start["headers"] + [(b"x-cache", b"MISS")]})
+                start = None
+                await send(
+                    {"type": "http.response.body", "body": b"".join(chunks), "more_body": True}
+                )
+                return
+            # 바깥 미들웨어가 같은 목록에 요청별 헤더를 덧붙이기 전에 복사해 둔다.
+            entry = CachedResponse(200, list(start["headers"]), b"".join(chunks), tags, 0.0)
+            entry.headers.append((b"etag", entry.etag.encode()))
+            start = None
+            await self.send_entry(send, entry, [(b"x-cache", b"MISS")], if_none_match)
+
+        await self.app(scope, receive, capture_send)
+        if entry is None:
+            return
+        entry.stored_at = time.monotonic()
+        self.cache.put(key, entry, generations)
+
+    async def send_cached(
+        self, send: Send, entry: CachedResponse, status: str, if_none_match: Optional[str]
+    ) -> None:
+        age = int(time.monotonic() - entry.stored_at)
+        extra = [(b"age", str(age).encode()), (b"x-cache", status.encode())]
+        await self.send_entry(send, entry, extra, if_none_match)
+
+    async def send_entry(
+        self,
+        send: Send,
+        entry: CachedResponse,
+        extra: List[Tuple[bytes, bytes]],
+        if_none_match: Optional[str],
+    ) -> None:
+        if etag_matches(if_none_match, entry.etag):
+            headers = [
+                (name, value)
+                for name, value in entry.headers
+                if name.lower() in (b"cache-control", b"etag", b"vary")
+            ]
+            await send({"type": "http.response.start", "status": 304, "headers": headers + extra})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send(
+            {
+                "type": "http.response.start",
+                "status": entry.status,
+                "headers": entry.headers + extra,
+            }
+        )
+        await send({"type": "http.response.body", "body": entry.body})
+
+
+async def receive_nothing() -> Message:
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def discard(message: Message) -> None:
+    pass
@@ -0,0 +1,143 @@
+from datetime import datetime
+from typing import Any, Dict, List, Tuple, Type
+
+from sqlalchemy import delete
+from sqlalchemy import select as select_columns
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, SQLModel, func
+
+from model import ActivityRollup, AuthorActivityRollup, Comment, CommentArchive, Granularity, Post
+
+# strftime 형식. 구간의 시작 시각으로 자른다.
+BUCKET_FORMATS = {Granularity.HOUR: "%Y-%m-%d %H:00:00", Granularity.DAY: "%Y-%m-%d 00:00:00"}
+
+
+def truncate(at: datetime, granularity: Granularity) -> datetime:
+    if granularity == Granularity.HOUR:
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def upsert_counts(
+    table: Any, keys: Dict[str, Any], posts: int, comments: int, **values: Any
+) -> Any:
+    statement = sqlite_insert(table).values(
+        **keys, **values, post_count=max(posts, 0), comment_count=max(comments, 0)
+    )
+    return statement.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={
+            "post_count": table.c.post_count + posts,
+            "comment_count": table.c.comment_count + comments,
+        },
+    )
+
+
+def add_activity(
+    author_id: str, created_at: datetime, session: Session, posts: int = 0, comments: int = 0
+) -> None:
+    """작성 시각이 속한 시간/일 구간과 작성자의 일 구간을 호출한 쪽의 트랜잭션 안에서 증감한다."""
+    table = ActivityRollup.__table__  # type: ignore
+    for granularity in Granularity:
+        keys = {"granularity": granularity, "bucket": truncate(created_at, granularity)}
+        session.execute(upsert_counts(table, keys, posts, comments))
+    add_author_activity(author_id, truncate(created_at, Granularity.DAY), session, posts, comments)
+
+
+def add_author_activity(
+    author_id: str, day: datetime, session: Session, posts: int, comments: int
+) -> None:
+    """
+    그날의 행을 앞선 날의 누적 합으로 만들어 두고, 그날부터의 누적 합에 증감분을 더한다.
+    보통은 마지막 날의 행 하나만 바뀌고, 지난 글을 지울 때만 그 뒤의 행들도 바뀐다.
+    """
+    table = AuthorActivityRollup.__table__  # type: ignore
+
+    def total_before(column: Any) -> Any:
+        earlier = select_columns(column).where(table.c.author_id == author_id, table.c.day < day)
+        return func.coalesce(earlier.order_by(table.c.day.desc()).limit(1).scalar_subquery(), 0)
+
+    keys = {"day": day, "author_id": author_id}
+    session.execute(
+        upsert_counts(
+            table,
+            keys,
+            posts,
+            comments,
+            post_total=total_before(table.c.post_total),
+            comment_total=total_before(table.c.comment_total),
+        )
+    )
+    session.execute(
+        update(table)
+        .where(table.c.author_id == author_id, table.c.day >= day)
+        .values(
+            post_total=table.c.post_total + posts, comment_total=table.c.comment_total + comments
+        )
+    )
+
+
+def count_by_bucket(
+    model: Type[SQLModel], bucket_format: str, session: Session, by_author: bool = False
+) -> List[Tuple]:
+    bucket = func.strftime(bucket_format, model.created_at)  # type: ignore
+    columns = [bucket, model.author_id] if by_author else [bucket]  # type: ignore
+    query = select_columns(*columns, func.count()).group_by(*columns)
+    return session.execute(query).all()
+
+
+def rebuild_activity_rollups(session: Session) -> int:
+    """
+    게시글/댓글(보관 티어 포함) 테이블에서 롤업을 처음부터 다시 계산한다.
+    쓰기 경로를 거치지 않고 들어온 데이터(대량 가져오기, 롤업 도입 전 데이터)를 반영할 때 쓴다.
+    """
+    buckets: Dict[Tuple, List[int]] = {}
+    authors: Dict[Tuple, List[int]] = {}
+    for index, models in ((0, (Post,)), (1, (Comment, CommentArchive))):
+        for model in models:
+            for granularity, bucket_format in BUCKET_FORMATS.items():
+                for bucket, count in count_by_bucket(model, bucket_format, session):
+                    buckets.setdefault((granularity, bucket), [0, 0])[index] += count
+            day_format = BUCKET_FORMATS[Granularity.DAY]
+            for day, author_id, count in count_by_bucket(model, day_format, session, True):
+                authors.setdefault((day, author_id), [0, 0])[index] += count
+
+    session.execute(delete(ActivityRollup))
+    session.execute(delete(AuthorActivityRollup))
+    if buckets:
+        session.execute(
+            ActivityRollup.__table__.insert(),  # type: ignore
+            [
+                {
+                    "granularity": granularity,
+                    "bucket": datetime.fromisoformat(bucket),
+                    "post_count": posts,
+                    "comment_count": comments,
+                }
+                for (granularity, bucket), (posts, comments) in buckets.items()
+            ],
+        )
+    if authors:
+        rows = []
+        totals: Dict[str, List[int]] = {}
+        # 누적 합을 채우려고 작성자별로 날짜 순서대로 훑는다. (strftime 결과라 문자열 순서가 날짜 순서다)
+        for (day, author_id), (posts, comments) in sorted(
+            authors.items(), key=lambda item: (item[0][1], item[0][0])
+        ):
+            total = totals.setdefault(author_id, [0, 0])
+            total[0] += posts
+            total[1] += comments
+            rows.append(
+                {
+                    "day": datetime.fromisoformat(day),
+                    "author_id": author_id,
+                    "post_count": posts,
+                    "comment_count": comments,
+                    "post_total": total[0],
+                    "comment_total": total[1],
+                }
+            )
+        session.execute(AuthorActivityRollup.__table__.insert(), rows)  # type: ignore
+    session.commit()
+    return len(buckets)
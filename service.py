@@ -1,24 +1,75 @@
+import asyncio
+import json
+import logging
 import secrets
-from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta, timezone
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+    cast,
+)
 
 from fastapi.security import HTTPBasicCredentials
-from sqlmodel import Field, Session, SQLModel, select
-
+from sqlalchemy import delete, null
+from sqlalchemy import select as select_columns
+from sqlalchemy import union_all, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import CursorResult
+from sqlalchemy.orm.util import identity_key
+from sqlmodel import Field, Session, SQLModel, col, func, select
+
+from archive import archived, archived_key, decompress_content, from_archive
+from changelog import MAX_CHANGES, is_expired, read_changes
+from counters import total_counter
+from database import SUPPORTS_RETURNING
 from exceptions import (
     CommentAuthorizationFailedException,
     CommentCreationFailedException,
     CommentNotFoundException,
+    CursorExpiredException,
+    InvalidFieldsException,
+    InvalidIdsException,
+    InvalidRangeException,
     NotAuthenticated,
     PostAuthorizationFailedException,
     PostCreationFailedException,
     PostNotFoundException,
+    PreconditionFailedException,
     UserAuthorizationFailedException,
     UserCreationFailedException,
     UserNotFoundException,
     UserSessionNotFoundException,
 )
-from model import Comment, Post, Role, User
+from feed import FEED_SIZE, FeedItem, comment_item, post_item, recent_feed
+from loader import author_loader
+from model import (
+    ActivityRollup,
+    AuthorActivityRollup,
+    ChangeEntity,
+    Comment,
+    CommentArchive,
+    Granularity,
+    Post,
+    Role,
+    TrendingScore,
+    User,
+    UserStats,
+)
+from nicknames import PREFIX_END, nickname_index
+from response_cache import AUTHORS_TAG, POSTS_TAG, post_comments_tag, response_cache
+from rollup import add_activity, truncate
+from stream import comment_hub
+from trending import trending_index
+
+logger = logging.getLogger(__name__)
 
 
 class UserCreate(SQLModel):
@@ -43,6 +94,17 @@ class UserRead(SQLModel):
     password: str
     nickname: Optional[str]
     created_at: datetime
+    version: int
+
+
+class AuthorRead(SQLModel):
+    id: str
+    nickname: Optional[str]
+
+
+class UserBatchRead(SQLModel):
+    items: List[UserRead]
+    missing: List[str]
 
 
 class UserUpdate(SQLModel):
@@ -70,6 +132,20 @@ class PostRead(SQLModel):
     title: str
     content: Optional[str]
     author_id: str = Field(index=True)
+    created_at: datetime
+    version: int
+
+
+class PostBatchRead(SQLModel):
+    items: List[PostRead]
+    missing: List[int]
+
+
+class PostChanges(SQLModel):
+    items: List[PostRead]
+    deleted: List[int]
+    cursor: int
+    has_more: bool
 
 
 class PostUpdate(SQLModel):
@@ -81,6 +157,7 @@ class PostUpdate(SQLModel):
 class CommentCreate(SQLModel):
     content: Optional[str]
     author_id: str
+    parent_id: Optional[int] = None
 
     class Config:
         schema_extra = {
@@ -97,6 +174,42 @@ class CommentRead(SQLModel):
     post_id: int
     content: Optional[str]
     created_at: datetime
+    parent_id: Optional[int]
+    path: str
+    depth: int
+    version: int
+
+
+class CommentChanges(SQLModel):
+    items: List[CommentRead]
+    deleted: List[int]
+    cursor: int
+    has_more: bool
+
+
+class CommentNode(CommentRead):
+    replies: List["CommentNode"] = []
+    replies_cursor: Optional[int] = None
+
+
+CommentNode.update_forward_refs()
+
+
+class CommentTreeRead(SQLModel):
+    root: Optional[CommentRead]
+    items: List[CommentNode]
+    cursor: Optional[int]
+
+
+class TrendingPost(SQLModel):
+    post_id: int
+    score: float
+
+
+class AuthorActivity(SQLModel):
+    author_id: str
+    post_count: int
+    comment_count: int
 
 
 class CommentUpdate(SQLModel):
@@ -114,41 +227,322 @@ class CommentUpdate(SQLModel):
         }
 
 
+Row = Dict[str, Any]
+
+MAX_BATCH_SIZE = 100
+# 시간 단위로는 약 한 달, 일 단위로는 약 3년까지 한 번에 조회한다.
+MAX_ROLLUP_BUCKETS = 1_000
+MAX_TREE_DEPTH = 10
+
+
+def parse_fields(
+    fields: Optional[str], model: Type[SQLModel], required: Sequence[str] = ()
+) -> Optional[List[str]]:
+    if fields is None:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    columns = model.__table__.columns.keys()  # type: ignore
+    invalid = [name for name in names if name not in columns]
+    if not names or invalid:
+        raise InvalidFieldsException(invalid)
+    return names + [name for name in required if name not in names]
+
+
+def select_fields(model: Type[SQLModel], fields: List[str]):
+    return select_columns(*(getattr(model, name) for name in fields))
+
+
+def fetch_rows(query, session: Session) -> List[Row]:
+    return [dict(row) for row in session.execute(query).mappings()]
+
+
+def count_rows(key: Hashable, query, session: Session) -> Tuple[int, bool]:
+    return total_counter.get(key, lambda: session.execute(query).scalar_one())
+
+
+async def count_users(session: Session) -> Tuple[int, bool]:
+    return count_rows(("user",), select_columns(func.count()).select_from(User), session)
+
+
+async def count_posts(session: Session, user_id: Optional[str] = None) -> Tuple[int, bool]:
+    query = select_columns(func.count()).select_from(Post)
+    if user_id is None:
+        return count_rows(("post",), query, session)
+    return count_rows(("post", "author", user_id), query.where(Post.author_id == user_id), session)
+
+
+def count_archived_comments(kind: str, value: Any, condition: Any, session: Session) -> int:
+    query = select_columns(func.count()).select_from(CommentArchive).where(condition)
+    count, _ = count_rows(archived_key(kind, value), query, session)
+    return count
+
+
+async def count_comments(
+    session: Session, post_id: Optional[int] = None, user_id: Optional[str] = None
+) -> Tuple[int, bool]:
+    value: Any
+    if post_id is not None:
+        kind, value = "post", post_id
+        hot, cold = Comment.post_id == post_id, CommentArchive.post_id == post_id
+    else:
+        kind, value = "author", user_id
+        hot, cold = Comment.author_id == user_id, CommentArchive.author_id == user_id
+
+    def count() -> int:
+        query = select_columns(func.count()).select_from(Comment).where(hot)
+        hot_count = session.execute(query).scalar_one()
+        return hot_count + count_archived_comments(kind, value, cold, session)
+
+    return total_counter.get(("comment", kind, value), count)
+
+
+def timestamp(value: datetime) -> float:
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def user_created(user: User) -> None:
+    total_counter.add(("user",), 1)
+    nickname_index.put(user.id, user.nickname)
+
+
+def user_updated(user: User) -> None:
+    nickname_index.put(user.id, user.nickname)
+    response_cache.invalidate(AUTHORS_TAG)
+
+
+def user_deleted(user: User) -> None:
+    total_counter.add(("user",), -1)
+    nickname_index.remove(user.id)
+    response_cache.invalidate(AUTHORS_TAG)
+
+
+def post_created(post: Post) -> None:
+    total_counter.add(("post",), 1)
+    total_counter.add(("post", "author", post.author_id), 1)
+    recent_feed.append(post_item(post))
+    response_cache.invalidate(POSTS_TAG)
+
+
+def post_updated(post: Post) -> None:
+    recent_feed.replace(post_item(post))
+    response_cache.invalidate(POSTS_TAG)
+
+
+def post_deleted(post: Post) -> None:
+    total_counter.add(("post",), -1)
+    total_counter.add(("post", "author", post.author_id), -1)
+    recent_feed.remove_post(post.id)  # type: ignore
+    trending_index.remove_post(post.id)  # type: ignore
+    response_cache.invalidate(POSTS_TAG, post_comments_tag(post.id))  # type: ignore
+
+
+def comment_created(comment: Comment) -> None:
+    total_counter.add(("comment", "post", comment.post_id), 1)
+    total_counter.add(("comment", "author", comment.author_id), 1)
+    recent_feed.append(comment_item(comment))
+    comment_hub.publish(comment.post_id, "created", CommentRead.from_orm(comment).json())
+    trending_index.add(comment.post_id, timestamp(comment.created_at))
+    response_cache.invalidate(post_comments_tag(comment.post_id))
+
+
+def comment_updated(comment: Comment) -> None:
+    recent_feed.replace(comment_item(comment))
+    comment_hub.publish(comment.post_id, "updated", CommentRead.from_orm(comment).json())
+    response_cache.invalidate(post_comments_tag(comment.post_id))
+
+
+def comment_deleted(comment: Comment) -> None:
+    total_counter.add(("comment", "post", comment.post_id), -1)
+    total_counter.add(("comment", "author", comment.author_id), -1)
+    recent_feed.remove("comment", comment.id)  # type: ignore
+    trending_index.add(comment.post_id, timestamp(comment.created_at), -1)
+    comment_hub.publish(comment.post_id, "deleted", json.dumps({"id": comment.id}))
+    response_cache.invalidate(post_comments_tag(comment.post_id))
+
+
+def write_returning(model: Type[SQLModel], statement: Any, session: Session) -> Optional[Any]:
+    """
+    조건부 UPDATE/DELETE ... RETURNING을 한 번 실행한다. 커밋은 같은 트랜잭션에서 할 일을 마친 뒤 호출한 쪽에서 한다.
+    조건(아이디, 작성자, 버전)에 맞는 행이 없으면 None을 돌려주며, 이때만 원인을 따로 조회한다.
+    RETURNING을 지원하지 않는 SQLite(3.35 미만)에서는 같은 조건으로 먼저 조회한 뒤 쓰고,
+    UPDATE였으면 쓴 뒤의 행을 다시 읽는다.
+    """
+    if not SUPPORTS_RETURNING:
+        current = session.exec(select(model).where(statement.whereclause)).first()
+        if current is None:
+            return None
+        result = cast(CursorResult, session.execute(statement))
+        if result.rowcount == 0:
+            return None
+        if not statement.is_delete:
+            session.refresh(current)
+        return current
+    query = select(model).from_statement(statement.returning(*model.__table__.columns))  # type: ignore
+    return session.execute(query.execution_options(populate_existing=True)).scalars().first()
+
+
+def add_user_stats(
+    user_id: str,
+    session: Session,
+    posts: int = 0,
+    comments: int = 0,
+    active_at: Optional[datetime] = None,
+) -> None:
+    """user_stats를 호출한 쪽의 트랜잭션 안에서 증감한다. 행이 없으면 만든다."""
+    statement = sqlite_insert(UserStats.__table__).values(  # type: ignore
+        user_id=user_id,
+        post_count=max(posts, 0),
+        comment_count=max(comments, 0),
+        last_activity_at=active_at,
+    )
+    changes: Dict[str, Any] = {
+        "post_count": UserStats.post_count + posts,
+        "comment_count": UserStats.comment_count + comments,
+    }
+    if active_at is not None:
+        changes["last_activity_at"] = statement.excluded.last_activity_at
+    session.execute(statement.on_conflict_do_update(index_elements=["user_id"], set_=changes))
+
+
+def versioned(statement: Any, model: Type[SQLModel], version: Optional[int]) -> Any:
+    if version is None:
+        return statement
+    return statement.where(model.version == version)  # type: ignore
+
+
+def parse_ids(ids: str, cast: Callable[[str], Any]) -> List[Any]:
+    try:
+        parsed = [cast(value.strip()) for value in ids.split(",") if value.strip()]
+    except ValueError:
+        raise InvalidIdsException(MAX_BATCH_SIZE)
+    unique = list(dict.fromkeys(parsed))
+    if not unique or len(unique) > MAX_BATCH_SIZE:
+        raise InvalidIdsException(MAX_BATCH_SIZE)
+    return unique
+
+
+def get_many(model: Type[SQLModel], ids: List[Any], session: Session) -> Dict[Any, Any]:
+    """세션에 이미 올라온 객체는 재사용하고, 나머지는 IN 쿼리 한 번으로 조회한다."""
+    found = {}
+    for id in ids:
+        cached = session.identity_map.get(identity_key(model, id))
+        if cached is not None:
+            found[id] = cached
+    pending = [id for id in ids if id not in found]
+    if pending:
+        primary_key = model.__table__.primary_key.columns.values()[0]  # type: ignore
+        for row in session.exec(select(model).where(primary_key.in_(pending))):
+            found[getattr(row, primary_key.name)] = row
+    return found
+
+
 def get_user_by_id(user_id: str, session: Session) -> Optional[User]:
     return session.get(User, user_id)
 
 
-async def get_posts_by_user(user_id: str, offset: int, limit: int, session: Session) -> List[Post]:
+async def load_author(author_id: str, session: Session) -> Optional[User]:
+    loader = author_loader.get()
+    if loader is None or loader.session is not session:
+        return get_user_by_id(author_id, session)
+    return await loader.load(author_id)
+
+
+async def attach_authors(items: Sequence[Any], session: Session) -> List[Row]:
+    rows = [item if isinstance(item, dict) else item.dict() for item in items]
+    authors = await asyncio.gather(*(load_author(row["author_id"], session) for row in rows))
+    for row, author in zip(rows, authors):
+        row["author"] = AuthorRead.from_orm(author).dict() if author else None
+    return rows
+
+
+async def get_posts_by_user(
+    user_id: str, offset: int, limit: int, session: Session, fields: Optional[List[str]] = None
+) -> Union[List[Post], List[Row]]:
+    if fields:
+        query = select_fields(Post, fields).where(Post.author_id == user_id)
+        return fetch_rows(query.offset(offset).limit(limit), session)
     query = select(Post).where(Post.author_id == user_id).offset(offset).limit(limit)
     posts = session.exec(query).all()
     return posts
 
 
+def get_hot_comments(
+    condition: Any, offset: int, limit: int, session: Session, fields: Optional[List[str]]
+) -> List[Any]:
+    if fields:
+        query = select_fields(Comment, fields).where(condition).order_by(Comment.id)
+        return fetch_rows(query.offset(offset).limit(limit), session)
+    query = select(Comment).where(condition).order_by(Comment.id)  # type: ignore
+    return session.exec(query.offset(offset).limit(limit)).all()
+
+
+def get_archived_comments(
+    condition: Any, offset: int, limit: int, session: Session, fields: Optional[List[str]]
+) -> List[Any]:
+    if fields:
+        query = select_fields(CommentArchive, fields).where(condition).order_by(CommentArchive.id)
+        rows = fetch_rows(query.offset(offset).limit(limit), session)
+        if "content" in fields:
+            for row in rows:
+                row["content"] = decompress_content(row["content"])
+        return rows
+    query = select(CommentArchive).where(condition).order_by(CommentArchive.id)  # type: ignore
+    return [from_archive(comment) for comment in session.exec(query.offset(offset).limit(limit))]
+
+
+def get_tiered_comments(
+    hot: Any,
+    cold: Any,
+    archived_count: int,
+    offset: int,
+    limit: int,
+    session: Session,
+    fields: Optional[List[str]],
+) -> List[Any]:
+    """
+    보관 티어(오래되어 아이디가 작은 댓글) 뒤에 활성 티어를 아이디 순으로 이어 붙인 목록의 한 페이지를 읽는다.
+    페이지가 보관된 댓글 수보다 앞쪽을 가리킬 때만 보관 티어를 조회한다.
+    """
+    comments: List[Any] = []
+    if offset < archived_count:
+        comments.extend(get_archived_comments(cold, offset, limit, session, fields))
+    remaining = limit - len(comments)
+    if remaining > 0:
+        hot_offset = max(offset - archived_count, 0)
+        comments.extend(get_hot_comments(hot, hot_offset, remaining, session, fields))
+    return comments
+
+
 async def get_comments_by_user(
-    user_id: str, offset: int, limit: int, session: Session
-) -> List[Comment]:
-    query = select(Comment).where(Comment.author_id == user_id).offset(offset).limit(limit)
-    comment = session.exec(query).all()
-    return comment
+    user_id: str, offset: int, limit: int, session: Session, fields: Optional[List[str]] = None
+) -> Union[List[Comment], List[Row]]:
+    cold = CommentArchive.author_id == user_id
+    archived_count = count_archived_comments("author", user_id, cold, session)
+    return get_tiered_comments(
+        Comment.author_id == user_id, cold, archived_count, offset, limit, session, fields
+    )
 
 
 async def get_comments_by_post(
-    post_id: int, offset: int, limit: int, session: Session
-) -> List[Comment]:
-    query = select(Comment).where(Comment.post_id == post_id).offset(offset).limit(limit)
-    comment = session.exec(query).all()
-    return comment
+    post_id: int, offset: int, limit: int, session: Session, fields: Optional[List[str]] = None
+) -> Union[List[Comment], List[Row]]:
+    cold = CommentArchive.post_id == post_id
+    archived_count = count_archived_comments("post", post_id, cold, session)
+    return get_tiered_comments(
+        Comment.post_id == post_id, cold, archived_count, offset, limit, session, fields
+    )
 
 
 async def create_user(user: UserCreate, session: Session) -> User:
     try:
         db_user = User.from_orm(user)
         session.add(db_user)
+        session.add(UserStats(user_id=db_user.id))
         session.commit()
-        session.refresh(db_user)
     except ValueError as e:
-        print(str(e))
+        logger.error("사용자 생성 실패: %s", e, extra={"user_id": user.id})
         raise UserCreationFailedException(user.nickname)
+    user_created(db_user)
     return db_user
 
 
@@ -157,6 +551,27 @@ async def read_users(offset: int, limit: int, session: Session) -> List[User]:
     return users
 
 
+async def search_users(prefix: str, limit: int, session: Session) -> List[AuthorRead]:
+    if nickname_index.ready:
+        matches = nickname_index.search(prefix, limit)
+    else:
+        # 인덱스를 만들기 전에는 nickname 인덱스의 범위 조회(LIKE 'prefix%'와 같은 결과)로 찾는다.
+        nickname = col(User.nickname)
+        query = (
+            select_columns(User.id, nickname)
+            .where(nickname >= prefix, nickname < prefix + PREFIX_END)
+            .order_by(nickname, User.id)
+            .limit(limit)
+        )
+        matches = session.execute(query).all()
+    return [AuthorRead(id=user_id, nickname=nickname) for user_id, nickname in matches]
+
+
+def warm_nickname_index(session: Session) -> None:
+    query = select_columns(User.id, User.nickname).where(User.nickname.is_not(None))  # type: ignore
+    nickname_index.build(session.execute(query))
+
+
 async def read_user(user_id: str, session: Session) -> User:
     user = get_user_by_id(user_id, session)
     if not user:
@@ -164,41 +579,62 @@ async def read_user(user_id: str, session: Session) -> User:
     return user
 
 
-async def read_user_posts(user_id: str, offset: int, limit: int, session: Session) -> List[Post]:
-    return await get_posts_by_user(user_id, offset, limit, session)
+async def read_users_batch(ids: List[str], session: Session) -> UserBatchRead:
+    found = get_many(User, ids, session)
+    return UserBatchRead(
+        items=[found[id] for id in ids if id in found],
+        missing=[id for id in ids if id not in found],
+    )
+
+
+async def read_user_posts(
+    user_id: str, offset: int, limit: int, session: Session, fields: Optional[List[str]] = None
+) -> Union[List[Post], List[Row]]:
+    return await get_posts_by_user(user_id, offset, limit, session, fields)
 
 
 async def read_user_comments(
-    user_id: str, offset: int, limit: int, session: Session
-) -> List[Comment]:
-    return await get_comments_by_user(user_id, offset, limit, session)
+    user_id: str, offset: int, limit: int, session: Session, fields: Optional[List[str]] = None
+) -> Union[List[Comment], List[Row]]:
+    return await get_comments_by_user(user_id, offset, limit, session, fields)
 
 
-async def update_user(user_id: str, user: UserUpdate, session: Session) -> User:
-    db_user: Optional[User] = get_user_by_id(user_id, session)
-    if not db_user:
+def raise_user_write_failed(user_id: str, password: str, session: Session) -> None:
+    current: Optional[User] = get_user_by_id(user_id, session)
+    if not current:
         raise UserNotFoundException
-
-    if user.password != db_user.password:  # type: ignore
+    if current.password != password:  # type: ignore
         raise UserAuthorizationFailedException
-    user_data = user.dict(exclude_unset=True)
-    for key, value in user_data.items():
-        setattr(db_user, key, value)
-    session.add(db_user)
+    raise PreconditionFailedException(current.version)
+
+
+async def update_user(
+    user_id: str, user: UserUpdate, session: Session, version: Optional[int] = None
+) -> User:
+    user_data = user.dict(exclude_unset=True, exclude={"password"})
+    statement = (
+        update(User)
+        .where(User.id == user_id, User.password == user.password)
+        .values(**user_data, version=User.version + 1)
+    )
+    db_user: Optional[User] = write_returning(User, versioned(statement, User, version), session)
+    if not db_user:
+        raise_user_write_failed(user_id, user.password, session)
     session.commit()
-    session.refresh(db_user)
-    return db_user
+    user_updated(db_user)  # type: ignore
+    return db_user  # type: ignore
 
 
-async def delete_user(user_id: str, password: str, session: Session) -> dict[str, bool]:
-    user = get_user_by_id(user_id, session)
+async def delete_user(
+    user_id: str, password: str, session: Session, version: Optional[int] = None
+) -> dict[str, bool]:
+    statement = delete(User).where(User.id == user_id, User.password == password)
+    user: Optional[User] = write_returning(User, versioned(statement, User, version), session)
     if not user:
-        raise UserNotFoundException
-
-    if user.password != password:  # type: ignore
-        raise UserAuthorizationFailedException
-    session.delete(user)
+        raise_user_write_failed(user_id, password, session)
+    session.execute(delete(UserStats).where(UserStats.user_id == user_id))
     session.commit()
+    user_deleted(user)  # type: ignore
     return {"ok": True}
 
 
@@ -210,19 +646,33 @@ async def create_post(post: PostCreate, session: Session) -> Post:
     try:
         db_post = Post.from_orm(post)
         session.add(db_post)
+        add_user_stats(post.author_id, session, posts=1, active_at=db_post.created_at)
+        add_activity(post.author_id, db_post.created_at, session, posts=1)
         session.commit()
-        session.refresh(db_post)
     except ValueError as e:
-        print(str(e))
+        logger.error("게시글 생성 실패: %s", e, extra={"author_id": post.author_id})
         raise PostCreationFailedException(post.title)
+    post_created(db_post)
     return db_post
 
 
-async def read_posts(offset: int, limit: int, session: Session) -> List[Post]:
+async def read_posts(
+    offset: int, limit: int, session: Session, fields: Optional[List[str]] = None
+) -> Union[List[Post], List[Row]]:
+    if fields:
+        return fetch_rows(select_fields(Post, fields).offset(offset).limit(limit), session)
     posts = session.exec(select(Post).offset(offset).limit(limit)).all()
     return posts
 
 
+async def read_posts_batch(ids: List[int], session: Session) -> PostBatchRead:
+    found = get_many(Post, ids, session)
+    return PostBatchRead(
+        items=[found[id] for id in ids if id in found],
+        missing=[id for id in ids if id not in found],
+    )
+
+
 async def read_post(post_id: int, session: Session) -> Post:
     post = get_post_by_id(post_id, session)
     if not post:
@@ -230,83 +680,551 @@ async def read_post(post_id: int, session: Session) -> Post:
     return post
 
 
-async def update_post(post_id: int, post: PostUpdate, session: Session) -> Post:
-    db_post: Optional[Post] = get_post_by_id(post_id, session)
-    if not db_post:
+def raise_post_write_failed(post_id: int, author_id: str, session: Session) -> None:
+    current = get_post_by_id(post_id, session)
+    if not current:
         raise PostNotFoundException(post_id)
-
-    if post.author_id != db_post.author_id:  # type: ignore
-        raise PostAuthorizationFailedException(post.author_id)
-    post_data = post.dict(exclude_unset=True)
-    for key, value in post_data.items():
-        setattr(db_post, key, value)
-    session.add(db_post)
+    if current.author_id != author_id:
+        raise PostAuthorizationFailedException(author_id)
+    raise PreconditionFailedException(current.version)
+
+
+async def update_post(
+    post_id: int, post: PostUpdate, session: Session, version: Optional[int] = None
+) -> Post:
+    post_data = post.dict(exclude_unset=True, exclude={"author_id"})
+    statement = (
+        update(Post)
+        .where(Post.id == post_id, Post.author_id == post.author_id)
+        .values(**post_data, version=Post.version + 1)
+    )
+    db_post: Optional[Post] = write_returning(Post, versioned(statement, Post, version), session)
+    if not db_post:
+        raise_post_write_failed(post_id, post.author_id, session)
     session.commit()
-    session.refresh(db_post)
-    return db_post
+    post_updated(db_post)  # type: ignore
+    return db_post  # type: ignore
 
 
-async def delete_post(post_id: int, author_id: str, session: Session) -> dict[str, bool]:
-    post = get_post_by_id(post_id, session)
+async def delete_post(
+    post_id: int, author_id: str, session: Session, version: Optional[int] = None
+) -> dict[str, bool]:
+    statement = delete(Post).where(Post.id == post_id, Post.author_id == author_id)
+    post: Optional[Post] = write_returning(Post, versioned(statement, Post, version), session)
     if not post:
-        raise PostNotFoundException(post_id)
-
-    if post.author_id != author_id:  # type: ignore
-        raise PostAuthorizationFailedException(post.author_id)
-    session.delete(post)
+        raise_post_write_failed(post_id, author_id, session)
+    add_user_stats(author_id, session, posts=-1)
+    add_activity(author_id, post.created_at, session, posts=-1)  # type: ignore
     session.commit()
+    post_deleted(post)  # type: ignore
     return {"ok": True}
 
 
 async def create_comment(post_id: int, comment: CommentCreate, session: Session) -> Comment:
+    parent: Optional[Union[Comment, CommentArchive]] = None
+    if comment.parent_id is not None:
+        # 부모가 보관 티어로 옮겨졌어도 답글을 달 수 있다.
+        parent = session.get(Comment, comment.parent_id) or session.get(
+            CommentArchive, comment.parent_id
+        )
+        if not parent or parent.post_id != post_id:
+            raise CommentNotFoundException(comment.parent_id)
     try:
         db_comment = Comment(post_id=post_id, **comment.dict())
         db_comment.post_id = post_id
         session.add(db_comment)
+        session.flush()
+        parent_path = parent.path if parent else ""
+        db_comment.path = parent_path + Comment.path_segment(db_comment.id)  # type: ignore
+        db_comment.depth = parent.depth + 1 if parent else 0
+        add_user_stats(comment.author_id, session, comments=1, active_at=db_comment.created_at)
+        add_activity(comment.author_id, db_comment.created_at, session, comments=1)
         session.commit()
-        session.refresh(db_comment)
     except ValueError as e:
-        print(str(e))
+        logger.error("댓글 생성 실패: %s", e, extra={"post_id": post_id})
         raise CommentCreationFailedException(post_id)
+    comment_created(db_comment)
     return db_comment
 
 
 async def read_post_comments(
-    post_id: int, offset: int, limit: int, session: Session
-) -> List[Comment]:
-    return await get_comments_by_post(post_id, offset, limit, session)
+    post_id: int, offset: int, limit: int, session: Session, fields: Optional[List[str]] = None
+) -> Union[List[Comment], List[Row]]:
+    return await get_comments_by_post(post_id, offset, limit, session, fields)
+
+
+TREE_COLUMNS = (
+    "id",
+    "author_id",
+    "post_id",
+    "created_at",
+    "parent_id",
+    "path",
+    "depth",
+    "version",
+)
+
+
+def select_tree_rows(model: Type[SQLModel], conditions: Callable[[Any], List[Any]]) -> Any:
+    """
+    활성/보관 티어를 UNION ALL로 합칠 수 있게 같은 모양으로 조회한다.
+    본문은 두 티어의 저장 형식이 달라 content(활성)와 archived_content(보관)로 나눠 둔다.
+    """
+    archived = model is CommentArchive
+    content = model.content  # type: ignore
+    return select_columns(
+        *(getattr(model, name) for name in TREE_COLUMNS),
+        (null() if archived else content).label("content"),
+        (content if archived else null()).label("archived_content"),
+    ).where(*conditions(model))
+
+
+def subtree_end_of(path: Any) -> Any:
+    """Comment.subtree_end를 SQL 식으로 계산한다."""
+    return func.substr(path, 1, func.length(path) - 1).concat(Comment.subtree_end("/"))
+
+
+def get_comment_tree(
+    post_id: Any,
+    prefix: Any,
+    base_depth: Any,
+    after: Optional[int],
+    limit: int,
+    max_depth: int,
+    session: Session,
+    root_id: Optional[int] = None,
+) -> Tuple[Optional[CommentRead], List[CommentNode], Optional[int]]:
+    """
+    한 문장으로 트리 한 페이지를 읽는다.
+    이번 페이지의 최상위 댓글 limit개를 티어별 (post_id, path) 인덱스에서 고르고(page),
+    그 댓글들의 하위 댓글만 경로 범위 한 번으로 max_depth 단계까지 조회한다.
+    post_id, prefix, base_depth는 값이나 SQL 식(하위 트리의 루트에서 구한 스칼라 서브쿼리)이며,
+    prefix가 ""이면 게시글 전체가 범위다. root_id를 넘기면 그 댓글도 함께 읽어 루트로 돌려준다.
+    답글이 부모와 다른 티어에 있을 수 있어 두 티어를 합쳐 트리를 만든다.
+    같은 부모를 가진 답글은 아이디 순으로 limit 개까지만 가져오며,
+    더 있으면 마지막 아이디를 다음 페이지 커서(replies_cursor)로 돌려준다.
+    """
+    lower = prefix + Comment.path_segment(after + 1) if after is not None else prefix
+
+    def page_rows(model: Any) -> Any:
+        conditions = [model.post_id == post_id, model.path >= lower, model.depth == base_depth]
+        if not isinstance(prefix, str) or prefix:
+            conditions.append(model.path < subtree_end_of(prefix))
+        return select_columns(model.id, model.path).where(*conditions).order_by(model.path)
+
+    # 티어마다 limit + 1개씩 고른 뒤 합쳐서 다시 자른다.
+    tiers = union_all(
+        *(
+            select_columns(page_rows(model).limit(limit + 1).subquery())
+            for model in (Comment, CommentArchive)
+        )
+    ).subquery()
+    number = func.row_number().over(order_by=tiers.c.path)
+    page = (
+        select_columns(tiers.c.id, tiers.c.path, number.label("number"))
+        .order_by(tiers.c.path)
+        .limit(limit + 1)
+        .cte("page")
+    )
+    first = select_columns(func.min(page.c.path)).scalar_subquery()
+    last = select_columns(func.max(page.c.path)).where(page.c.number <= limit).scalar_subquery()
+    has_more = select_columns(func.max(page.c.number)).scalar_subquery() > limit
+    cursor = select_columns(page.c.id).where(page.c.number == limit, has_more).scalar_subquery()
+
+    def subtree_conditions(model: Any) -> List[Any]:
+        return [
+            model.post_id == post_id,
+            model.path >= first,
+            model.path < subtree_end_of(last),
+            model.depth >= base_depth,
+            model.depth < base_depth + max_depth,
+        ]
+
+    selects = [select_tree_rows(model, subtree_conditions) for model in (Comment, CommentArchive)]
+    if root_id is not None:
+        selects.extend(
+            select_tree_rows(model, lambda model: [model.id == root_id])
+            for model in (Comment, CommentArchive)
+        )
+    rows = union_all(*selects).subquery()
+    rank = func.row_number().over(partition_by=rows.c.parent_id, order_by=rows.c.id)
+    ranked = select_columns(rows, rank.label("rank"), cursor.label("page_cursor")).subquery()
+    query = select_columns(ranked).where(ranked.c.rank <= limit + 1).order_by(ranked.c.path)
+
+    root: Optional[CommentRead] = None
+    # 루트는 경로 순으로 가장 먼저 오므로, 하위 트리면 루트를 읽은 뒤 최상위 깊이를 알 수 있다.
+    top_depth = base_depth if isinstance(base_depth, int) else None
+    nodes: Dict[int, CommentNode] = {}
+    roots: List[CommentNode] = []
+    page_cursor: Optional[int] = None
+    for row in session.execute(query).mappings():
+        page_cursor = row["page_cursor"]
+        node = CommentNode(**row)
+        if row["archived_content"] is not None:
+            node.content = decompress_content(row["archived_content"])
+        if row["id"] == root_id:
+            root = CommentRead(**node.dict(exclude={"replies", "replies_cursor"}))
+            top_depth = root.depth + 1
+            continue
+        if row["depth"] == top_depth:
+            siblings = roots
+        elif row["parent_id"] in nodes:
+            siblings = nodes[row["parent_id"]].replies
+        else:
+            continue
+        if row["rank"] > limit:
+            nodes[row["parent_id"]].replies_cursor = siblings[-1].id
+            continue
+        siblings.append(node)
+        nodes[node.id] = node
+    return root, roots, page_cursor
+
+
+async def read_comment_tree(
+    post_id: int, after: Optional[int], limit: int, max_depth: int, session: Session
+) -> CommentTreeRead:
+    _, items, cursor = get_comment_tree(post_id, "", 0, after, limit, max_depth, session)
+    return CommentTreeRead(root=None, items=items, cursor=cursor)
+
+
+async def read_comment_subtree(
+    comment_id: int, after: Optional[int], limit: int, max_depth: int, session: Session
+) -> CommentTreeRead:
+    def root_columns(model: Any) -> Any:
+        return select_columns(model.post_id, model.path, model.depth).where(model.id == comment_id)
+
+    # 루트는 어느 티어에 있든 아이디로 찾아 같은 문장 안에서 경로 범위를 정한다.
+    found = union_all(*map(root_columns, (Comment, CommentArchive))).cte("root")
+    root, items, cursor = get_comment_tree(
+        select_columns(found.c.post_id).scalar_subquery(),
+        select_columns(found.c.path).scalar_subquery(),
+        select_columns(found.c.depth).scalar_subquery() + 1,
+        after,
+        limit,
+        max_depth,
+        session,
+        root_id=comment_id,
+    )
+    if root is None:
+        raise CommentNotFoundException(comment_id)
+    return CommentTreeRead(root=root, items=items, cursor=cursor)
 
 
 async def update_comment(
-    post_id: int, comment_id: int, comment: CommentUpdate, session: Session
+    post_id: int,
+    comment_id: int,
+    comment: CommentUpdate,
+    session: Session,
+    version: Optional[int] = None,
 ) -> Comment:
-    db_comment: Optional[Comment] = session.get(Comment, comment_id)
+    comment_data = comment.dict(exclude_unset=True, exclude={"password", "author_id"})
+    password_matches = (
+        select_columns(User.id)
+        .where(User.id == comment.author_id, User.password == comment.password)
+        .exists()
+    )
+    statement = (
+        update(Comment)
+        .where(
+            Comment.id == comment_id,
+            Comment.post_id == post_id,
+            Comment.author_id == comment.author_id,
+            password_matches,
+        )
+        .values(**comment_data, version=Comment.version + 1)
+    )
+    db_comment: Optional[Comment] = write_returning(
+        Comment, versioned(statement, Comment, version), session
+    )
     if not db_comment:
-        raise CommentNotFoundException(comment_id)
-
-    if post_id != db_comment.post_id:
-        raise CommentNotFoundException(comment_id)
-    elif comment.author_id != db_comment.author_id or comment.password != db_comment.user.password:
-        raise CommentAuthorizationFailedException(comment.author_id)
-    comment_data = comment.dict(exclude_unset=True, exclude={"password"})
-    for key, value in comment_data.items():
-        setattr(db_comment, key, value)
-    session.add(db_comment)
+        current: Optional[Comment] = session.get(Comment, comment_id)
+        if not current or current.post_id != post_id:
+            raise CommentNotFoundException(comment_id)
+        author = await load_author(current.author_id, session)
+        if (
+            comment.author_id != current.author_id
+            or not author
+            or comment.password != author.password
+        ):
+            raise CommentAuthorizationFailedException(comment.author_id)
+        raise PreconditionFailedException(current.version)
     session.commit()
-    session.refresh(db_comment)
+    comment_updated(db_comment)
     return db_comment
 
 
-async def delete_comment(comment_id: int, author_id: str, session: Session) -> dict[str, bool]:
-    comment: Optional[Comment] = session.get(Comment, comment_id)
+async def delete_comment(
+    comment_id: int, author_id: str, session: Session, version: Optional[int] = None
+) -> dict[str, bool]:
+    statement = delete(Comment).where(Comment.id == comment_id, Comment.author_id == author_id)
+    comment: Optional[Comment] = write_returning(
+        Comment, versioned(statement, Comment, version), session
+    )
+    archived_comment: Optional[CommentArchive] = None
     if not comment:
-        raise CommentNotFoundException(comment_id)
+        archived_comment = delete_archived_comment(comment_id, author_id, session, version)
+        comment = from_archive(archived_comment)
+    add_user_stats(author_id, session, comments=-1)
+    add_activity(author_id, comment.created_at, session, comments=-1)
+    session.commit()
+    if archived_comment:
+        archived([(archived_comment.post_id, archived_comment.author_id)], -1)
+    comment_deleted(comment)
+    return {"ok": True}
 
-    if comment.author_id != author_id:
+
+def delete_archived_comment(
+    comment_id: int, author_id: str, session: Session, version: Optional[int]
+) -> CommentArchive:
+    """활성 티어에서 지우지 못한 댓글을 보관 티어에서 지운다. 어느 쪽에서도 못 지우면 원인을 알린다."""
+    statement = delete(CommentArchive).where(
+        CommentArchive.id == comment_id, CommentArchive.author_id == author_id
+    )
+    deleted: Optional[CommentArchive] = write_returning(
+        CommentArchive, versioned(statement, CommentArchive, version), session
+    )
+    if deleted:
+        return deleted
+
+    current = session.get(Comment, comment_id) or session.get(CommentArchive, comment_id)
+    if not current:
+        raise CommentNotFoundException(comment_id)
+    if current.author_id != author_id:
         raise CommentAuthorizationFailedException(author_id)
-    session.delete(comment)
+    raise PreconditionFailedException(current.version)
+
+
+async def read_user_stats(user_id: str, session: Session) -> UserStats:
+    stats = session.get(UserStats, user_id)
+    if stats:
+        return stats
+    # 집계 테이블이 생기기 전에 가입한 사용자는 처음 조회할 때 채운다.
+    if not get_user_by_id(user_id, session):
+        raise UserNotFoundException
+    repair_user_stats(session, [user_id])
+    return session.get(UserStats, user_id)  # type: ignore
+
+
+def count_by_author(model: Type[SQLModel], user_ids: Optional[List[str]], session: Session):
+    author_id, created_at = model.author_id, model.created_at  # type: ignore
+    query = select_columns(author_id, func.count(), func.max(created_at)).group_by(author_id)
+    if user_ids is not None:
+        query = query.where(author_id.in_(user_ids))
+    return {author_id: (count, last) for author_id, count, last in session.execute(query)}
+
+
+def repair_user_stats(session: Session, user_ids: Optional[List[str]] = None) -> int:
+    """
+    게시글/댓글(보관 티어 포함) 테이블에서 user_stats를 처음부터 다시 계산한다.
+    user_ids를 주면 해당 사용자만 다시 계산한다.
+    """
+    users = select_columns(User.id)
+    stats = delete(UserStats)
+    if user_ids is not None:
+        users = users.where(User.id.in_(user_ids))  # type: ignore
+        stats = stats.where(UserStats.user_id.in_(user_ids))  # type: ignore
+    ids = session.execute(users).scalars().all()
+
+    posts = count_by_author(Post, user_ids, session)
+    comments = count_by_author(Comment, user_ids, session)
+    archived_comments = count_by_author(CommentArchive, user_ids, session)
+    rows = []
+    for user_id in ids:
+        post_count, post_at = posts.get(user_id, (0, None))
+        comment_count, comment_at = comments.get(user_id, (0, None))
+        archived_count, archived_at = archived_comments.get(user_id, (0, None))
+        activity = [at for at in (post_at, comment_at, archived_at) if at is not None]
+        rows.append(
+            {
+                "user_id": user_id,
+                "post_count": post_count,
+                "comment_count": comment_count + archived_count,
+                "last_activity_at": max(activity) if activity else None,
+            }
+        )
+
+    session.execute(stats)
+    if rows:
+        session.execute(UserStats.__table__.insert(), rows)  # type: ignore
     session.commit()
-    return {"ok": True}
+    return len(rows)
+
+
+def check_range(start: datetime, end: datetime, granularity: Granularity) -> datetime:
+    """구간 시작으로 자른 start를 돌려준다. 조회할 구간 수는 MAX_ROLLUP_BUCKETS개로 제한한다."""
+    start = truncate(start, granularity)
+    size = timedelta(hours=1) if granularity == Granularity.HOUR else timedelta(days=1)
+    if end <= start or (end - start) / size > MAX_ROLLUP_BUCKETS:
+        raise InvalidRangeException(MAX_ROLLUP_BUCKETS)
+    return start
+
+
+async def read_activity(
+    granularity: Granularity, start: datetime, end: datetime, session: Session
+) -> List[ActivityRollup]:
+    start = check_range(start, end, granularity)
+    query = (
+        select(ActivityRollup)
+        .where(
+            ActivityRollup.granularity == granularity,
+            ActivityRollup.bucket >= start,
+            ActivityRollup.bucket < end,
+        )
+        .order_by(ActivityRollup.bucket)
+    )
+    return session.exec(query).all()
+
+
+async def read_top_authors(
+    start: datetime, end: datetime, limit: int, session: Session
+) -> List[AuthorActivity]:
+    """
+    작성자별 누적 합에서 end 전과 start 전의 마지막 행을 찾아 그 차이로 기간 합계를 구한다.
+    작성자 목록은 (author_id, day) 인덱스를 건너뛰며 읽으므로, 읽는 행 수는 기간의 길이와 무관하게
+    롤업에 있는 작성자 수에 비례하고 작성자마다 인덱스 탐색 네 번이다.
+    """
+    start = check_range(start, end, Granularity.DAY)
+    rollup = AuthorActivityRollup.__table__  # type: ignore
+    first = select_columns(func.min(rollup.c.author_id).label("author_id"))
+    authors = first.cte("authors", recursive=True)
+    following = select_columns(func.min(rollup.c.author_id)).where(
+        rollup.c.author_id > authors.c.author_id
+    )
+    authors = authors.union_all(
+        select_columns(following.scalar_subquery()).where(authors.c.author_id.isnot(None))
+    )
+
+    def last_day_before(at: datetime) -> Any:
+        return (
+            select_columns(func.max(rollup.c.day))
+            .where(rollup.c.author_id == authors.c.author_id, rollup.c.day < at)
+            .scalar_subquery()
+        )
+
+    bounds = (
+        select_columns(
+            authors.c.author_id,
+            last_day_before(end).label("end_day"),
+            last_day_before(start).label("start_day"),
+        )
+        .where(authors.c.author_id.isnot(None))
+        .subquery("bounds")
+    )
+    at_end, at_start = rollup.alias("at_end"), rollup.alias("at_start")
+
+    def total(column: str) -> Any:
+        return func.coalesce(at_end.c[column], 0) - func.coalesce(at_start.c[column], 0)
+
+    posts, comments = total("post_total"), total("comment_total")
+    query = (
+        select_columns(bounds.c.author_id, posts, comments)
+        .select_from(
+            bounds.outerjoin(
+                at_end,
+                (at_end.c.author_id == bounds.c.author_id) & (at_end.c.day == bounds.c.end_day),
+            ).outerjoin(
+                at_start,
+                (at_start.c.author_id == bounds.c.author_id)
+                & (at_start.c.day == bounds.c.start_day),
+            )
+        )
+        .where(posts + comments > 0)
+        .order_by((posts + comments).desc(), bounds.c.author_id)
+        .limit(limit)
+    )
+    return [
+        AuthorActivity(author_id=author_id, post_count=post_count, comment_count=comment_count)
+        for author_id, post_count, comment_count in session.execute(query)
+    ]
+
+
+def split_changes(latest: Dict[int, bool], found: Dict[int, Any]) -> Tuple[List[Any], List[int]]:
+    """마지막 변경이 삭제이거나 더는 없는 행은 툼스톤으로, 나머지는 현재 행으로 돌려준다."""
+    items, deleted = [], []
+    for id, is_deleted in latest.items():
+        if is_deleted or id not in found:
+            deleted.append(id)
+        else:
+            items.append(found[id])
+    return items, deleted
+
+
+async def read_post_changes(since: int, limit: int, session: Session) -> PostChanges:
+    if is_expired(since, session):
+        raise CursorExpiredException(since)
+    latest, cursor, has_more = read_changes(
+        ChangeEntity.POST, since, min(limit, MAX_CHANGES), session
+    )
+    changed = [id for id, is_deleted in latest.items() if not is_deleted]
+    items, deleted = split_changes(latest, get_many(Post, changed, session))
+    return PostChanges(items=items, deleted=deleted, cursor=cursor, has_more=has_more)
+
+
+async def read_comment_changes(
+    post_id: int, since: int, limit: int, session: Session
+) -> CommentChanges:
+    if is_expired(since, session):
+        raise CursorExpiredException(since)
+    latest, cursor, has_more = read_changes(
+        ChangeEntity.COMMENT, since, min(limit, MAX_CHANGES), session, post_id
+    )
+    changed = [id for id, is_deleted in latest.items() if not is_deleted]
+    found = get_many(Comment, changed, session)
+    # 동기화 사이에 보관 티어로 옮겨진 댓글
+    missing = [id for id in changed if id not in found]
+    if missing:
+        found.update(
+            (id, from_archive(archived))
+            for id, archived in get_many(CommentArchive, missing, session).items()
+        )
+    items, deleted = split_changes(latest, found)
+    return CommentChanges(items=items, deleted=deleted, cursor=cursor, has_more=has_more)
+
+
+async def read_recent_feed(limit: int) -> List[FeedItem]:
+    return recent_feed.recent(limit)
+
+
+def warm_recent_feed(session: Session) -> None:
+    posts = session.exec(select(Post).order_by(col(Post.created_at).desc()).limit(FEED_SIZE)).all()
+    comments = session.exec(
+        select(Comment).order_by(col(Comment.created_at).desc()).limit(FEED_SIZE)
+    ).all()
+    recent_feed.warm([*map(post_item, posts), *map(comment_item, comments)])
+
+
+async def read_trending_posts(limit: int) -> List[TrendingPost]:
+    return [
+        TrendingPost(post_id=post_id, score=score) for post_id, score in trending_index.top(limit)
+    ]
+
+
+def save_trending_snapshot(taken_at: float, scores: Dict[int, float], session: Session) -> None:
+    snapshot_at = datetime.utcfromtimestamp(taken_at)
+    session.execute(TrendingScore.__table__.delete())  # type: ignore
+    session.add_all(
+        TrendingScore(post_id=post_id, score=score, snapshot_at=snapshot_at)
+        for post_id, score in scores.items()
+    )
+    session.commit()
+
+
+def warm_trending(session: Session) -> None:
+    """
+    스냅숏을 불러온 뒤 스냅숏 이후에 작성된 댓글만 더해 순위를 복원한다.
+    스냅숏이 없으면 감쇠로 무시할 수 있는 기간(반감기의 20배) 안의 댓글로 계산한다.
+    """
+    snapshot = session.exec(select(TrendingScore)).all()
+    if snapshot:
+        snapshot_at = max(row.snapshot_at for row in snapshot)
+        trending_index.load(timestamp(snapshot_at), {row.post_id: row.score for row in snapshot})
+    else:
+        snapshot_at = datetime.utcnow() - timedelta(seconds=20 * trending_index.half_life)
+        trending_index.clear()
+    query = select(Comment.post_id, Comment.created_at).where(Comment.created_at > snapshot_at)
+    trending_index.extend(
+        (post_id, timestamp(created_at)) for post_id, created_at in session.exec(query)
+    )
 
 
 user_sessions: Dict[str, Any] = {}
@@ -0,0 +1,40 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """
+    시작 단계별 소요 시간. 모듈 import 시간은 재지 않는다.
+    import 비용은 `python -X importtime -c "import main"`으로 모듈별로 본다.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.steps: Dict[str, float] = {}
+
+    def record(self, name: str, started: float) -> None:
+        self.steps[name] = round((time.perf_counter() - started) * 1000, 3)
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, started)
+
+    def finish(self) -> None:
+        self.ready = True
+        total = sum(self.steps.values())
+        details = ", ".join(f"{name}={elapsed}ms" for name, elapsed in self.steps.items())
+        logger.info("startup finished in %.3fms (%s)", total, details)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {"ready": self.ready, "steps_ms": dict(self.steps)}
+
+
+startup_report = StartupReport()
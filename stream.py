@@ -0,0 +1,122 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict, deque
+from typing import AsyncIterator, Deque, Dict, Optional, Set
+
+SUBSCRIBER_QUEUE_SIZE = 100
+REPLAY_SIZE = 1000
+KEEPALIVE_INTERVAL = 15.0
+
+
+class StreamEvent:
+    __slots__ = ("id", "post_id", "event", "data")
+
+    def __init__(self, id: int, post_id: int, event: str, data: str):
+        self.id = id
+        self.post_id = post_id
+        self.event = event
+        self.data = data
+
+    def sse(self) -> str:
+        return f"id: {self.id}\nevent: {self.event}\ndata: {self.data}\n\n"
+
+    def json(self) -> str:
+        return json.dumps({"id": self.id, "event": self.event, "data": json.loads(self.data)})
+
+
+class Subscriber:
+    def __init__(self, post_id: int, maxsize: int):
+        self.post_id = post_id
+        self.queue: "asyncio.Queue[Optional[StreamEvent]]" = asyncio.Queue(maxsize)
+        self.evicted = False
+
+
+class CommentHub:
+    """
+    게시글별 댓글 변경(created/updated/deleted)을 구독자에게 전달한다.
+    - 구독자마다 크기가 제한된 큐를 두고, 큐가 가득 찬 느린 구독자는 끊어낸다.
+    - 최근 이벤트를 REPLAY_SIZE 만큼 보관해 Last-Event-ID 이후부터 이어받을 수 있게 한다.
+    """
+
+    def __init__(self, queue_size: int = SUBSCRIBER_QUEUE_SIZE, replay_size: int = REPLAY_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[Subscriber]] = defaultdict(set)
+        self._history: Deque[StreamEvent] = deque(maxlen=replay_size)
+        # 재시작 후에도 이벤트 아이디가 이전보다 커지도록 현재 시각(ms)에서 시작한다.
+        self._ids = itertools.count(int(time.time() * 1000))
+
+    def publish(self, post_id: int, event: str, data: str) -> StreamEvent:
+        stream_event = StreamEvent(next(self._ids), post_id, event, data)
+        self._history.append(stream_event)
+        for subscriber in list(self._subscribers.get(post_id, ())):
+            try:
+                subscriber.queue.put_nowait(stream_event)
+            except asyncio.QueueFull:
+                self.evict(subscriber)
+        return stream_event
+
+    def subscribe(self, post_id: int, last_event_id: Optional[int] = None) -> Subscriber:
+        subscriber = Subscriber(post_id, self.queue_size)
+        if last_event_id is not None:
+            self._replay(subscriber, last_event_id)
+        self._subscribers[post_id].add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscribers = self._subscribers.get(subscriber.post_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[subscriber.post_id]
+
+    def evict(self, subscriber: Subscriber) -> None:
+        subscriber.evicted = True
+        self.unsubscribe(subscriber)
+        while not subscriber.queue.empty():
+            subscriber.queue.get_nowait()
+        subscriber.queue.put_nowait(None)
+
+    async def events(
+        self, subscriber: Subscriber, keepalive: float = KEEPALIVE_INTERVAL
+    ) -> AsyncIterator[Optional[StreamEvent]]:
+        """이벤트를 순서대로 내보낸다. keepalive 초 동안 이벤트가 없으면 None을 내보낸다."""
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if event is None:
+                    return
+                yield event
+        finally:
+            self.unsubscribe(subscriber)
+
+    def clear(self) -> None:
+        for subscribers in list(self._subscribers.values()):
+            for subscriber in list(subscribers):
+                self.evict(subscriber)
+        self._history.clear()
+
+    def _replay(self, subscriber: Subscriber, last_event_id: int) -> None:
+        missed = [
+            event
+            for event in self._history
+            if event.id > last_event_id and event.post_id == subscriber.post_id
+        ]
+        oldest = self._history[0].id if self._history else None
+        if oldest is None or last_event_id < oldest - 1 or len(missed) > self.queue_size - 1:
+            # 보관 범위를 벗어났거나 놓친 이벤트가 큐에 다 들어가지 않으면 일부만 보내지 않고,
+            # 클라이언트가 목록을 다시 조회하도록 알린다. 다시 연결할 때는 마지막 이벤트 이후부터 받는다.
+            newest = missed[-1].id if missed else last_event_id
+            subscriber.queue.put_nowait(StreamEvent(newest, subscriber.post_id, "reset", "{}"))
+            return
+        for event in missed:
+            subscriber.queue.put_nowait(event)
+
+
+comment_hub = CommentHub()
@@ -1,18 +1,61 @@
+import asyncio
+import io
+import json
+import logging
 import secrets
+import threading
+import time
 import uuid
 from datetime import datetime, timedelta
 from typing import Optional
 from unittest.mock import patch
 
 import pytest
+import sqlalchemy
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBasicCredentials
 from fastapi.testclient import TestClient
 from pydantic import BaseModel
-from sqlmodel import Field, Session, select
-
+from sqlalchemy import event, update
+from sqlalchemy.dialects.sqlite import dialect as sqlite_dialect
+from sqlmodel import Field, Session, create_engine, select
+
+from archive import archive_comments
+from backup import BackupManager, backup_manager
+from changelog import prune_change_log
+from column_types import ZLIB_HEADER, compress_existing_rows, decompress_text
+from compression import CompressionMiddleware, available_encodings, negotiate_encoding
 from conftest import engine
+from counters import TotalCounter
+from database import create_db_and_tables, schema_fingerprint, stored_schema_fingerprint
+from idempotency import IdempotencyMiddleware, IdempotencyStore, StoredResponse
+from importer import CommentImporter, PostImporter, UserImporter
+from logs import (
+    ErrorRateLimitFilter,
+    RequestIdMiddleware,
+    request_id,
+    setup_logging,
+    shutdown_logging,
+)
+from loopmonitor import LoopMonitor, LoopMonitorMiddleware
 from main import app
-from model import Comment, Post, User
+from model import (
+    ActivityRollup,
+    AuthorActivityRollup,
+    ChangeLog,
+    Comment,
+    CommentArchive,
+    Post,
+    User,
+    UserStats,
+)
+from profiler import ProfilerMiddleware
+from querylog import QueryLog
+from response_cache import ResponseCache, ResponseCacheMiddleware, discard, receive_nothing
+from rollup import add_activity, rebuild_activity_rollups
+from service import save_trending_snapshot, warm_nickname_index, warm_recent_feed, warm_trending
+from stream import CommentHub, comment_hub
+from trending import TrendingIndex, trending_index
 
 client = TestClient(app)
 
@@ -275,7 +318,14 @@ def test_read_posts(post_payload: PostPayload):
     with Session(engine) as session:
         db_posts = session.exec(select(Post)).all()
 
-    db_posts_dict = [post.dict() for post in db_posts]
+    """
+    created_at 날짜 형식 변환
+    - API 호출 : '2023-08-29T07:14:54.783739'
+    - DB 직접 호출 : datetime.datetime(2023, 8, 29, 7, 14, 54, 783739)
+    """
+    db_posts_dict = [
+        {**post.dict(), "created_at": post.created_at.isoformat()} for post in db_posts
+    ]
     assert api_posts == db_posts_dict
 
 
@@ -394,7 +444,14 @@ def test_read_user_posts(user_payload: UserPayload, post_payload: PostPayload):
         query = select(Post).where(Post.author_id == user["id"])
         db_posts_by_user = session.exec(query).all()
 
-    db_posts_dict = [post.dict() for post in db_posts_by_user]
+    """
+    created_at 날짜 형식 변환
+    - API 호출 : '2023-08-29T07:14:54.783739'
+    - DB 직접 호출 : datetime.datetime(2023, 8, 29, 7, 14, 54, 783739)
+    """
+    db_posts_dict = [
+        {**post.dict(), "created_at": post.created_at.isoformat()} for post in db_posts_by_user
+    ]
     assert api_posts == db_posts_dict
 
 
@@ -744,3 +801,2011 @@ def test_logout_not_authenticate(user_payload: UserPayload):
 
     # Then
     assert response.status_code == 401
+
+
+def test_read_posts_compressed(post_payload: PostPayload):
+    # Given
+    post_payload.content = "Learn how to build APIs with FastAPI and Python. " * 20
+    with Session(engine) as session:
+        session.add(Post.from_orm(post_payload))
+        session.commit()
+
+    # When
+    response = client.get("/posts/", headers={"Accept-Encoding": "gzip"})
+
+    # Then
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(post_payload.content)
+    assert response.json()[0]["content"] == post_payload.content
+
+
+def test_read_posts_not_compressed_below_minimum_size(post_payload: PostPayload):
+    # Given
+    with Session(engine) as session:
+        session.add(Post.from_orm(post_payload))
+        session.commit()
+
+    # When
+    response = client.get("/posts/", headers={"Accept-Encoding": "gzip"})
+
+    # Then
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+
+
+def test_negotiate_encoding():
+    # Given
+    # When
+    # Then
+    assert negotiate_encoding("gzip, br", ["br", "gzip"]) == "br"
+    assert negotiate_encoding("gzip;q=1.0, br;q=0.5", ["br", "gzip"]) == "gzip"
+    assert negotiate_encoding("br", ["gzip"]) is None
+    assert negotiate_encoding("*", ["gzip"]) == "gzip"
+    assert negotiate_encoding("gzip;q=0", ["gzip"]) is None
+
+
+def test_compression_without_brotli(post_payload: PostPayload):
+    # Given
+    client.post("/users/", json=UserPayload(id=post_payload.author_id).dict())
+    for _ in range(10):
+        client.post("/posts/", json=post_payload.dict())
+
+    # When
+    with patch("compression.brotli", None):
+        encodings = available_encodings()
+        app_without_brotli = CompressionMiddleware(app)
+    response = TestClient(app_without_brotli).get("/posts/", headers={"Accept-Encoding": "br"})
+
+    # Then
+    assert encodings == ["gzip"]
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+
+
+def test_compression_streamed_response():
+    # Given
+    async def chunks():
+        for _ in range(10):
+            yield b"x" * 200
+
+    async def stream_app(scope, receive, send):
+        await StreamingResponse(chunks(), media_type="text/plain")(scope, receive, send)
+
+    stream_client = TestClient(CompressionMiddleware(stream_app))
+
+    # When
+    response = stream_client.get("/", headers={"Accept-Encoding": "gzip"})
+
+    # Then
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert response.content == b"x" * 2000
+
+
+def test_read_posts_fields(post_payload: PostPayload):
+    # Given
+    with Session(engine) as session:
+        db_post = Post.from_orm(post_payload)
+        session.add(db_post)
+        session.commit()
+        session.refresh(db_post)
+
+    # When
+    response = client.get("/posts/", params={"fields": "id,title,author_id"})
+
+    # Then
+    assert response.status_code == 200
+    assert response.json() == [
+        {"id": db_post.id, "title": post_payload.title, "author_id": post_payload.author_id}
+    ]
+
+
+def test_read_posts_invalid_fields():
+    # Given
+    # When
+    response = client.get("/posts/", params={"fields": "id,password"})
+
+    # Then
+    assert response.status_code == 422
+
+
+def test_read_post_comments_fields(post_payload: PostPayload, comment_payload: CommentPayload):
+    # Given
+    with Session(engine) as session:
+        session.add(Post.from_orm(post_payload))
+        session.add(Comment(post_id=1, **comment_payload.dict()))
+        session.commit()
+
+    # When
+    response = client.get("/posts/1/comments/", params={"fields": "id,author_id"})
+
+    # Then
+    assert response.status_code == 200
+    assert response.json() == [{"id": 1, "author_id": comment_payload.author_id}]
+
+
+def test_read_posts_with_total(post_payload: PostPayload):
+    # Given
+    with Session(engine) as session:
+        session.add(Post.from_orm(post_payload))
+        session.add(Post.from_orm(post_payload))
+        session.commit()
+
+    # When
+    response = client.get("/posts/", params={"limit": 1, "with_total": True})
+
+    # Then
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert response.headers["x-total-count"] == "2"
+    assert response.headers["x-total-approximate"] == "false"
+
+
+def test_read_post_comments_with_total_maintained(post_payload: PostPayload):
+    # Given
+    with Session(engine) as session:
+        session.add(Post.from_orm(post_payload))
+        session.commit()
+    comment = CommentPayload(author_id=post_payload.author_id).dict()
+    params = {"with_total": "true", "fields": "id"}
+    assert client.get("/posts/1/comments/", params=params).headers["x-total-count"] == "0"
+
+    # When
+    client.post("/posts/1/comments/", json=comment)
+    client.post("/posts/1/comments/", json=comment)
+    client.delete("/posts/1/comments/1", params={"author": comment["author_id"]})
+    response = client.get("/posts/1/comments/", params=params)
+
+    # Then
+    assert response.status_code == 200
+    assert response.headers["x-total-count"] == "1"
+    assert "x-total-count" not in client.get("/posts/1/comments/").headers
+
+
+def test_total_counter_approximate():
+    # Given
+    counter = TotalCounter(ttl=0, approximate_threshold=10, approximate_ttl=60)
+    counter.get("posts", lambda: 100)
+
+    # When
+    total = counter.get("posts", lambda: 200)
+
+    # Then
+    assert total == (100, True)
+
+
+def test_read_recent_feed(post_payload: PostPayload, comment_payload: CommentPayload):
+    # Given
+    client.post("/posts/", json=post_payload.dict())
+    client.post("/posts/1/comments/", json=comment_payload.dict())
+    client.post("/posts/1/comments/", json=comment_payload.dict())
+
+    # When
+    client.delete("/posts/1/comments/1", params={"author": comment_payload.author_id})
+    response = client.get("/feed/recent")
+
+    # Then
+    assert response.status_code == 200
+    assert [(item["type"], item["id"]) for item in response.json()] == [
+        ("comment", 2),
+        ("post", 1),
+    ]
+
+
+def test_read_recent_feed_rejects_non_positive_limit():
+    # Given
+    # When
+    responses = [client.get("/feed/recent", params={"limit": limit}) for limit in (0, -1)]
+
+    # Then
+    assert [response.status_code for response in responses] == [422, 422]
+
+
+def test_warm_recent_feed(post_payload: PostPayload, comment_payload: CommentPayload):
+    # Given
+    with Session(engine) as session:
+        session.add(Post.from_orm(post_payload))
+        session.commit()
+        session.add(Comment(post_id=1, **comment_payload.dict()))
+        session.commit()
+
+        # When
+        warm_recent_feed(session)
+
+    response = client.get("/feed/recent", params={"limit": 1})
+
+    # Then
+    assert [(item["type"], item["id"]) for item in response.json()] == [("comment", 1)]
+
+
+def test_comment_hub_publish_and_evict_slow_consumer():
+    # Given
+    hub = CommentHub(queue_size=2)
+
+    async def scenario():
+        fast = hub.subscribe(1)
+        slow = hub.subscribe(1)
+        other = hub.subscribe(2)
+
+        # When
+        hub.publish(1, "created", '{"id": 1}')
+        assert (await fast.queue.get()).event == "created"
+        hub.publish(1, "updated", '{"id": 1}')
+        hub.publish(1, "deleted", '{"id": 1}')
+
+        # Then
+        assert not fast.evicted
+        assert slow.evicted
+        assert await slow.queue.get() is None
+        assert other.queue.empty()
+
+    asyncio.run(scenario())
+
+
+def test_comment_hub_resume_from_last_event_id():
+    # Given
+    hub = CommentHub()
+    first = hub.publish(1, "created", '{"id": 1}')
+    hub.publish(2, "created", '{"id": 2}')
+    second = hub.publish(1, "created", '{"id": 3}')
+
+    async def scenario():
+        # When
+        subscriber = hub.subscribe(1, last_event_id=first.id)
+        stale = hub.subscribe(1, last_event_id=first.id - 10)
+
+        # Then
+        assert (await subscriber.queue.get()).id == second.id
+        assert subscriber.queue.empty()
+        assert (await stale.queue.get()).event == "reset"
+
+    asyncio.run(scenario())
+
+
+def test_comment_hub_resets_instead_of_truncating_replay():
+    # Given
+    hub = CommentHub(queue_size=2)
+    first = hub.publish(1, "created", '{"id": 1}')
+    hub.publish(1, "created", '{"id": 2}')
+    last = hub.publish(1, "created", '{"id": 3}')
+
+    async def scenario():
+        # When
+        subscriber = hub.subscribe(1, last_event_id=first.id - 1)
+
+        # Then
+        reset = await subscriber.queue.get()
+        assert (reset.event, reset.id) == ("reset", last.id)
+        assert subscriber.queue.empty()
+
+    asyncio.run(scenario())
+
+
+def test_stream_post_comments_sse_replays_after_last_event_id(
+    post_payload: PostPayload, comment_payload: CommentPayload
+):
+    # Given
+    client.post("/posts/", json=post_payload.dict())
+    client.post("/posts/1/comments/", json=comment_payload.dict())
+    second = client.post("/posts/1/comments/", json=comment_payload.dict()).json()
+    first_event, second_event = [event for event in comment_hub._history if event.post_id == 1]
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/posts/1/comments/stream",
+        "raw_path": b"/posts/1/comments/stream",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"testserver"), (b"last-event-id", str(first_event.id).encode())],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+    }
+
+    async def scenario():
+        messages = []
+        received = asyncio.Event()
+
+        async def receive():
+            await received.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+            if b"event: created" in message.get("body", b""):
+                received.set()
+
+        # When
+        await asyncio.wait_for(app(scope, receive, send), 5)
+        return messages
+
+    messages = asyncio.run(scenario())
+
+    # Then
+    assert messages[0]["status"] == 200
+    assert (b"content-type", b"text/event-stream; charset=utf-8") in messages[0]["headers"]
+    body = b"".join(message.get("body", b"") for message in messages[1:]).decode()
+    assert body.startswith(f"id: {second_event.id}\nevent: created\n")
+    assert f'"id":{second["id"]}' in body.replace(" ", "")
+    assert f"id: {first_event.id}\n" not in body
+
+
+def test_stream_post_comments_websocket(
+    post_payload: PostPayload, comment_payload: CommentPayload
+):
+    # Given
+    client.post("/posts/", json=post_payload.dict())
+    first = client.post("/posts/1/comments/", json=comment_payload.dict()).json()
+    second = client.post("/posts/1/comments/", json=comment_payload.dict()).json()
+    first_event_id = next(event.id for event in comment_hub._history if event.post_id == 1)
+
+    # When
+    with client.websocket_connect(f"/posts/1/comments/ws?last_event_id={first_event_id}") as ws:
+        message = ws.receive_json()
+
+    # Then
+    assert first["id"] == 1
+    assert message["event"] == "created"
+    assert message["data"]["id"] == second["id"]
+
+
+def test_create_db_and_tables_skips_unchanged_schema():
+    # Given
+    memory_engine = create_engine("sqlite://")
+
+    # When
+    created = create_db_and_tables(memory_engine)
+    skipped = not create_db_and_tables(memory_engine)
+
+    # Then
+    assert created and skipped
+    assert stored_schema_fingerprint(memory_engine) == schema_fingerprint(memory_engine)
+
+
+def test_create_db_and_tables_migrates_existing_tables():
+    # Given
+    memory_engine = create_engine("sqlite://")
+    with memory_engine.begin() as connection:
+        for statement in (
+            "CREATE TABLE user (id VARCHAR PRIMARY KEY, password VARCHAR NOT NULL, "
+            "nickname VARCHAR(20), role VARCHAR(20) NOT NULL, created_at DATETIME NOT NULL)",
+            "CREATE TABLE post (id INTEGER PRIMARY KEY, title VARCHAR NOT NULL, "
+            "content VARCHAR, author_id VARCHAR NOT NULL REFERENCES user (id))",
+            "CREATE TABLE comment (id INTEGER PRIMARY KEY, author_id VARCHAR NOT NULL, "
+            "post_id INTEGER NOT NULL, content VARCHAR, created_at DATETIME NOT NULL)",
+            "INSERT INTO user VALUES ('user1', 'Password1', 'nick', 'MEMBER', "
+            "'2023-01-01 00:00:00')",
+            "INSERT INTO post VALUES (1, 'title', 'content', 'user1')",
+            "INSERT INTO comment VALUES (7, 'user1', 1, 'comment', '2023-01-01 00:00:00')",
+        ):
+            connection.exec_driver_sql(statement)
+
+    # When
+    created = create_db_and_tables(memory_engine)
+
+    # Then
+    assert created
+    with Session(memory_engine) as session:
+        post = session.get(Post, 1)
+        comment = session.get(Comment, 7)
+    assert post.version == 1 and post.created_at is not None
+    assert comment.parent_id is None and comment.depth == 0
+    assert comment.path == "0000000007/"
+
+
+def test_create_db_and_tables_keeps_fingerprint_when_migration_fails():
+    # Given
+    memory_engine = create_engine("sqlite://")
+    with memory_engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE post (id INTEGER PRIMARY KEY)")
+
+    # When
+    with patch("database.add_missing_columns"), pytest.raises(RuntimeError) as error:
+        create_db_and_tables(memory_engine)
+
+    # Then
+    assert "post.title" in str(error.value)
+    assert stored_schema_fingerprint(memory_engine) is None
+
+
+def test_readiness_before_startup():
+    # Given
+    # When
+    response = client.get("/health/ready")
+
+    # Then
+    assert response.status_code == 503
+    assert response.json()["ready"] is False
+
+
+def test_read_posts_batch(post_payload: PostPayload):
+    # Given
+    with Session(engine) as session:
+        session.add(Post.from_orm(post_payload))
+        session.add(Post.from_orm(post_payload))
+        session.commit()
+
+    # When
+    response = client.get("/posts/batch", params={"ids": "2,999,1,2"})
+
+    # Then
+    assert response.status_code == 200
+    body = response.json()
+    assert [post["id"] for post in body["items"]] == [2, 1]
+    assert body["missing"] == [999]
+
+
+def test_read_posts_batch_invalid_ids():
+    # Given
+    # When
+    response = client.get("/posts/batch", params={"ids": "1,abc"})
+
+    # Then
+    assert response.status_code == 422
+
+
+def test_read_users_batch(user_payload: UserPayload):
+    # Given
+    with Session(engine) as session:
+        session.add(User.from_orm(user_payload))
+        session.commit()
+
+    # When
+    response = client.get("/users/batch", params={"ids": f"unknown,{user_payload.id}"})
+
+    # Then
+    assert response.status_code == 200
+    body = response.json()
+    assert [user["id"] for user in body["items"]] == [user_payload.id]
+    assert body["missing"] == ["unknown"]
+
+
+def test_read_posts_with_author(user_payload: UserPayload):
+    # Given
+    other = UserPayload(nickname="Other")
+    with Session(engine) as session:
+        session.add(User.from_orm(user_payload))
+        session.add(User.from_orm(other))
+        for author_id in (user_payload.id, other.id, user_payload.id):
+            session.add(Post.from_orm(PostPayload(author_id=author_id)))
+        session.commit()
+
+    statements = []
+
+    def count_user_queries(conn, cursor, statement, *args):
+        if 'FROM "user"' in statement or "FROM user" in statement:
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count_user_queries)
+
+    # When
+    try:
+        response = client.get("/posts/", params={"with_author": True})
+    finally:
+        event.remove(engine, "before_cursor_execute", count_user_queries)
+
+    # Then
+    assert response.status_code == 200
+    assert [post["author"]["nickname"] for post in response.json()] == [
+        "Anonymous",
+        "Other",
+        "Anonymous",
+    ]
+    assert len(statements) == 1
+
+
+def test_read_post_comments_fields_with_author(
+    user_payload: UserPayload, post_payload: PostPayload, comment_payload: CommentPayload
+):
+    # Given
+    with Session(engine) as session:
+        session.add(User.from_orm(user_payload))
+        session.add(Post.from_orm(post_payload))
+        session.add(Comment(post_id=1, **comment_payload.dict()))
+        session.commit()
+
+    # When
+    response = client.get("/posts/1/comments/", params={"fields": "id", "with_author": True})
+
+    # Then
+    assert response.status_code == 200
+    assert response.json() == [
+        {
+            "id": 1,
+            "author_id": user_payload.id,
+            "author": {"id": user_payload.id, "nickname": user_payload.nickname},
+        }
+    ]
+
+
+def test_read_comment_tree(post_payload: PostPayload, comment_payload: CommentPayload):
+    # Given
+    client.post("/posts/", json=post_payload.dict())
+    comment = comment_payload.dict()
+    for parent_id in (None, 1, 2, None, 1):
+        response = client.post("/posts/1/comments/", json={**comment, "parent_id": parent_id})
+        assert response.status_code == 201
+
+    # When
+    response = client.get("/posts/1/comments/tree", params={"limit": 1, "max_depth": 2})
+
+    # Then
+    assert response.status_code == 200
+    tree = response.json()
+    assert tree["cursor"] == 1
+    [root] = tree["items"]
+    assert (root["id"], root["replies_cursor"]) == (1, 2)
+    [reply] = root["replies"]
+    assert (reply["id"], reply["depth"], reply["replies"]) == (2, 1, [])
+
+    next_page = client.get("/posts/1/comments/tree", params={"after": 1}).json()
+    assert [node["id"] for node in next_page["items"]] == [4]
+
+
+def test_read_comment_subtree(post_payload: PostPayload, comment_payload: CommentPayload):
+    # Given
+    client.post("/posts/", json=post_payload.dict())
+    comment = comment_payload.dict()
+    for parent_id in (None, 1, 2, None, 1):
+        client.post("/posts/1/comments/", json={**comment, "parent_id": parent_id})
+
+    # When
+    response = client.get("/comments/1/subtree")
+    page = client.get("/comments/1/subtree", params={"after": 2})
+
+    # Then
+    assert response.status_code == 200
+    subtree = response.json()
+    assert subtree["root"]["id"] == 1
+    assert [node["id"] for node in subtree["items"]] == [2, 5]
+    assert [node["id"] for node in subtree["items"][0]["replies"]] == [3]
+    assert [node["id"] for node in page.json()["items"]] == [5]
+
+
+def test_read_comment_tree_and_subtree_in_one_indexed_query(
+    post_payload: PostPayload, comment_payload: CommentPayload
+):
+    # Given
+    client.post("/posts/", json=post_payload.dict())
+    comment = comment_payload.dict()
+    for parent_id in (None, 1, None, 3):
+        client.post("/posts/1/comments/", json={**comment, "parent_id": parent_id})
+
+    statements = []
+
+    def record_statements(conn, cursor, statement, params, *args):
+        statements.append((statement, params))
+
+    event.listen(engine, "before_cursor_execute", record_statements)
+
+    # When
+    try:
+        tree = client.get("/posts/1/comments/tree", params={"limit": 1}).json()
+        subtree = client.get("/comments/3/subtree").json()
+    finally:
+        event.remove(engine, "before_cursor_execute", record_statements)
+
+    # Then
+    [root] = tree["items"]
+    assert (root["id"], [reply["id"] for reply in root["replies"]]) == (1, [2])
+    assert (subtree["root"]["id"], [node["id"] for node in subtree["items"]]) == (3, [4])
+    assert len(statements) == 2
+    with engine.connect() as connection:
+        for statement, params in statements:
+            plan = [
+                row[-1]
+                for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", params)
+            ]
+            assert not [step for step in plan if step.startswith("SCAN comment")]
+            assert "USING INDEX ix_comment_post_id_path" in " ".join(plan)
+
+
+def test_create_comment_reply_parent_not_found(
+    post_payload: PostPayload, comment_payload: CommentPayload
+):
+    # Given
+    client.post("/posts/", json=post_payload.dict())
+
+    # When
+    response = client.post(
+        "/posts/1/comments/", json={**comment_payload.dict(), "parent_id": 999999}
+    )
+
+    # Then
+    assert response.status_code == 404
+
+
+def test_trending_index_ranks_by_decayed_activity():
+    # Given
+    index = TrendingIndex(size=2, half_life=60)
+    now = time.time()
+    index.add(1, now - 600)
+    index.add(1, now - 600)
+    index.add(2, now)
+    index.add(3, now - 60)
+
+    # When
+    top = index.top(10)
+
+    # Then
+    assert [post_id for post_id, _ in top] == [2, 3]
+    assert top[0][1] == pytest.approx(1.0, rel=1e-3)
+    assert top[1][1] == pytest.approx(0.5, rel=1e-3)
+
+
+def test_trending_index_rebuilds_after_decrease():
+    # Given
+    index = TrendingIndex(size=1, half_life=60)
+    now = time.time()
+    index.add(1, now)
+    index.add(1, now)
+    index.add(2, now)
+
+    # When
+    index.add(1, now, -1)
+    index.add(1, now, -1)
+
+    # Then
+    assert [post_id for post_id, _ in index.top(1)] == [2]
+
+
+def test_read_trending_posts(post_payload: PostPayload, comment_payload: CommentPayload):
+    # Given
+    client.post("/posts/", json=post_payload.dict())
+    client.post("/posts/", json=post_payload.dict())
+    client.post("/posts/2/comments/", json=comment_payload.dict())
+    client.post("/posts/1/comments/", json=comment_payload.dict())
+    client.post("/posts/2/comments/", json=comment_payload.dict())
+
+    # When
+    response = client.get("/posts/trending")
+
+    # Then
+    assert response.status_code == 200
+    assert [post["post_id"] for post in response.json()] == [2, 1]
+
+
+def test_warm_trending_from_snapshot(post_payload: PostPayload, comment_payload: CommentPayload):
+    # Given
+    client.post("/posts/", json=post_payload.dict())
+    client.post("/posts/", json=post_payload.dict())
+    client.post("/posts/1/comments/", json=comment_payload.dict())
+    with Session(engine) as session:
+        save_trending_snapshot(*trending_index.snapshot(), session)
+        session.add(Comment(post_id=2, **comment_payload.dict()))
+        session.add(Comment(post_id=2, **comment_payload.dict()))
+        session.commit()
+    trending_index.clear()
+
+    # When
+    with Session(engine) as session:
+        warm_trending(session)
+
+    # Then
+    assert [post_id for post_id, _ in trending_index.top(10)] == [2, 1]
+
+
+def test_create_post_idempotency_key_replays_response(post_payload: PostPayload):
+    # Given
+    headers = {"Idempotency-Key": "create-post-1"}
+    first = client.post("/posts/", json=post_payload.dict(), headers=headers)
+
+    # When
+    retried = client.post("/posts/", json=post_payload.dict(), headers=headers)
+
+    # Then
+    assert retried.status_code == first.status_code == 201
+    assert retried.json() == first.json()
+    assert retried.headers["idempotent-replayed"] == "true"
+    with Session(engine) as session:
+        assert len(session.exec(select(Post)).all()) == 1
+
+
+def test_create_post_idempotency_key_reused_with_different_body(post_payload: PostPayload):
+    # Given
+    headers = {"Idempotency-Key": "create-post-2"}
+    client.post("/posts/", json=post_payload.dict(), headers=headers)
+
+    # When
+    response = client.post(
+        "/posts/", json={**post_payload.dict(), "title": "Other"}, headers=headers
+    )
+
+    # Then
+    assert response.status_code == 422
+
+
+def test_idempotency_concurrent_duplicates_wait_for_in_flight_request():
+    # Given
+    calls = []
+
+    async def slow_app(scope, receive, send):
+        calls.append(scope["path"])
+        await asyncio.sleep(0.01)
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": str(len(calls)).encode()})
+
+    middleware = IdempotencyMiddleware(slow_app, IdempotencyStore())
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/posts/",
+        "headers": [(b"idempotency-key", b"same")],
+    }
+
+    async def request():
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"{}", "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        await middleware(scope, receive, send)
+        return sent[-1]["body"]
+
+    async def scenario():
+        return await asyncio.gather(request(), request(), request())
+
+    # When
+    bodies = asyncio.run(scenario())
+
+    # Then
+    assert calls == ["/posts/"]
+    assert bodies == [b"1", b"1", b"1"]
+
+
+def test_idempotency_failure_releases_key_for_waiting_duplicates():
+    # Given
+    calls = []
+
+    async def flaky_app(scope, receive, send):
+        calls.append(scope["path"])
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        await send({"type": "http.response.start", "status": 201, "headers": []})
+        await send({"type": "http.response.body", "body": str(len(calls)).encode()})
+
+    middleware = IdempotencyMiddleware(flaky_app, IdempotencyStore())
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/posts/",
+        "headers": [(b"idempotency-key", b"same")],
+    }
+
+    async def request():
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"{}", "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        await middleware(scope, receive, send)
+        return sent[-1]["body"]
+
+    async def scenario():
+        return await asyncio.gather(request(), request(), request(), return_exceptions=True)
+
+    # When
+    first, second, third = asyncio.run(scenario())
+
+    # Then
+    assert isinstance(first, RuntimeError)
+    assert (second, third) == (b"2", b"2")
+    assert len(calls) == 2
+
+
+def test_idempotency_store_never_evicts_in_flight_entries():
+    # Given
+    store = IdempotencyStore(max_entries=1)
+
+    async def scenario():
+        first = store.begin(("/posts/", "1"), "a")
+        second = store.begin(("/posts/", "2"), "b")
+        both_kept = store.get(("/posts/", "1")) is first and store.get(("/posts/", "2")) is second
+
+        # When
+        store.complete(("/posts/", "1"), first, StoredResponse(201, [], b""))
+        store.begin(("/posts/", "3"), "c")
+        return both_kept
+
+    both_kept = asyncio.run(scenario())
+
+    # Then
+    assert both_kept
+    assert store.get(("/posts/", "1")) is None
+    assert store.get(("/posts/", "2")) is not None
+
+
+def test_profiler_writes_collapsed_stacks(tmp_path):
+    # Given
+    def busy_loop():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+
+    async def busy_app(scope, receive, send):
+        scope["endpoint"] = busy_app
+        busy_loop()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    profiled_client = TestClient(ProfilerMiddleware(busy_app, token="secret", directory=tmp_path))
+
+    # When
+    skipped = profiled_client.get("/")
+    non_ascii = profiled_client.get("/", headers={"X-Profile": "비밀".encode()})
+    response = profiled_client.get("/", headers={"X-Profile": "secret"})
+
+    # Then
+    assert "x-profile-id" not in skipped.headers
+    assert non_ascii.status_code == 200 and "x-profile-id" not in non_ascii.headers
+    profile_id = response.headers["x-profile-id"]
+    folded = (tmp_path / "busy_app" / f"{profile_id}.folded").read_text()
+    assert "busy_loop (test_main.py" in folded
+    assert (tmp_path / "busy_app.folded").read_text() == folded
+
+
+def test_profiler_disabled_by_default():
+    # Given
+    # When
+    middleware = ProfilerMiddleware(app, token="", sample_rate=0)
+
+    # Then
+    assert not middleware.enabled
+
+
+def test_query_log_captures_slow_query_with_plan(
+    user_payload: UserPayload, post_payload: PostPayload
+):
+    # Given
+    client.post("/users/", json=user_payload.dict())
+    client.post("/posts/", json=post_payload.dict())
+    query_log = QueryLog(threshold=0)
+    query_log.install(engine)
+
+    # When
+    try:
+        client.get(f"/users/{user_payload.id}/posts")
+    finally:
+        query_log.uninstall(engine)
+
+    # Then
+    slow = [query for query in query_log.recent_slow if "FROM post" in query["statement"]]
+    assert slow
+    assert slow[0]["origin"].startswith("get_posts_by_user (service.py:")
+    assert slow[0]["plan"]
+    top = query_log.report(limit=5)
+    assert top[0]["total_ms"] >= top[-1]["total_ms"]
+    assert sum(stats["count"] for stats in top) >= len(slow)
+
+
+def test_query_log_redacts_parameters_and_survives_errors(user_payload: UserPayload):
+    # Given
+    query_log = QueryLog(threshold=0)
+    query_log.install(engine)
+
+    # When
+    try:
+        client.post("/users/", json=user_payload.dict())
+        with engine.connect() as connection:
+            with pytest.raises(Exception):
+                connection.exec_driver_sql("SELECT * FROM missing_table")
+            started = list(connection.info["query_started"])
+    finally:
+        query_log.uninstall(engine)
+
+    # Then
+    [insert] = [
+        query
+        for query in query_log.recent_slow
+        if query["statement"].startswith("INSERT INTO user (")
+    ]
+    assert user_payload.password not in insert["parameters"]
+    assert "***" in insert["parameters"]
+    assert started == []
+
+
+def test_query_report_requires_admin(user_payload: UserPayload):
+    # Given
+    admin = UserPayload(id="admin_user", role="admin")
+    for payload in (user_payload, admin):
+        client.post("/users/", json=payload.dict())
+        client.post("/users/login", auth=(payload.id, payload.password))
+
+    # When
+    member_response = client.get("/admin/queries", auth=(user_payload.id, user_payload.password))
+    admin_response = client.get("/admin/queries", auth=(admin.id, admin.password))
+
+    # Then
+    assert member_response.status_code == 403
+    assert admin_response.status_code == 200
+    assert set(admin_response.json()) == {"threshold_ms", "top", "slow"}
+
+
+def test_structured_log_carries_request_id():
+    # Given
+    stream = io.StringIO()
+    test_logger = logging.getLogger("test_main.request")
+
+    async def logging_app(scope, receive, send):
+        test_logger.warning("handled", extra={"post_id": 1})
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    logged_client = TestClient(RequestIdMiddleware(logging_app))
+
+    # When
+    setup_logging(stream=stream)
+    try:
+        response = logged_client.get("/", headers={"X-Request-ID": "req-1"})
+        generated = logged_client.get("/")
+    finally:
+        shutdown_logging()
+
+    # Then
+    assert response.headers["x-request-id"] == "req-1"
+    assert generated.headers["x-request-id"] != "req-1"
+    entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+    handled = [entry for entry in entries if entry["logger"] == "test_main.request"]
+    assert [entry["request_id"] for entry in handled] == [
+        "req-1",
+        generated.headers["x-request-id"],
+    ]
+    assert handled[0]["message"] == "handled"
+    assert handled[0]["post_id"] == 1
+
+
+def test_error_logs_are_rate_limited():
+    # Given
+    rate_limit = ErrorRateLimitFilter(interval=60, burst=2)
+
+    def record(level: int) -> logging.LogRecord:
+        return logging.LogRecord("service", level, "service.py", 10, "failed", None, None)
+
+    # When
+    passed = [rate_limit.filter(record(logging.ERROR)) for _ in range(5)]
+    warning_passed = rate_limit.filter(record(logging.WARNING))
+
+    # Then
+    assert passed == [True, True, False, False, False]
+    assert warning_passed
+
+
+def test_update_post_single_round_trip_with_version(post_payload: PostPayload):
+    # Given
+    with Session(engine) as session:
+        session.add(Post.from_orm(post_payload))
+        session.commit()
+
+    statements = []
+
+    def record_statements(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    update_post = post_payload.dict()
+    update_post["title"] = "UpdatedTitle"
+    event.listen(engine, "before_cursor_execute", record_statements)
+
+    # When
+    try:
+        response = client.put("/posts/1", json=update_post, headers={"If-Match": '"1"'})
+    finally:
+        event.remove(engine, "before_cursor_execute", record_statements)
+    stale = client.put("/posts/1", json=update_post, headers={"If-Match": '"1"'})
+
+    # Then
+    assert response.status_code == 200
+    assert response.json()["version"] == 2
+    assert response.headers["etag"] == '"2"'
+    assert len(statements) == 1
+    assert statements[0].startswith("UPDATE post") and "RETURNING" in statements[0]
+    assert stale.status_code == 412
+    assert stale.headers["etag"] == '"2"'
+
+
+def test_sqlite_compiler_renders_returning():
+    # Given
+    statement = update(Post).where(Post.id == 1).values(version=2).returning(Post.version)
+
+    # When
+    compiled = str(statement.compile(dialect=sqlite_dialect()))
+
+    # Then
+    # database.py가 SQLAlchemy 1.4 컴파일러 내부에 기대므로, 버전을 올리면 이 테스트부터 확인한다.
+    assert sqlalchemy.__version__ == "1.4.41"
+    assert compiled.endswith("RETURNING post.version")
+
+
+def test_versioned_writes_without_returning_support(post_payload: PostPayload):
+    # Given
+    client.post("/posts/", json=post_payload.dict())
+    update_post = {**post_payload.dict(), "title": "UpdatedTitle"}
+
+    # When
+    with patch("service.SUPPORTS_RETURNING", False):
+        updated = client.put("/posts/1", json=update_post, headers={"If-Match": '"1"'})
+        stale = client.put("/posts/1", json=update_post, headers={"If-Match": '"1"'})
+        deleted = client.delete(
+            "/posts/1", params={"author": post_payload.author_id}, headers={"If-Match": '"2"'}
+        )
+
+    # Then
+    assert updated.status_code == 200
+    assert (updated.json()["title"], updated.json()["version"]) == ("UpdatedTitle", 2)
+    assert stale.status_code == 412
+    assert deleted.status_code == 200
+    assert client.get("/posts/1").status_code == 404
+
+
+def post_changes() -> list:
+    with Session(engine) as session:
+        query = select(ChangeLog).where(ChangeLog.entity == "post").order_by(ChangeLog.seq)
+        return [(change.entity_id, change.deleted) for change in session.exec(query)]
+
+
+def test_update_post_records_change_in_the_same_statement(post_payload: PostPayload):
+    # Given
+    client.post("/users/", json=UserPayload(id=post_payload.author_id).dict())
+    client.post("/posts/", json=post_payload.dict())
+    statements = []
+
+    def record_statements(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    update_post = {**post_payload.dict(), "title": "UpdatedTitle"}
+    event.listen(engine, "before_cursor_execute", record_statements)
+
+    # When
+    try:
+        response = client.put("/posts/1", json=update_post, headers={"If-Match": '"1"'})
+    finally:
+        event.remove(engine, "before_cursor_execute", record_statements)
+    with patch.object(Session, "commit", side_effect=RuntimeError("커밋 실패")):
+        with pytest.raises(RuntimeError):
+            client.put("/posts/1", json=update_post, headers={"If-Match": '"2"'})
+
+    # Then
+    assert response.status_code == 200
+    assert len(statements) == 1
+    assert statements[0].startswith("UPDATE post") and "RETURNING" in statements[0]
+    # 커밋하지 못한 수정은 변경 기록도 함께 되돌려진다.
+    assert post_changes() == [(1, False), (1, False)]
+    assert client.get("/posts/1").json()["version"] == 2
+
+
+def test_update_comment_precondition_failed(
+    user_payload: UserPayload, post_payload: PostPayload, comment_payload: CommentPayload
+):
+    # Given
+    client.post("/users/", json=user_payload.dict())
+    client.post("/posts/", json=post_payload.dict())
+    created = client.post("/posts/1/comments/", json=comment_payload.dict()).json()
+    update_comment = {
+        "content": "Updated",
+        "author_id": user_payload.id,
+        "password": user_payload.password,
+    }
+
+    # When
+    updated = client.put("/posts/1/comments/1", json=update_comment, headers={"If-Match": '"1"'})
+    stale = client.put("/posts/1/comments/1", json=update_comment, headers={"If-Match": '"1"'})
+    wrong_password = client.put(
+        "/posts/1/comments/1", json={**update_comment, "password": "WrongPassword1"}
+    )
+    stale_delete = client.delete(
+        "/posts/1/comments/1", params={"author": user_payload.id}, headers={"If-Match": '"1"'}
+    )
+    deleted = client.delete(
+        "/posts/1/comments/1", params={"author": user_payload.id}, headers={"If-Match": '"2"'}
+    )
+
+    # Then
+    assert created["version"] == 1
+    assert updated.status_code == 200
+    assert updated.json()["content"] == "Updated"
+    assert updated.json()["version"] == 2
+    assert stale.status_code == 412
+    assert wrong_password.status_code == 403
+    assert stale_delete.status_code == 412
+    assert deleted.status_code == 200
+    with Session(engine) as session:
+        assert session.get(Comment, 1) is None
+
+
+def test_archived_comments_are_merged_into_pages(
+    user_payload: UserPayload, post_payload: PostPayload
+):
+    # Given
+    old = datetime.utcnow() - timedelta(days=365)
+    with Session(engine) as session:
+        session.add(User.from_orm(user_payload))
+        session.add(Post.from_orm(post_payload))
+        for index in range(5):
+            session.add(
+                Comment(
+                    post_id=1,
+                    author_id=user_payload.id,
+                    content=f"comment {index}",
+                    created_at=old if index < 3 else datetime.utcnow(),
+                )
+            )
+        session.commit()
+
+    # When
+    with Session(engine) as session:
+        moved = archive_comments(datetime.utcnow() - timedelta(days=1), session)
+    first_page = client.get("/posts/1/comments/", params={"limit": 2, "with_total": True})
+    boundary_page = client.get("/posts/1/comments/", params={"limit": 2, "page": 1})
+    projected = client.get(
+        f"/users/{user_payload.id}/comments", params={"limit": 5, "fields": "id,content"}
+    )
+
+    # Then
+    assert moved == 3
+    with Session(engine) as session:
+        assert len(session.exec(select(Comment)).all()) == 2
+        archived = session.exec(select(CommentArchive)).all()
+        assert [comment.id for comment in archived] == [1, 2, 3]
+        assert isinstance(archived[0].content, bytes)
+    assert [comment["id"] for comment in first_page.json()] == [1, 2]
+    assert first_page.json()[0]["content"] == "comment 0"
+    assert first_page.headers["x-total-count"] == "5"
+    assert [comment["id"] for comment in boundary_page.json()] == [3, 4]
+    assert projected.json() == [
+        {"id": index + 1, "content": f"comment {index}"} for index in range(5)
+    ]
+
+
+def test_archive_stops_at_the_first_recent_comment(
+    user_payload: UserPayload, post_payload: PostPayload
+):
+    # Given
+    old = datetime.utcnow() - timedelta(days=365)
+    with Session(engine) as session:
+        session.add(User.from_orm(user_payload))
+        session.add(Post.from_orm(post_payload))
+        # 3번은 과거 시각으로 가져온 댓글처럼 아이디는 크지만 오래되었다.
+        for created_at in (old, datetime.utcnow(), old):
+            session.add(Comment(post_id=1, author_id=user_payload.id, created_at=created_at))
+        session.commit()
+
+    # When
+    with Session(engine) as session:
+        moved = archive_comments(datetime.utcnow() - timedelta(days=1), session, batch_size=1)
+    pages = [
+        client.get("/posts/1/comments/", params={"limit": 1, "page": page}).json()
+        for page in range(3)
+    ]
+
+    # Then
+    assert moved == 1
+    with Session(engine) as session:
+        assert [comment.id for comment in session.exec(select(CommentArchive))] == [1]
+    assert [comment["id"] for page in pages for comment in page] == [1, 2, 3]
+
+
+def test_delete_archived_comment(user_payload: UserPayload, post_payload: PostPayload):
+    # Given
+    with Session(engine) as session:
+        session.add(User.from_orm(user_payload))
+        session.add(Post.from_orm(post_payload))
+        session.add(Comment(post_id=1, author_id=user_payload.id, content="old"))
+        session.commit()
+        archive_comments(datetime.utcnow() + timedelta(seconds=1), session)
+
+    # When
+    forbidden = client.delete("/posts/1/comments/1", params={"author": "someone"})
+    response = client.delete("/posts/1/comments/1", params={"author": user_payload.id})
+    missing = client.delete("/posts/1/comments/1", params={"author": user_payload.id})
+
+    # Then
+    assert forbidden.status_code == 403
+    assert response.status_code == 200
+    assert missing.status_code == 404
+    with Session(engine) as session:
+        assert session.get(CommentArchive, 1) is None
+
+
+def test_reply_to_archived_comment_gets_new_id_and_joins_tree(
+    post_payload: PostPayload, comment_payload: CommentPayload
+):
+    # Given
+    client.post("/posts/", json=post_payload.dict())
+    comment = comment_payload.dict()
+    client.post("/posts/1/comments/", json=comment)
+    client.post("/posts/1/comments/", json={**comment, "parent_id": 1})
+    with Session(engine) as session:
+        archive_comments(datetime.utcnow() + timedelta(seconds=1), session)
+
+    # When
+    response = client.post("/posts/1/comments/", json={**comment, "parent_id": 1})
+    tree = client.get("/posts/1/comments/tree").json()
+    subtree = client.get("/comments/1/subtree").json()
+
+    # Then
+    assert response.status_code == 201
+    assert (response.json()["id"], response.json()["depth"]) == (3, 1)
+    [root] = tree["items"]
+    assert (root["id"], root["content"]) == (1, comment["content"])
+    assert [reply["id"] for reply in root["replies"]] == [2, 3]
+    assert subtree["root"]["id"] == 1
+    assert [node["id"] for node in subtree["items"]] == [2, 3]
+
+
+def test_create_db_and_tables_rebuilds_comment_with_autoincrement():
+    # Given
+    memory_engine = create_engine("sqlite://")
+    create_db_and_tables(memory_engine)
+    with memory_engine.begin() as connection:
+        sql = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE name = 'comment'"
+        ).scalar()
+        connection.exec_driver_sql("DROP TABLE comment")
+        connection.exec_driver_sql(sql.replace(" AUTOINCREMENT", ""))
+        connection.exec_driver_sql("DELETE FROM schema_version")
+    with Session(memory_engine) as session:
+        session.add(User(id="user1", password="Password1"))
+        session.add(Post(title="title", author_id="user1"))
+        session.add(Comment(id=3, post_id=1, author_id="user1", path="0000000003/"))
+        session.add(
+            CommentArchive(id=9, post_id=1, author_id="user1", created_at=datetime.utcnow())
+        )
+        session.commit()
+
+    # When
+    create_db_and_tables(memory_engine)
+    with Session(memory_engine) as session:
+        created = Comment(post_id=1, author_id="user1")
+        session.add(created)
+        session.commit()
+        created_id = created.id
+        kept = session.get(Comment, 3)
+
+    # Then
+    assert kept is not None
+    assert created_id == 10
+    with memory_engine.connect() as connection:
+        sql = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE name = 'comment'"
+        ).scalar()
+    assert "AUTOINCREMENT" in sql
+
+
+def test_anonymous_post_list_is_cached_and_invalidated(
+    user_payload: UserPayload, post_payload: PostPayload
+):
+    # Given
+    client.post("/users/", json=user_payload.dict())
+    client.post("/posts/", json=post_payload.dict())
+
+    # When
+    miss = client.get("/posts/")
+    hit = client.get("/posts/")
+    authenticated = client.get("/posts/", auth=(user_payload.id, user_payload.password))
+    client.post("/posts/", json=post_payload.dict())
+    after_write = client.get("/posts/")
+
+    # Then
+    assert miss.headers["x-cache"] == "MISS"
+    assert miss.headers["cache-control"] == "private, no-cache"
+    assert hit.headers["etag"] == miss.headers["etag"]
+    assert hit.headers["x-cache"] == "HIT"
+    assert hit.json() == miss.json()
+    assert hit.headers["x-request-id"] != miss.headers["x-request-id"]
+    assert "x-cache" not in authenticated.headers
+    assert after_write.headers["x-cache"] == "MISS"
+    assert len(after_write.json()) == 2
+
+
+def test_post_list_revalidates_with_etag_and_skips_since(
+    user_payload: UserPayload, post_payload: PostPayload
+):
+    # Given
+    client.post("/users/", json=user_payload.dict())
+    client.post("/posts/", json=post_payload.dict())
+    etag = client.get("/posts/").headers["etag"]
+
+    # When
+    not_modified = client.get("/posts/", headers={"If-None-Match": etag})
+    client.post("/posts/", json=post_payload.dict())
+    modified = client.get("/posts/", headers={"If-None-Match": etag})
+    first_sync = client.get("/posts/", params={"since": 0})
+    second_sync = client.get("/posts/", params={"since": 0})
+
+    # Then
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+    assert modified.status_code == 200
+    assert modified.headers["etag"] != etag
+    assert first_sync.status_code == second_sync.status_code == 200
+    assert "x-cache" not in first_sync.headers
+    assert "x-cache" not in second_sync.headers
+
+
+def test_response_cache_serves_stale_while_revalidating():
+    # Given
+    calls = []
+
+    async def counting_app(scope, receive, send):
+        calls.append(scope["path"])
+        body = str(len(calls)).encode()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": body})
+
+    cached_client = TestClient(
+        ResponseCacheMiddleware(counting_app, ResponseCache(ttl=0, stale=60))
+    )
+
+    # When
+    first = cached_client.get("/posts/")
+    stale = cached_client.get("/posts/")
+    revalidated = cached_client.get("/posts/")
+
+    # Then
+    assert (first.headers["x-cache"], first.text) == ("MISS", "1")
+    assert (stale.headers["x-cache"], stale.text) == ("STALE", "1")
+    assert (revalidated.headers["x-cache"], revalidated.text) == ("STALE", "2")
+    assert len(calls) == 3
+
+
+def test_user_stats_are_maintained_by_writes(
+    user_payload: UserPayload, post_payload: PostPayload, comment_payload: CommentPayload
+):
+    # Given
+    client.post("/users/", json=user_payload.dict())
+    client.post("/posts/", json=post_payload.dict())
+    client.post("/posts/", json=post_payload.dict())
+    client.post("/posts/1/comments/", json=comment_payload.dict())
+
+    # When
+    created = client.get(f"/users/{user_payload.id}/stats").json()
+    client.delete("/posts/2", params={"author": user_payload.id})
+    client.delete("/posts/1/comments/1", params={"author": user_payload.id})
+    deleted = client.get(f"/users/{user_payload.id}/stats").json()
+    missing = client.get("/users/nobody/stats")
+
+    # Then
+    assert created["post_count"] == 2
+    assert created["comment_count"] == 1
+    assert created["last_activity_at"] is not None
+    assert deleted["post_count"] == 1
+    assert deleted["comment_count"] == 0
+    assert deleted["last_activity_at"] == created["last_activity_at"]
+    assert missing.status_code == 404
+
+
+def test_repair_user_stats(user_payload: UserPayload, post_payload: PostPayload):
+    # Given
+    admin = UserPayload(id="admin_user", role="admin")
+    with Session(engine) as session:
+        session.add(User.from_orm(user_payload))
+        session.add(Post.from_orm(post_payload))
+        session.commit()
+    client.post("/users/", json=admin.dict())
+    client.post("/users/login", auth=(admin.id, admin.password))
+
+    # When
+    lazily_filled = client.get(f"/users/{user_payload.id}/stats").json()
+    with Session(engine) as session:
+        stats = session.get(UserStats, user_payload.id)
+        assert stats is not None
+        stats.post_count = 42
+        session.add(stats)
+        session.commit()
+    forbidden = client.post("/admin/user-stats/repair")
+    repaired = client.post("/admin/user-stats/repair", auth=(admin.id, admin.password))
+
+    # Then
+    assert lazily_filled["post_count"] == 1
+    assert forbidden.status_code == 401
+    assert repaired.json() == {"users": 2}
+    assert client.get(f"/users/{user_payload.id}/stats").json()["post_count"] == 1
+
+
+def write_jsonl(path, records):
+    path.write_text("\n".join(json.dumps(record) for record in records), encoding="utf-8")
+    return path
+
+
+def test_import_users_posts_and_comments(tmp_path):
+    # Given
+    users = write_jsonl(
+        tmp_path / "users.jsonl",
+        [
+            {"id": "importer", "password": "Password1234!", "nickname": "가져온 사용자"},
+            {"id": "weak", "password": "short", "nickname": "약한 비밀번호"},
+            {"id": "importer", "password": "Password1234!", "nickname": "중복"},
+        ],
+    )
+    posts = tmp_path / "posts.csv"
+    posts.write_text(
+        "title,content,author_id\n첫 글,내용,importer\n없는 작성자,내용,nobody\n둘째 글,내용,importer\n",
+        encoding="utf-8",
+    )
+    comments = write_jsonl(
+        tmp_path / "comments.jsonl",
+        [
+            {"content": "댓글", "author_id": "importer", "post_id": 1},
+            {"content": "대댓글", "author_id": "importer", "post_id": 1, "parent_id": 1},
+            {"content": "대대댓글", "author_id": "importer", "post_id": 1, "parent_id": 2},
+            {"content": "다른 글의 부모", "author_id": "importer", "post_id": 2, "parent_id": 1},
+        ],
+    )
+
+    # When
+    user_report = UserImporter(users, bind=engine, chunk_size=2).run()
+    post_report = PostImporter(posts, bind=engine, chunk_size=2).run()
+    comment_report = CommentImporter(comments, bind=engine, chunk_size=2).run()
+
+    # Then
+    assert (user_report.imported, user_report.rejected) == (1, 2)
+    assert (post_report.imported, post_report.rejected) == (2, 1)
+    assert (comment_report.imported, comment_report.rejected) == (3, 1)
+    with Session(engine) as session:
+        imported = session.exec(select(Comment).order_by(Comment.id)).all()
+        stats = session.get(UserStats, "importer")
+        indexes = session.connection().exec_driver_sql("PRAGMA index_list('user')").all()
+    assert [(comment.path, comment.depth) for comment in imported] == [
+        (Comment.path_segment(1), 0),
+        (Comment.path_segment(1) + Comment.path_segment(2), 1),
+        (Comment.path_segment(1) + Comment.path_segment(2) + Comment.path_segment(3), 2),
+    ]
+    assert (stats.post_count, stats.comment_count) == (2, 3)
+    assert "ix_user_nickname" in {row[1] for row in indexes}
+    response = client.get("/posts/1/comments/")
+    assert [comment["content"] for comment in response.json()] == ["댓글", "대댓글", "대대댓글"]
+
+
+def test_import_comment_replies_to_archived_parent(
+    tmp_path, user_payload: UserPayload, post_payload: PostPayload, comment_payload: CommentPayload
+):
+    # Given
+    client.post("/users/", json=user_payload.dict())
+    client.post("/posts/", json=post_payload.dict())
+    client.post("/posts/1/comments/", json=comment_payload.dict())
+    client.post("/posts/1/comments/", json=comment_payload.dict())
+    client.delete("/posts/1/comments/2", params={"author": comment_payload.author_id})
+    with Session(engine) as session:
+        archive_comments(datetime.utcnow() + timedelta(seconds=1), session)
+    comments = write_jsonl(
+        tmp_path / "comments.jsonl",
+        [{"content": "답글", "author_id": comment_payload.author_id, "post_id": 1, "parent_id": 1}],
+    )
+
+    # When
+    report = CommentImporter(comments, bind=engine).run()
+
+    # Then
+    assert report.imported == 1
+    with Session(engine) as session:
+        [imported] = session.exec(select(Comment)).all()
+    assert imported.id == 3
+    assert imported.path == Comment.path_segment(1) + Comment.path_segment(3)
+
+
+def test_import_resumes_from_checkpoint(tmp_path, user_payload: UserPayload):
+    # Given
+    client.post("/users/", json=user_payload.dict())
+    posts = write_jsonl(
+        tmp_path / "posts.jsonl",
+        [{"title": f"글 {i}", "content": "내용", "author_id": user_payload.id} for i in range(5)],
+    )
+    prepare = PostImporter.prepare
+    calls = []
+
+    def fail_on_second_chunk(self, chunk, position, connection):
+        calls.append(position)
+        if len(calls) == 2:
+            raise RuntimeError("중간 실패")
+        return prepare(self, chunk, position, connection)
+
+    # When
+    with patch.object(PostImporter, "prepare", fail_on_second_chunk):
+        with pytest.raises(RuntimeError):
+            PostImporter(posts, bind=engine, chunk_size=2).run()
+    with Session(engine) as session:
+        after_failure = len(session.exec(select(Post)).all())
+    report = PostImporter(posts, bind=engine, chunk_size=2).run()
+
+    # Then
+    assert after_failure == 2
+    assert report.resumed_from == 2
+    assert report.imported == 3
+    with Session(engine) as session:
+        assert [post.title for post in session.exec(select(Post).order_by(Post.id))] == [
+            f"글 {i}" for i in range(5)
+        ]
+
+
+def test_import_records_changes_with_each_chunk(tmp_path, user_payload: UserPayload):
+    # Given
+    client.post("/users/", json=user_payload.dict())
+    posts = write_jsonl(
+        tmp_path / "posts.jsonl",
+        [{"title": f"글 {i}", "content": "내용", "author_id": user_payload.id} for i in range(3)],
+    )
+    save_checkpoint = PostImporter.save_checkpoint
+    calls = []
+
+    # 둘째 청크는 행을 넣은 뒤, 커밋하기 전에 실패한다.
+    def fail_on_second_checkpoint(self, connection, position):
+        calls.append(position)
+        if len(calls) == 2:
+            raise RuntimeError("중간 실패")
+        save_checkpoint(self, connection, position)
+
+    # When
+    with patch.object(PostImporter, "save_checkpoint", fail_on_second_checkpoint):
+        with pytest.raises(RuntimeError):
+            PostImporter(posts, bind=engine, chunk_size=2).run()
+    after_failure = post_changes()
+    PostImporter(posts, bind=engine, chunk_size=2).run()
+    changes = client.get("/posts/", params={"since": 0}).json()
+
+    # Then
+    assert after_failure == [(1, False), (2, False)]
+    assert [post["title"] for post in changes["items"]] == [f"글 {i}" for i in range(3)]
+
+
+def test_backup_copies_database_while_writes_continue(tmp_path, post_payload: PostPayload):
+    # Given
+    client.post("/users/", json=UserPayload(id=post_payload.author_id).dict())
+    for _ in range(20):
+        client.post("/posts/", json=post_payload.copy(update={"content": "내용" * 500}).dict())
+    manager = BackupManager(directory=tmp_path, pages=1, pause=0.01, keep=1)
+    manager.begin()
+    backup_thread = threading.Thread(target=manager.run, args=(engine,))
+
+    # When
+    backup_thread.start()
+    write_started = time.perf_counter()
+    created = client.post("/posts/", json=post_payload.dict())
+    write_seconds = time.perf_counter() - write_started
+    backup_thread.join()
+    second = manager.backup(engine)
+
+    # Then
+    assert created.status_code == 201
+    assert write_seconds < 1
+    assert manager.last == second
+    assert second["ok"] and second["integrity"] == ["ok"]
+    assert second["pages"] > 1
+    assert [backup["path"] for backup in manager.files()] == [second["path"]]
+    backup_engine = create_engine(f"sqlite:///{second['path']}")
+    with Session(backup_engine) as session:
+        assert len(session.exec(select(Post)).all()) == 21
+
+
+def test_backup_gives_up_when_writes_keep_restarting_it(tmp_path, post_payload: PostPayload):
+    # Given
+    client.post("/users/", json=UserPayload(id=post_payload.author_id).dict())
+    for _ in range(5):
+        client.post("/posts/", json=post_payload.copy(update={"content": "내용" * 500}).dict())
+    manager = BackupManager(directory=tmp_path, pages=1, pause=0.001, keep=1)
+    pauses = []
+
+    def write_between_steps(seconds):
+        pauses.append(seconds)
+        with engine.begin() as connection:
+            connection.exec_driver_sql("UPDATE post SET title = title || '!' WHERE id = 1")
+
+    # When
+    with patch("backup.BACKUP_MAX_RESTARTS", 2), patch("backup.time.sleep", write_between_steps):
+        report = manager.backup(engine)
+
+    # Then
+    assert report["ok"] is False
+    assert "3번" not in report["error"] and "2번" in report["error"]
+    assert pauses == sorted(pauses) and pauses[-1] == 0.004
+    assert manager.running is False
+    assert manager.files() == []
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_backup_route(tmp_path):
+    # Given
+    admin = UserPayload(id="admin_user", role="admin")
+    client.post("/users/", json=admin.dict())
+    client.post("/users/login", auth=(admin.id, admin.password))
+
+    # When
+    with patch.object(backup_manager, "directory", tmp_path):
+        forbidden = client.post("/admin/backups")
+        started = client.post("/admin/backups", auth=(admin.id, admin.password))
+        finished = client.get("/admin/backups", auth=(admin.id, admin.password))
+        backup_manager.begin()
+        try:
+            conflict = client.post("/admin/backups", auth=(admin.id, admin.password))
+        finally:
+            backup_manager.running = False
+
+    # Then
+    assert forbidden.status_code == 401
+    assert started.status_code == 202
+    assert started.json()["running"] is True
+    assert finished.json()["running"] is False
+    assert finished.json()["last"]["ok"] is True
+    assert len(finished.json()["backups"]) == 1
+    assert conflict.status_code == 409
+
+
+def test_large_content_is_stored_compressed(post_payload: PostPayload):
+    # Given
+    client.post("/users/", json=UserPayload(id=post_payload.author_id).dict())
+    long_content = "FastAPI로 API를 만드는 방법을 알아봅니다. " * 100
+    client.post("/posts/", json=post_payload.copy(update={"content": long_content}).dict())
+    client.post("/posts/", json=post_payload.dict())
+
+    # When
+    with engine.connect() as connection:
+        stored = connection.exec_driver_sql(
+            "SELECT typeof(content), length(content), substr(content, 1, 1) FROM post ORDER BY id"
+        ).all()
+    with patch("column_types.decompress_text", wraps=decompress_text) as decompress:
+        projected = client.get("/posts/", params={"fields": "id,title"})
+        projected_calls = decompress.call_count
+        full = client.get("/posts/1")
+        full_calls = decompress.call_count - projected_calls
+
+    # Then
+    assert stored[0][0] == "blob"
+    assert stored[0][1] < len(long_content.encode()) / 5
+    assert stored[0][2] == ZLIB_HEADER
+    assert stored[1][0] == "text"
+    assert projected.json() == [
+        {"id": 1, "title": post_payload.title},
+        {"id": 2, "title": post_payload.title},
+    ]
+    assert projected_calls == 0
+    assert full_calls > 0
+    assert full.json()["content"] == long_content
+
+
+def test_compress_existing_rows(user_payload: UserPayload):
+    # Given
+    client.post("/users/", json=user_payload.dict())
+    long_content = "압축 전에 저장된 긴 본문 " * 100
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO post (title, content, author_id, created_at, version) "
+            "VALUES ('old', :content, :author_id, '2023-01-01 00:00:00.000000', 1), "
+            "('short', 'short', :author_id, '2023-01-01 00:00:00.000000', 1)",
+            {"content": long_content, "author_id": user_payload.id},
+        )
+    table = Post.__table__  # type: ignore
+
+    # When
+    with engine.connect() as connection:
+        compressed = compress_existing_rows(connection, table, table.c.content)
+        compressed_again = compress_existing_rows(connection, table, table.c.content)
+        stored = connection.exec_driver_sql("SELECT typeof(content) FROM post ORDER BY id").all()
+
+    # Then
+    assert (compressed, compressed_again) == (1, 0)
+    assert [row[0] for row in stored] == ["blob", "text"]
+    with Session(engine) as session:
+        assert [post.content for post in session.exec(select(Post).order_by(Post.id))] == [
+            long_content,
+            "short",
+        ]
+
+
+def test_loop_monitor_attributes_blocking_call_to_request():
+    # Given
+    monitor = LoopMonitor(interval=0.01, threshold=0.05, modules=("test_main.py",))
+
+    def blocking_query():
+        time.sleep(0.2)
+
+    async def blocking_app(scope, receive, send):
+        blocking_query()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def scenario():
+        await monitor.start()
+        await asyncio.sleep(0.05)
+        token = request_id.set("req-1")
+        try:
+            scope = {"type": "http", "method": "GET", "path": "/slow"}
+            await LoopMonitorMiddleware(blocking_app, monitor)(scope, receive_nothing, discard)
+        finally:
+            request_id.reset(token)
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+
+    # When
+    asyncio.run(scenario())
+    report = monitor.report()
+
+    # Then
+    assert report["blocks"] == 1
+    block = report["recent_blocks"][0]
+    assert block["route"] == "GET /slow"
+    assert block["request_id"] == "req-1"
+    assert block["origin"]["test_main.py"].startswith("blocking_query")
+    assert "blocking_app" in block["stack"]
+    assert block["blocked_ms"] >= 150
+    assert report["lag_ms"]["max"] >= 150
+    assert report["lag_ms"]["p50"] < 50
+
+
+def test_loop_monitor_blames_the_running_request_among_concurrent_ones():
+    # Given
+    monitor = LoopMonitor(interval=0.01, threshold=0.05, modules=("test_main.py",))
+
+    async def app(scope, receive, send):
+        if scope["path"] == "/slow":
+            await asyncio.sleep(0.05)
+            time.sleep(0.2)
+        else:
+            await asyncio.sleep(0.4)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def request(path: str, current_id: str):
+        request_id.set(current_id)
+        scope = {"type": "http", "method": "GET", "path": path}
+        await LoopMonitorMiddleware(app, monitor)(scope, receive_nothing, discard)
+
+    async def scenario():
+        await monitor.start()
+        await asyncio.sleep(0.05)
+        slow = asyncio.create_task(request("/slow", "req-slow"))
+        await asyncio.sleep(0.01)
+        idle = asyncio.create_task(request("/idle", "req-idle"))
+        await asyncio.gather(slow, idle)
+        await monitor.stop()
+
+    # When
+    asyncio.run(scenario())
+    report = monitor.report()
+
+    # Then
+    assert report["blocks"] == 1
+    block = report["recent_blocks"][0]
+    assert (block["route"], block["request_id"]) == ("GET /slow", "req-slow")
+    assert monitor._requests == {}
+
+
+def test_read_event_loop_report_requires_admin():
+    # Given
+    admin = UserPayload(id="admin_user", role="admin")
+    client.post("/users/", json=admin.dict())
+    client.post("/users/login", auth=(admin.id, admin.password))
+
+    # When
+    forbidden = client.get("/admin/event-loop")
+    report = client.get("/admin/event-loop", auth=(admin.id, admin.password))
+
+    # Then
+    assert forbidden.status_code == 401
+    assert report.status_code == 200
+    assert {"lag_ms", "blocks", "recent_blocks", "threshold_ms"} <= report.json().keys()
+
+
+def test_activity_rollups_are_maintained_by_writes(
+    user_payload: UserPayload, post_payload: PostPayload, comment_payload: CommentPayload
+):
+    # Given
+    admin = UserPayload(id="admin_user", role="admin")
+    client.post("/users/", json=admin.dict())
+    client.post("/users/login", auth=(admin.id, admin.password))
+    client.post("/users/", json=user_payload.dict())
+    client.post("/posts/", json=post_payload.dict())
+    client.post("/posts/", json=post_payload.dict())
+    client.post("/posts/", json=post_payload.copy(update={"author_id": admin.id}).dict())
+    client.post("/posts/1/comments/", json=comment_payload.dict())
+    client.delete("/posts/2", params={"author": user_payload.id})
+    auth = (admin.id, admin.password)
+
+    # When
+    daily = client.get("/admin/analytics/activity", auth=auth).json()
+    hourly = client.get("/admin/analytics/activity", params={"granularity": "hour"}, auth=auth)
+    top = client.get("/admin/analytics/top-authors", auth=auth).json()
+    with Session(engine) as session:
+        maintained = session.exec(select(ActivityRollup)).all()
+        maintained_authors = session.exec(select(AuthorActivityRollup)).all()
+        rebuild_activity_rollups(session)
+        rebuilt = session.exec(select(ActivityRollup)).all()
+        rebuilt_authors = session.exec(select(AuthorActivityRollup)).all()
+
+    # Then
+    assert len(daily) == 1
+    assert (daily[0]["post_count"], daily[0]["comment_count"]) == (2, 1)
+    assert [(row["post_count"], row["comment_count"]) for row in hourly.json()] == [(2, 1)]
+    assert top == [
+        {"author_id": user_payload.id, "post_count": 1, "comment_count": 1},
+        {"author_id": admin.id, "post_count": 1, "comment_count": 0},
+    ]
+    assert sorted(map(ActivityRollup.dict, maintained), key=str) == sorted(
+        map(ActivityRollup.dict, rebuilt), key=str
+    )
+    assert sorted(map(AuthorActivityRollup.dict, maintained_authors), key=str) == sorted(
+        map(AuthorActivityRollup.dict, rebuilt_authors), key=str
+    )
+
+
+def test_top_authors_subtracts_cumulative_totals():
+    # Given
+    admin = UserPayload(id="admin_user", role="admin")
+    client.post("/users/", json=admin.dict())
+    client.post("/users/login", auth=(admin.id, admin.password))
+    day = datetime(2024, 1, 10, 12)
+    with Session(engine) as session:
+        for offset, author_id, posts, comments in [
+            (0, "alice", 1, 0),
+            (2, "alice", 2, 1),
+            (5, "alice", 1, 0),
+            (3, "bob", 0, 4),
+            (1, "alice", 0, 1),
+            (2, "alice", -1, 0),
+        ]:
+            add_activity(author_id, day + timedelta(days=offset), session, posts, comments)
+        session.commit()
+    statements = []
+
+    def record_statements(conn, cursor, statement, params, *args):
+        statements.append((statement, params))
+
+    def top(start: datetime, end: datetime):
+        params = {"start": start.isoformat(), "end": end.isoformat()}
+        response = client.get(
+            "/admin/analytics/top-authors", params=params, auth=(admin.id, admin.password)
+        )
+        return [
+            (row["author_id"], row["post_count"], row["comment_count"]) for row in response.json()
+        ]
+
+    # When
+    event.listen(engine, "before_cursor_execute", record_statements)
+    try:
+        middle = top(day + timedelta(days=1), day + timedelta(days=4))
+    finally:
+        event.remove(engine, "before_cursor_execute", record_statements)
+    everything = top(day - timedelta(days=30), day + timedelta(days=30))
+    before = top(day - timedelta(days=30), day.replace(hour=0))
+
+    # Then
+    assert middle == [("bob", 0, 4), ("alice", 1, 2)]
+    assert everything == [("alice", 3, 2), ("bob", 0, 4)]
+    assert before == []
+    [(statement, params)] = [
+        (statement, params) for statement, params in statements if "author_activity" in statement
+    ]
+    with engine.connect() as connection:
+        plan = [
+            row[-1]
+            for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", params)
+        ]
+    assert not [step for step in plan if step.startswith("SCAN author_activity_rollup")]
+
+
+def test_activity_rollups_invalid_range():
+    # Given
+    admin = UserPayload(id="admin_user", role="admin")
+    client.post("/users/", json=admin.dict())
+    client.post("/users/login", auth=(admin.id, admin.password))
+    auth = (admin.id, admin.password)
+
+    # When
+    forbidden = client.get("/admin/analytics/top-authors")
+    reversed_range = client.get(
+        "/admin/analytics/activity",
+        params={"start": "2024-02-01T00:00:00", "end": "2024-01-01T00:00:00"},
+        auth=auth,
+    )
+    too_many_hours = client.get(
+        "/admin/analytics/activity",
+        params={"granularity": "hour", "start": "2020-01-01T00:00:00"},
+        auth=auth,
+    )
+
+    # Then
+    assert forbidden.status_code == 401
+    assert reversed_range.status_code == 422
+    assert too_many_hours.status_code == 422
+
+
+def test_search_users_by_nickname_prefix():
+    # Given
+    for id, nickname in [("u1", "개발자"), ("u2", "개발왕"), ("u3", "디자이너"), ("u4", "개발")]:
+        client.post("/users/", json=UserPayload(id=id, nickname=nickname).dict())
+
+    # When
+    cold = client.get("/users/search", params={"prefix": "개발", "limit": 2})
+    with Session(engine) as session:
+        warm_nickname_index(session)
+    warm = client.get("/users/search", params={"prefix": "개발", "limit": 2})
+    client.put("/users/u2", json={"password": UserPayload().password, "nickname": "디자인왕"})
+    client.delete("/users/u4", params={"password": UserPayload().password})
+    client.post("/users/", json=UserPayload(id="u5", nickname="개발초보").dict())
+    updated = client.get("/users/search", params={"prefix": "개발"})
+    empty_prefix = client.get("/users/search", params={"prefix": ""})
+
+    # Then
+    assert cold.json() == [{"id": "u4", "nickname": "개발"}, {"id": "u2", "nickname": "개발왕"}]
+    assert warm.json() == cold.json()
+    assert [user["id"] for user in updated.json()] == ["u1", "u5"]
+    assert [user["id"] for user in client.get("/users/search?prefix=디자").json()] == ["u3", "u2"]
+    assert empty_prefix.status_code == 422
+
+
+def test_read_posts_since_cursor(post_payload: PostPayload):
+    # Given
+    client.post("/users/", json=UserPayload(id=post_payload.author_id).dict())
+    client.post("/posts/", json=post_payload.dict())
+    client.post("/posts/", json=post_payload.dict())
+    listed = client.get("/posts/")
+    cursor = int(listed.headers["x-sync-cursor"])
+
+    # When
+    client.put("/posts/2", json=post_payload.copy(update={"title": "Updated"}).dict())
+    client.delete("/posts/1", params={"author": post_payload.author_id})
+    client.post("/posts/", json=post_payload.dict())
+    changes = client.get("/posts/", params={"since": cursor}).json()
+    no_changes = client.get("/posts/", params={"since": changes["cursor"]}).json()
+
+    # Then
+    assert cursor == 2
+    assert [(post["id"], post["title"]) for post in changes["items"]] == [
+        (2, "Updated"),
+        (3, post_payload.title),
+    ]
+    assert changes["deleted"] == [1]
+    assert changes["has_more"] is False
+    assert no_changes == {
+        "items": [],
+        "deleted": [],
+        "cursor": changes["cursor"],
+        "has_more": False,
+    }
+
+
+def test_read_post_comments_since_cursor(
+    post_payload: PostPayload, comment_payload: CommentPayload
+):
+    # Given
+    client.post("/users/", json=UserPayload(id=post_payload.author_id).dict())
+    client.post("/posts/", json=post_payload.dict())
+    client.post("/posts/", json=post_payload.dict())
+    for post_id in (1, 2, 1):
+        client.post(f"/posts/{post_id}/comments/", json=comment_payload.dict())
+    client.delete("/posts/1/comments/1", params={"author": post_payload.author_id})
+
+    # When
+    first = client.get("/posts/1/comments/", params={"since": 0, "limit": 1}).json()
+    rest = client.get("/posts/1/comments/", params={"since": first["cursor"]}).json()
+
+    # Then
+    assert (first["items"], first["deleted"], first["has_more"]) == ([], [1], True)
+    assert [comment["id"] for comment in rest["items"]] == [3]
+    assert (rest["deleted"], rest["has_more"]) == ([1], False)
+
+
+def test_read_posts_since_expired_cursor(post_payload: PostPayload):
+    # Given
+    client.post("/users/", json=UserPayload(id=post_payload.author_id).dict())
+    for _ in range(3):
+        client.post("/posts/", json=post_payload.dict())
+    with Session(engine) as session:
+        pruned = prune_change_log(datetime.utcnow() + timedelta(seconds=1), session)
+
+    # When
+    expired = client.get("/posts/", params={"since": 0})
+    latest = client.get("/posts/", params={"since": 2})
+
+    # Then
+    assert pruned == 2
+    assert expired.status_code == 410
+    assert [post["id"] for post in latest.json()["items"]] == [3]
@@ -0,0 +1,119 @@
+import heapq
+import math
+import time
+from typing import Dict, Iterable, List, Set, Tuple
+
+TRENDING_SIZE = 100
+HALF_LIFE = 6 * 60 * 60
+SNAPSHOT_INTERVAL = 5 * 60
+MIN_SCORE = 1e-6
+# 기준 시각에서 이만큼 멀어지면 exp 오버플로를 막기 위해 점수를 현재 시각 기준으로 다시 맞춘다.
+MAX_EXPONENT = 50.0
+
+
+class TrendingIndex:
+    """
+    댓글 활동을 시간에 따라 감쇠시킨 점수로 게시글 순위를 유지한다.
+    - 점수는 기준 시각(reference)으로 정규화해 저장하므로, 시간이 흘러도 전체를 다시 계산하지 않는다.
+      (score = Σ exp(rate * (댓글 시각 - reference)))
+    - 해시 인덱스(_scores)는 모든 게시글의 점수를, 최소 힙(_top)은 상위 K개만 보관한다.
+    """
+
+    def __init__(self, size: int = TRENDING_SIZE, half_life: float = HALF_LIFE):
+        self.size = size
+        self.half_life = half_life
+        self.rate = math.log(2) / half_life
+        self.reference = time.time()
+        self._scores: Dict[int, float] = {}
+        self._top: List[Tuple[float, int]] = []
+        self._top_ids: Set[int] = set()
+        self._stale = False
+
+    def weight(self, timestamp: float) -> float:
+        return math.exp(self.rate * (timestamp - self.reference))
+
+    def add(self, post_id: int, timestamp: float, count: int = 1) -> None:
+        self._rebase(max(timestamp, time.time()))
+        score = self._scores.get(post_id, 0.0) + count * self.weight(timestamp)
+        if score <= MIN_SCORE:
+            self.remove_post(post_id)
+            return
+        self._scores[post_id] = score
+        self._update_top(post_id, score, decreased=count < 0)
+
+    def remove_post(self, post_id: int) -> None:
+        self._scores.pop(post_id, None)
+        if post_id in self._top_ids:
+            self._stale = True
+
+    def top(self, limit: int) -> List[Tuple[int, float]]:
+        if self._stale:
+            self._rebuild()
+        decay = math.exp(-self.rate * (time.time() - self.reference))
+        ranked = sorted(self._top, reverse=True)[:limit]
+        return [(post_id, score * decay) for score, post_id in ranked]
+
+    def snapshot(self) -> Tuple[float, Dict[int, float]]:
+        """현재 시각과, 그 시각 기준으로 감쇠된 점수를 돌려준다."""
+        now = time.time()
+        decay = math.exp(-self.rate * (now - self.reference))
+        return now, {post_id: score * decay for post_id, score in self._scores.items()}
+
+    def load(self, taken_at: float, scores: Dict[int, float]) -> None:
+        weight = self.weight(taken_at)
+        self._scores = {post_id: score * weight for post_id, score in scores.items()}
+        self._rebuild()
+
+    def extend(self, events: Iterable[Tuple[int, float]]) -> None:
+        for post_id, timestamp in events:
+            self._scores[post_id] = self._scores.get(post_id, 0.0) + self.weight(timestamp)
+        self._rebuild()
+
+    def clear(self) -> None:
+        self.reference = time.time()
+        self._scores.clear()
+        self._rebuild()
+
+    def _update_top(self, post_id: int, score: float, decreased: bool) -> None:
+        if post_id in self._top_ids:
+            for index, (_, member_id) in enumerate(self._top):
+                if member_id == post_id:
+                    self._top[index] = (score, post_id)
+                    break
+            heapq.heapify(self._top)
+            # 상위 K개 안의 점수가 줄면 밖에 있던 게시글이 더 높아졌을 수 있다.
+            self._stale = self._stale or decreased
+        elif len(self._top) < self.size:
+            heapq.heappush(self._top, (score, post_id))
+            self._top_ids.add(post_id)
+        elif score > self._top[0][0]:
+            _, evicted = heapq.heapreplace(self._top, (score, post_id))
+            self._top_ids.discard(evicted)
+            self._top_ids.add(post_id)
+
+    def _rebuild(self) -> None:
+        self._top = [
+            (score, post_id)
+            for post_id, score in heapq.nlargest(
+                self.size, self._scores.items(), key=lambda item: item[1]
+            )
+        ]
+        heapq.heapify(self._top)
+        self._top_ids = {post_id for _, post_id in self._top}
+        self._stale = False
+
+    def _rebase(self, now: float) -> None:
+        exponent = self.rate * (now - self.reference)
+        if exponent < MAX_EXPONENT:
+            return
+        decay = math.exp(-exponent)
+        self.reference = now
+        self._scores = {
+            post_id: score * decay
+            for post_id, score in self._scores.items()
+            if score * decay > MIN_SCORE
+        }
+        self._rebuild()
+
+
+trending_index = TrendingIndex()